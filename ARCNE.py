@@ -1,626 +1,2114 @@
-import json
-import os
-import re
-import zipfile
-import rarfile
-import shutil
-import tarfile
-import tkinter as tk
-from tkinter import messagebox, ttk
-from tkinter import filedialog
-from tkinter import simpledialog
-from ttkthemes import ThemedTk
-from collections import defaultdict
-
-
-class ArchiStackApp(ThemedTk):
-    def __init__(self):
-        super().__init__()
-        self.title('ArchiStack')
-        self.minsize(800, 600)
-        self.load_theme()
-        self.set_theme(self.default_theme)
-
-        self.create_widgets()
-
-    def create_widgets(self):
-        self.mod_organizer_frame = ModOrganizerFrame(self)
-        self.mod_organizer_frame.grid(
-            column=0, row=0, columnspan=2, padx=5, pady=5, sticky="nsew")
-
-        # Add mod name label and entry
-        mod_label = ttk.Label(self, text="Mod Name:")
-        mod_label.grid(column=0, row=1, padx=5, pady=5, sticky="w")
-
-        self.mod_entry = ttk.Entry(self)
-        self.mod_entry.grid(column=1, row=1, padx=5, pady=5, sticky="ew")
-
-        # Create a combobox for mod categories
-        categories_label = ttk.Label(self, text="Category:")
-        categories_label.grid(column=0, row=2, padx=5, pady=5, sticky="w")
-
-        self.categories = ["Animals", "Anime and Video Games", "Celebrity Sims", "Character Sims", "Child Related", "Create-A-Sim Content", "Crime, Punishment, and Public Service", "Decorating Themes", "Cemeteries/Death",
-                           "Dining, Retail, Parks and Pools", "EA Match", "Fantasy/Sci-Fi", "Food", "Game Mods and Hacks", "Historical and Ethnic", "Holidays", "Medical", "Sims 4 Pose Database", "Religious", "Weddings and Marriage", "Work & School"]
-        self.selected_category = tk.StringVar()
-        self.category_combobox = ttk.Combobox(
-            self, textvariable=self.selected_category, values=self.categories)
-        self.category_combobox.grid(
-            column=1, row=2, padx=5, pady=5, sticky="ew")
-
-        # Add the extract archive button
-        self.extract_button = ttk.Button(
-            self, text="Extract Archive", command=self.extract_archive_dialog)
-        self.extract_button.grid(
-            column=0, row=3, padx=5, pady=5, sticky="ew")
-
-        self.grid_rowconfigure(0, weight=1)
-        self.grid_columnconfigure(0, weight=1)
-        self.grid_columnconfigure(1, weight=1)
-
-        # Add button for user-defined categories
-        self.add_category_button = ttk.Button(
-            self, text="Add Categories", command=self.add_user_defined_categories
-        )
-        self.add_category_button.grid(
-            column=1, row=3, padx=5, pady=5, sticky="ew")
-
-    def create_menu(self):
-        self.menu_bar = tk.Menu(self)
-        self.config(menu=self.menu_bar)
-
-        self.settings_menu = tk.Menu(self.menu_bar, tearoff=0)
-        self.settings_menu.add_command(
-            label="Change Theme", command=self.show_settings)
-        self.menu_bar.add_cascade(label="Settings", menu=self.settings_menu)
-
-    def show_settings(self):
-        settings_window = tk.Toplevel(self)
-        settings_window.title("Settings")
-        settings_window.geometry("300x200")
-
-        theme_frame = ttk.Frame(settings_window)
-        theme_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
-
-        theme_label = ttk.Label(theme_frame, text="Select a theme:")
-        theme_label.pack(side=tk.TOP, pady=(0, 10))
-
-        self.create_theme_listbox(theme_frame)
-
-        apply_theme_button = ttk.Button(
-            theme_frame, text="Apply",
-            command=lambda: self.change_theme(
-                self.theme_listbox.get(self.theme_listbox.curselection()))
-        )
-        apply_theme_button.pack(side=tk.BOTTOM, pady=(10, 0))
-
-    def create_theme_listbox(self, parent):
-        self.theme_listbox = tk.Listbox(parent)
-        self.theme_listbox.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-
-        self.theme_listbox.bind('<<ListboxSelect>>', self.on_theme_selected)
-
-        for theme in sorted(self.get_themes()):
-            self.theme_listbox.insert(tk.END, theme)
-
-        current_theme_index = self.theme_listbox.get(
-            0, tk.END).index(self.default_theme)
-        self.theme_listbox.selection_set(current_theme_index)
-
-    def on_theme_selected(self, event):
-        selected_theme = self.theme_listbox.get(
-            self.theme_listbox.curselection())
-        self.change_theme(selected_theme)
-
-    def change_theme(self, selected_theme):
-        if selected_theme and selected_theme in self.get_themes():
-            self.set_theme(selected_theme)
-            self.default_theme = selected_theme
-            self.save_theme(selected_theme)
-        else:
-            messagebox.showerror("Error", "Invalid theme selected.")
-
-    def load_theme(self):
-        config_file = 'config.json'
-        if os.path.exists(config_file):
-            with open(config_file, 'r') as file:
-                config = json.load(file)
-                self.default_theme = config.get('theme', 'arc')
-        else:
-            self.default_theme = 'arc'
-
-    def save_theme(self, theme):
-        config_file = 'config.json'
-        config = {'theme': theme}
-        with open(config_file, 'w') as file:
-            json.dump(config, file)
-
-    def extract_archive_dialog(self):
-        if archive_path := filedialog.askopenfilename(
-            title="Select Archive",
-            filetypes=[
-                ("Archives", "*.zip *.rar *.tar *.gz *.bz2"),
-                ("All Files", "*.*"),
-            ],
-        ):
-            if destination_path := filedialog.askdirectory(
-                title="Select Destination Folder"
-            ):
-                self.extract_archive(archive_path, destination_path)
-
-    def extract_archive(self, archive_path, destination_path):
-        if not os.path.exists(destination_path):
-            os.makedirs(destination_path)
-        extracted_path = os.path.join(
-            destination_path, "temp_extraction_folder")
-        os.makedirs(extracted_path)
-        archive_extension = os.path.splitext(archive_path)[1]
-
-        if archive_extension == '.zip':
-            with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-                zip_ref.extractall(destination_path)
-        elif archive_extension == '.rar':
-            with rarfile.RarFile(archive_path, 'r') as rar_ref:
-                rar_ref.extractall(destination_path)
-        elif archive_extension == '.tar':
-            with tarfile.open(archive_path, 'r') as tar_ref:
-                tar_ref.extractall(destination_path)
-        elif archive_extension in ['.gz', '.bz2']:
-            compression = 'gz' if archive_extension == '.gz' else 'bz2'
-            with tarfile.open(archive_path, f'r|{compression}') as tar_ref:
-                tar_ref.extractall(destination_path)
-        else:
-            raise ValueError(
-                f"Unsupported archive format: {archive_extension}")
-        categorized_files = self.categorize_files(extracted_path)
-
-        for category, files in categorized_files.items():
-            category_folder = os.path.join(destination_path, category)
-            os.makedirs(category_folder, exist_ok=True)
-
-            for file in files:
-                file_name = os.path.basename(file)
-                shutil.move(file, os.path.join(category_folder, file_name))
-
-        shutil.rmtree(extracted_path)
-
-    def add_user_defined_categories(self):
-        if user_defined_categories := simpledialog.askstring(
-            "Add Categories", "Enter new categories separated by commas:"
-        ):
-            new_categories = [category.strip()
-                              for category in user_defined_categories.split(",")]
-            self.categories.extend(new_categories)
-            self.category_combobox["values"] = self.categories
-
-    def categorize_files(self, extracted_path):
-        categorized_files = defaultdict(list)
-
-        for root, _, files in os.walk(extracted_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                category = self.identify_file_category(file)
-                categorized_files[category].append(file_path)
-
-        return categorized_files
-
-    def identify_file_category(self, file_name):
-
-        file_name = file_name.lower()
-
-        # File extension-based categories
-        extension_map = {
-            ".package": "Package Mods",
-            ".sims3pack": "Sims3Pack Mods",
-            ".sim": "Sim Characters",
-            ".blueprint": "Blueprints",
-            ".bak": "Backup Files",
-        }
-
-        file_extension = os.path.splitext(file_name)[1]
-        if category := extension_map.get(file_extension):
-            return category
-
-        # Pattern-based categories
-        pattern_map = {
-            "cas": "Create-A-Sim",
-            "clothing": "Clothing",
-            "hair": "Hair",
-            "acc": "Accessories",
-            "makeup": "Makeup",
-            "build": "Build Mode",
-            "buy": "Buy Mode",
-            "script": "Script Mods",
-        }
-
-        return next(
-            (
-                category
-                for pattern, category in pattern_map.items()
-                if pattern in file_name
-            ),
-            "Unknown",
-        )
-
-
-class ModOrganizerFrame(ttk.Frame):
-    """A frame for managing mods and custom content in the application."""
-
-    def __init__(self, parent):
-        super().__init__(parent)
-        self.parent = parent
-        self.columnconfigure(0, weight=1)
-        self.rowconfigure(1, weight=1)
-
-        self.mod_tags = {}
-
-        self.create_widgets()
-
-    def create_widgets(self):
-        """Create and configure the necessary widgets."""
-        self.create_mods_label()
-        self.create_treeview()
-        self.create_scrollbar()
-        self.create_search_bar()
-        self.create_entry_box()  # added new method to create the mod_entry widget
-        self.create_buttons()
-
-    def create_entry_box(self):
-        """Create the entry box for adding new mods."""
-        self.mod_entry_label = ttk.Label(
-            self, text="Add a new mod or custom content:")
-        self.mod_entry_label.grid(
-            row=2, column=0, padx=10, pady=10, sticky=tk.W)
-
-        self.mod_entry = ttk.Entry(self)
-        self.mod_entry.grid(row=2, column=1, padx=10, pady=10, sticky=tk.W)
-
-        self.mod_category_label = ttk.Label(self, text="Category:")
-        self.mod_category_label.grid(
-            row=2, column=2, padx=(20, 0), pady=10, sticky=tk.W)
-
-        self.category_options = ["CAS", "Build/Buy", "Gameplay", "Other"]
-        self.selected_category = tk.StringVar(value=self.category_options[0])
-        self.category_menu = ttk.OptionMenu(
-            self, self.selected_category, *self.category_options)
-        self.category_menu.grid(row=2, column=3, pady=10, sticky=tk.W)
-
-    def create_mods_label(self):
-        """Create the mods label."""
-        self.mods_label = ttk.Label(self, text="Mods and Custom Content")
-        self.mods_label.grid(row=0, column=0, padx=10,
-                             pady=(10, 0), sticky=tk.W)
-
-    def mod_exists(self, mod_name):
-        """Check if a mod with the given name already exists in the treeview."""
-        return any(
-            self.treeview.item(item, "values")[0] == mod_name
-            for item in self.treeview.get_children()
-        )
-
-    def create_treeview(self):
-        self.treeview = ttk.Treeview(self, columns=(
-            'Name', 'Category', 'Tags', 'Source'), show='headings', selectmode="extended")
-        self.treeview.heading("#0", text="Mod Name")
-        self.treeview.heading('Name', text='Name')
-        self.treeview.heading('Category', text='Category')
-        self.treeview.heading('Tags', text='Tags')
-        self.treeview.heading('Source', text='Source')
-        self.treeview.grid(row=1, column=0, padx=10,
-                           pady=(5, 10), sticky=tk.NSEW)
-        self.treeview.bind('<Up>', self.navigate_treeview)
-        self.treeview.bind('<Down>', self.navigate_treeview)
-        self.treeview.grid(row=1, column=0, padx=10, pady=(
-            5, 10), sticky=tk.W+tk.E+tk.N+tk.S)
-        self.bind_treeview_sort()
-
-    def create_scrollbar(self):
-        self.scrollbar = ttk.Scrollbar(
-            self, orient='vertical', command=self.treeview.yview)
-        self.scrollbar.grid(row=1, column=1, pady=(5, 10), sticky=tk.NS)
-        self.treeview.configure(yscrollcommand=self.scrollbar.set)
-
-    def create_search_bar(self):
-        self.search_label = ttk.Label(self, text="Search:")
-        self.search_label.grid(
-            row=0, column=1, sticky=tk.E, padx=(50, 0), pady=(10, 0))
-
-        self.search_var = tk.StringVar()
-        self.search_var.trace_add("write", self.update_search)
-        self.search_entry = ttk.Entry(self, textvariable=self.search_var)
-        self.search_entry.grid(row=0, column=2, padx=10, pady=(10, 0))
-
-    def create_buttons(self):
-        self.button_frame = ttk.Frame(self)
-
-        self.add_button = self.create_button(
-            'Add', self.add_mod, 0, "Add a new mod or custom content.")
-        self.edit_button = self.create_button(
-            'Edit', self.edit_mod, 1, "Edit the selected mod or custom content.")
-        self.remove_button = self.create_button(
-            'Remove', self.remove_mod, 2, "Remove the selected mod or custom content.")
-        self.manage_tags_button = self.create_button(
-            'Manage Tags', self.manage_tags, 3, "Manage tags for mods and custom content.")
-        self.save_mods_button = self.create_button(
-            'Save Mods', self.save_mods, 4, "Save the current list of mods and custom content.")
-        self.load_mods_button = self.create_button(
-            'Load Mods', self.load_mods, 5, "Load a saved list of mods and custom content.")
-
-        self.button_frame.grid(row=2, column=0, columnspan=2,
-                               padx=10, pady=10, sticky=tk.W)
-
-        self.add_button.config(command=self.add_mod)
-        self.edit_button.config(command=self.edit_mod)
-        self.remove_button.config(command=self.remove_mod)
-        self.manage_tags_button.config(command=self.manage_tags)
-        self.save_mods_button.config(command=self.save_mods)
-        self.load_mods_button.config(command=self.load_mods)
-
-    def create_button(self, text, command, column, tooltip_text):
-        button = ttk.Button(self.button_frame, text=text,
-                            command=command, width=10)
-        button.grid(row=0, column=column, padx=(0 if column == 0 else 5, 5))
-        self.create_tooltip(button, tooltip_text)
-        return button
-
-    def create_tooltip(self, widget, text):
-        tooltip = ToolTip(widget, text)
-        widget.bind('<Enter>', tooltip.show)
-        widget.bind('<Leave>', tooltip.hide)
-
-    def navigate_treeview(self, event):
-        """Navigate the treeview using arrow keys."""
-        key = event.keysym
-        if cur_item := self.treeview.focus():
-            cur_index = self.treeview.index(cur_item)
-            new_index = None
-
-            if key == 'Up' and cur_index > 0:
-                new_index = cur_index - 1
-            elif key == 'Down':
-                new_index = cur_index + 1
-
-            if new_index is not None:
-                items = self.treeview.get_children()
-                if 0 <= new_index < len(items):
-                    self.treeview.selection_set(items[new_index])
-                    self.treeview.focus(items[new_index])
-
-    def update_search(self, *args):
-        search_term = self.search_var.get().lower()
-        self._extracted_from_filter_treeview_items_3(search_term)
-
-    def filter_treeview_items(self, search_term):
-        self._extracted_from_filter_treeview_items_3(search_term)
-
-    # TODO Rename this here and in `update_search` and `filter_treeview_items`
-    def _extracted_from_filter_treeview_items_3(self, search_term):
-        for item in self.treeview.get_children():
-            mod_name = self.treeview.item(item)["values"][0].lower()
-            mod_category = self.treeview.item(item)["values"][1].lower()
-            mod_tags = ' '.join(self.mod_tags.get(mod_name, [])).lower()
-            if (
-                search_term in mod_name
-                or search_term in mod_category
-                or search_term in mod_tags
-            ):
-                self.treeview.item(item, tags=("matched", ))
-            else:
-                self.treeview.item(item, tags=("not_matched", ))
-        self.treeview.tag_configure("matched", background=None)
-        self.treeview.tag_configure("not_matched", background="gray")
-
-    def sort_treeview(self, column):
-        """Sort the treeview by the selected column."""
-
-        # Get the current sort order and reverse it
-        current_sort = self.treeview.heading(column, "option", "sortorder")
-        new_sort = "ascending" if current_sort == "descending" else "descending"
-
-        # Get the current treeview items
-        items = [(self.treeview.set(child, column), child)
-                 for child in self.treeview.get_children('')]
-
-        # Sort the items based on the new sort order
-        items.sort(reverse=current_sort == "ascending",
-                   key=lambda x: x[0].lower() if isinstance(x[0], str) else x[0])
-
-        # Rearrange the items in the treeview
-        for index, (_, child) in enumerate(items):
-            self.treeview.move(child, '', index)
-
-        # Update the sort order for the column
-        self.treeview.heading(column, sortorder=new_sort)
-
-    # Bind the treeview column headers to the sorting function
-    def bind_treeview_sort(self):
-        for col in self.treeview["columns"]:
-            self.treeview.heading(
-                col, text=col, command=lambda c=col: self.sort_treeview(c))
-
-    def add_mod(self):
-        # Add mod(s) to the treeview
-        mod_files = filedialog.askopenfilenames(
-            initialdir="/", title="Select mod files", filetypes=[("Package files", "*.package")])
-
-        for mod_file in mod_files:
-            mod_name = os.path.basename(mod_file)
-
-            # Automatically categorize the mod file based on its name
-            category = self.detect_category(mod_name)
-
-            if mod_name and not self.mod_exists(mod_name):
-                self.treeview.insert(
-                    '', 'end', values=(mod_name, category))
-                self.mod_tags[mod_name] = []
-
-    def detect_category(self, mod_name):
-        """Detect the category of the mod based on the file name."""
-        category_regexes = {
-            "CAS": r"cas|create a sim|sim customization|sim creation|sim appearance",
-            "Build/Buy": r"build|buy|build and buy|furniture|decor",
-            "Gameplay": r"gameplay|gameplay changes|gameplay tweaks|gameplay mods|gameplay adjustments",
-            "Other": r"other|miscellaneous|uncategorized|unknown"
-        }
-
-        return next(
-            (
-                category
-                for category, regex in category_regexes.items()
-                if re.search(regex, mod_name, re.IGNORECASE)
-            ),
-            "Other",
-        )
-
-    def get_mod_source(self, mod_name):
-        mod_name_lower = mod_name.lower()
-        if "maxismatch" in mod_name_lower:
-            return "MaxisMatch"
-        elif "alpha" in mod_name_lower:
-            return "Alpha"
-        else:
-            return "Unknown"
-
-    def remove_mod(self):
-        if selected_items := self.treeview.selection():
-            for item in selected_items:
-                self.treeview.delete(item)
-
-    def manage_tags(self):
-        selected_items = self.treeview.selection()
-
-        if not selected_items:
-            messagebox.showerror(
-                "Error", "Please select a mod to manage tags.")
-            return
-
-        manage_tags_window = tk.Toplevel(self.parent)
-        manage_tags_window.title("Manage Tags")
-        manage_tags_window.geometry("300x300")
-
-        tags_frame = ttk.Frame(manage_tags_window)
-        tags_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        tags_label = ttk.Label(tags_frame, text="Custom Tags:")
-        tags_label.pack(side=tk.TOP)
-
-        tags_listbox = tk.Listbox(tags_frame, selectmode=tk.MULTIPLE)
-        tags_listbox.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-
-        # Load tags for the selected mod(s)
-        tags_to_load = set()
-        for item in selected_items:
-            mod_name = self.treeview.item(item)["values"][0]
-            mod_tags = self.mod_tags.get(mod_name, [])
-            tags_to_load.update(mod_tags)
-        for tag in tags_to_load:
-            tags_listbox.insert(tk.END, tag)
-
-        add_tag_button = ttk.Button(
-            tags_frame, text="Add Tag", command=lambda: self.add_tag(tags_listbox))
-        add_tag_button.pack(side=tk.LEFT, padx=5, pady=10)
-        remove_tag_button = ttk.Button(
-            tags_frame, text="Remove Tag", command=lambda: self.remove_tag(tags_listbox))
-        remove_tag_button.pack(side=tk.LEFT, padx=5, pady=10)
-
-        # Update the tags of the selected mod(s) when the window is closed
-        def on_close():
-            new_tags = tags_listbox.get(0, tk.END)
-            for item in selected_items:
-                mod_name = self.treeview.item(item)["values"][0]
-                self.mod_tags[mod_name] = list(new_tags)
-            manage_tags_window.destroy()
-
-        manage_tags_window.protocol("WM_DELETE_WINDOW", on_close)
-
-    def add_tag(self, tags_listbox):
-        # Add a tag to the listbox
-        new_tag = simpledialog.askstring("Add Tag", "Enter the new tag:")
-        if new_tag and new_tag not in tags_listbox.get(0, tk.END):
-            tags_listbox.insert(tk.END, new_tag)
-
-    def remove_tag(self, tags_listbox):
-        if selected_tag := tags_listbox.curselection():
-            tags_listbox.delete(selected_tag)
-
-    def save_mods(self):
-        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[
-                                                ("JSON files", "*.json")], title="Save Mods")
-        if file_path:
-            mods_to_save = [{"name": self.treeview.item(item)["values"][0],
-                            "category": self.treeview.item(item)["values"][1],
-                             "tags": self.treeview.item(item)["values"][2],
-                             "source": self.treeview.item(item)["values"][3]} for item in self.treeview.get_children()]
-        with open(file_path, "w") as file:
-            json.dump(mods_to_save, file)
-
-    def load_mods(self):
-        if file_path := filedialog.askopenfilename(
-            defaultextension=".json",
-            filetypes=[("JSON files", "*.json")],
-            title="Load Mods",
-        ):
-            with open(file_path, "r") as file:
-                mods_to_load = json.load(file)
-            self.treeview.delete(*self.treeview.get_children())
-            for mod in mods_to_load:
-                self.treeview.insert('', 'end', values=(
-                    mod["name"], mod["category"], mod["tags"], mod["source"]))
-
-    def edit_mod(self):
-        if not (selected_items := self.treeview.selection()):
-            return
-        for item in selected_items:
-            old_mod_name = self.treeview.item(item)["values"][0]
-            old_mod_category = self.treeview.item(item)["values"][1]
-            old_mod_tags = self.treeview.item(item)["values"][2] if len(
-                self.treeview.item(item)["values"]) >= 3 else ""
-            old_mod_source = self.treeview.item(item)["values"][3] if len(
-                self.treeview.item(item)["values"]) >= 4 else ""
-
-            new_mod_name = simpledialog.askstring(
-                "Edit Mod Name", "Enter the new mod name:", initialvalue=old_mod_name)
-            new_mod_category = simpledialog.askstring(
-                "Edit Mod Category", "Enter the new mod category:", initialvalue=old_mod_category)
-            new_mod_tags = simpledialog.askstring(
-                "Edit Mod Tags", "Enter the new mod tags (comma-separated):", initialvalue=old_mod_tags)
-            new_mod_source = simpledialog.askstring(
-                "Edit Mod Source", "Enter the new mod source:", initialvalue=old_mod_source)
-
-            if new_mod_name and new_mod_category and new_mod_tags and new_mod_source:
-                self.treeview.item(item, values=(
-                    new_mod_name, new_mod_category, new_mod_tags, new_mod_source))
-                if old_mod_name in self.mod_tags:
-                    self.mod_tags[new_mod_name] = self.mod_tags.pop(
-                        old_mod_name)
-
-
-class ToolTip:
-    def __init__(self, widget, text):
-        self.widget = widget
-        self.text = text
-        self.tooltip_window = None
-
-    def show(self, event):
-        """Show the tooltip."""
-        x, y, _, _ = self.widget.bbox("insert")
-        x += self.widget.winfo_rootx() + 25
-        y += self.widget.winfo_rooty() + 25
-
-        self.tooltip_window = tk.Toplevel(self.widget)
-        self.tooltip_window.wm_overrideredirect(True)
-        self.tooltip_window.wm_geometry(f"+{x}+{y}")
-
-        label = ttk.Label(self.tooltip_window, text=self.text,
-                          background="#ffffe0", relief="solid", borderwidth=1)
-        label.pack()
-
-    def hide(self, event):
-        """Hide the tooltip."""
-        if self.tooltip_window:
-            self.tooltip_window.destroy()
-            self.tooltip_window = None
-
-
-if __name__ == "__main__":
-    app = ArchiStackApp()
-    app.mainloop()
+import base64
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import tkinter as tk
+from tkinter import messagebox, ttk
+from tkinter import filedialog
+from tkinter import simpledialog
+from ttkthemes import ThemedTk
+
+from archistack_engine import (
+    ARCHIVE_EXTENSIONS, AUTOSAVE_CHECK_MS, BulkEditor, CONFLICT_CACHE_FILE,
+    ConflictDetector, ExtractionManager, FolderWatcher, HASH_INDEX_FILE, HashIndex,
+    LIBRARY_SNAPSHOT_FILE, LIBRARY_STORE_EXTENSION, LibraryJournal, LibraryScanner,
+    LibraryStore, MERGE_MANIFEST_SUFFIX, MOD_CLASSIFIER, ModLibrary, PREVIEW_THUMBNAIL_SIZE,
+    PROFILER, PackageMerger, PreviewCache, PreviewLoader, RULE_CACHE_FILE, RULES_FILE, RuleSet,
+    categorize_files, detect_category, extract_archive, find_archives, format_resource_key,
+    format_size, identify_file_category, inspect_archive, load_json_library, parse_tags,
+    profiled, save_json_library, sort_record_ids,
+)
+
+TRACE_ENV_VAR = 'ARCHISTACK_TRACE'
+
+
+class ArchiStackApp(ThemedTk):
+    def __init__(self):
+        super().__init__()
+        self.title('ArchiStack')
+        self.minsize(800, 600)
+        self.load_theme()
+        self.set_theme(self.default_theme)
+
+        self.hash_index = HashIndex(HASH_INDEX_FILE)
+        self.hash_index.load()
+        self.extraction_manager = ExtractionManager(
+            self.extract_archive, hash_index=self.hash_index)
+        self.extraction_window = None
+        self.polling_extractions = False
+
+        self.performance_window = None
+        self.trace_path = os.environ.get(TRACE_ENV_VAR)
+        if self.trace_path:
+            PROFILER.enable(trace=True)
+
+        self.create_widgets()
+        self.create_menu()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        self.mod_organizer_frame.shutdown()
+        self.extraction_manager.shutdown()
+        self.hash_index.save()
+        if self.trace_path:
+            PROFILER.dump_trace(self.trace_path)
+        self.destroy()
+
+    def create_widgets(self):
+        self.mod_organizer_frame = ModOrganizerFrame(
+            self, hash_index=self.hash_index)
+        self.mod_organizer_frame.grid(
+            column=0, row=0, columnspan=2, padx=5, pady=5, sticky="nsew")
+
+        # Add mod name label and entry
+        mod_label = ttk.Label(self, text="Mod Name:")
+        mod_label.grid(column=0, row=1, padx=5, pady=5, sticky="w")
+
+        self.mod_entry = ttk.Entry(self)
+        self.mod_entry.grid(column=1, row=1, padx=5, pady=5, sticky="ew")
+
+        # Create a combobox for mod categories
+        categories_label = ttk.Label(self, text="Category:")
+        categories_label.grid(column=0, row=2, padx=5, pady=5, sticky="w")
+
+        self.categories = ["Animals", "Anime and Video Games", "Celebrity Sims", "Character Sims", "Child Related", "Create-A-Sim Content", "Crime, Punishment, and Public Service", "Decorating Themes", "Cemeteries/Death",
+                           "Dining, Retail, Parks and Pools", "EA Match", "Fantasy/Sci-Fi", "Food", "Game Mods and Hacks", "Historical and Ethnic", "Holidays", "Medical", "Sims 4 Pose Database", "Religious", "Weddings and Marriage", "Work & School"]
+        self.selected_category = tk.StringVar()
+        self.categories.extend(
+            category for category in self.mod_organizer_frame.rules.categories()
+            if category not in self.categories)
+        self.category_combobox = ttk.Combobox(
+            self, textvariable=self.selected_category, values=self.categories)
+        self.category_combobox.grid(
+            column=1, row=2, padx=5, pady=5, sticky="ew")
+
+        # Add the extract archive button
+        self.extract_button = ttk.Button(
+            self, text="Extract Archive", command=self.extract_archive_dialog)
+        self.extract_button.grid(
+            column=0, row=3, padx=5, pady=5, sticky="ew")
+
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_columnconfigure(1, weight=1)
+
+        # Add button for user-defined categories
+        self.add_category_button = ttk.Button(
+            self, text="Add Categories", command=self.add_user_defined_categories
+        )
+        self.add_category_button.grid(
+            column=1, row=3, padx=5, pady=5, sticky="ew")
+
+        self.extract_folder_button = ttk.Button(
+            self, text="Extract Folder", command=self.extract_folder_dialog)
+        self.extract_folder_button.grid(
+            column=0, row=4, padx=5, pady=5, sticky="ew")
+
+        self.inspect_button = ttk.Button(
+            self, text="Inspect Archive", command=self.inspect_archive_dialog)
+        self.inspect_button.grid(
+            column=1, row=4, padx=5, pady=5, sticky="ew")
+
+    def create_menu(self):
+        self.menu_bar = tk.Menu(self)
+        self.config(menu=self.menu_bar)
+
+        self.settings_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.settings_menu.add_command(
+            label="Change Theme", command=self.show_settings)
+        self.settings_menu.add_command(
+            label="Performance", command=self.show_performance)
+        self.menu_bar.add_cascade(label="Settings", menu=self.settings_menu)
+
+        frame = self.mod_organizer_frame
+        self.rules_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.rules_menu.add_command(
+            label="Apply Rules to Library", command=frame.apply_rules)
+        self.rules_menu.add_command(
+            label="Apply Rules to Selection",
+            command=lambda: frame.apply_rules(frame.view.selection()))
+        self.rules_menu.add_command(
+            label="Open Rules File", command=frame.open_rules_file)
+        self.menu_bar.add_cascade(label="Rules", menu=self.rules_menu)
+
+    def show_performance(self):
+        if self.performance_window is None or not self.performance_window.winfo_exists():
+            self.performance_window = PerformanceWindow(self)
+        else:
+            self.performance_window.deiconify()
+            self.performance_window.lift()
+
+    def show_settings(self):
+        settings_window = tk.Toplevel(self)
+        settings_window.title("Settings")
+        settings_window.geometry("300x200")
+
+        theme_frame = ttk.Frame(settings_window)
+        theme_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+
+        theme_label = ttk.Label(theme_frame, text="Select a theme:")
+        theme_label.pack(side=tk.TOP, pady=(0, 10))
+
+        self.create_theme_listbox(theme_frame)
+
+        apply_theme_button = ttk.Button(
+            theme_frame, text="Apply",
+            command=lambda: self.change_theme(
+                self.theme_listbox.get(self.theme_listbox.curselection()))
+        )
+        apply_theme_button.pack(side=tk.BOTTOM, pady=(10, 0))
+
+    def create_theme_listbox(self, parent):
+        self.theme_listbox = tk.Listbox(parent)
+        self.theme_listbox.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+        self.theme_listbox.bind('<<ListboxSelect>>', self.on_theme_selected)
+
+        for theme in sorted(self.get_themes()):
+            self.theme_listbox.insert(tk.END, theme)
+
+        current_theme_index = self.theme_listbox.get(
+            0, tk.END).index(self.default_theme)
+        self.theme_listbox.selection_set(current_theme_index)
+
+    def on_theme_selected(self, event):
+        selected_theme = self.theme_listbox.get(
+            self.theme_listbox.curselection())
+        self.change_theme(selected_theme)
+
+    def change_theme(self, selected_theme):
+        if selected_theme and selected_theme in self.get_themes():
+            self.set_theme(selected_theme)
+            self.default_theme = selected_theme
+            self.save_theme(selected_theme)
+        else:
+            messagebox.showerror("Error", "Invalid theme selected.")
+
+    def load_theme(self):
+        config_file = 'config.json'
+        if os.path.exists(config_file):
+            with open(config_file, 'r') as file:
+                config = json.load(file)
+                self.default_theme = config.get('theme', 'arc')
+        else:
+            self.default_theme = 'arc'
+
+    def save_theme(self, theme):
+        config_file = 'config.json'
+        config = {'theme': theme}
+        with open(config_file, 'w') as file:
+            json.dump(config, file)
+
+    def extract_archive_dialog(self):
+        if archive_paths := filedialog.askopenfilenames(
+            title="Select Archives",
+            filetypes=[
+                ("Archives", " ".join(
+                    f"*{extension}" for extension in ARCHIVE_EXTENSIONS)),
+                ("All Files", "*.*"),
+            ],
+        ):
+            if destination_path := filedialog.askdirectory(
+                title="Select Destination Folder"
+            ):
+                self.mod_organizer_frame.watch_folder(destination_path)
+                if len(archive_paths) > 1:
+                    self.extraction_manager.submit_batch(
+                        archive_paths, destination_path)
+                else:
+                    self.extraction_manager.submit(
+                        archive_paths[0], destination_path)
+                self.show_extraction_window()
+                self.poll_extraction_events()
+
+    def extract_folder_dialog(self):
+        """Batch extract every archive found in a folder."""
+        if archive_folder := filedialog.askdirectory(
+            title="Select Folder of Archives"
+        ):
+            if not (archive_paths := find_archives(archive_folder)):
+                messagebox.showinfo(
+                    "Extract Folder", "No archives found in that folder.")
+                return
+            if destination_path := filedialog.askdirectory(
+                title="Select Destination Folder"
+            ):
+                self.mod_organizer_frame.watch_folder(destination_path)
+                self.extraction_manager.submit_batch(
+                    archive_paths, destination_path)
+                self.show_extraction_window()
+                self.poll_extraction_events()
+
+    def inspect_archive_dialog(self):
+        """List an archive's members and extract only the ones ticked."""
+        if archive_path := filedialog.askopenfilename(
+            title="Select Archive",
+            filetypes=[
+                ("Archives", " ".join(
+                    f"*{extension}" for extension in ARCHIVE_EXTENSIONS)),
+                ("All Files", "*.*"),
+            ],
+        ):
+            if destination_path := filedialog.askdirectory(
+                title="Select Destination Folder"
+            ):
+                ArchiveInspectWindow(self, archive_path, destination_path)
+
+    def extract_members(self, archive_path, destination_path, members):
+        self.mod_organizer_frame.watch_folder(destination_path)
+        self.extraction_manager.submit(archive_path, destination_path, members)
+        self.show_extraction_window()
+        self.poll_extraction_events()
+
+    def show_extraction_window(self):
+        if self.extraction_window is None or not self.extraction_window.winfo_exists():
+            self.extraction_window = ExtractionProgressWindow(
+                self, self.extraction_manager)
+        else:
+            self.extraction_window.deiconify()
+            self.extraction_window.lift()
+
+    def poll_extraction_events(self):
+        """Drain worker events and refresh the progress window."""
+        if self.polling_extractions:
+            return
+        self.polling_extractions = True
+        self._poll_extraction_events()
+
+    def _poll_extraction_events(self):
+        keep_polling = self.extraction_manager.active()
+        if events := self.extraction_manager.consume_events():
+            if self.extraction_window is not None and self.extraction_window.winfo_exists():
+                self.extraction_window.refresh()
+        for kind, subject in events:
+            if kind == "failed" and subject.batch is None:
+                messagebox.showerror(
+                    "Extraction Failed", f"{subject.name}: {subject.error}")
+            elif kind == "batch_done":
+                messagebox.showinfo(
+                    "Batch Extraction", subject.summary.describe())
+
+        if keep_polling:
+            self.after(100, self._poll_extraction_events)
+        else:
+            self.polling_extractions = False
+            self.hash_index.save()
+
+    def extract_archive(self, archive_path, destination_path, job=None):
+        return extract_archive(archive_path, destination_path, job, self.hash_index)
+
+    def add_user_defined_categories(self):
+        if user_defined_categories := simpledialog.askstring(
+            "Add Categories", "Enter new categories separated by commas:"
+        ):
+            new_categories = [category for category in (
+                category.strip() for category in user_defined_categories.split(","))
+                if category]
+            self.categories.extend(category for category in dict.fromkeys(new_categories)
+                                   if category not in self.categories)
+            self.category_combobox["values"] = self.categories
+            # Each new category gets a name keyword rule, editable in the rules file
+            try:
+                added = self.mod_organizer_frame.rules.add_categories(new_categories)
+            except (OSError, ValueError) as error:
+                messagebox.showerror("Add Categories", str(error))
+                return
+            if added:
+                self.mod_organizer_frame.apply_rules(quiet=True)
+
+    def categorize_files(self, extracted_path, inspect_contents=True):
+        return categorize_files(extracted_path, inspect_contents)
+
+    def identify_file_category(self, file_name, file_path=None):
+        return identify_file_category(file_name, file_path)
+
+
+class ModOrganizerFrame(ttk.Frame):
+    """A frame for managing mods and custom content in the application."""
+
+    def __init__(self, parent, hash_index=None):
+        super().__init__(parent)
+        self.parent = parent
+        self.hash_index = hash_index if hash_index is not None else HashIndex()
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        self.library = ModLibrary()
+        self.library.listeners.append(self.on_library_change)
+        self.sort_columns = []
+        self.sort_order_valid = False
+        self.resort_id = None
+        self.search_matches = None
+        self.search_after_id = None
+        self.index_build_id = None
+        self.scanner = None
+        self.scanning = False
+        self.watcher = None
+        self.store = None
+        self.inspect_packages = tk.BooleanVar(value=True)
+        self.watch_folders = tk.BooleanVar(value=False)
+
+        self.editor = BulkEditor(self.library)
+        self.bulk_window = None
+        self.conflict_detector = ConflictDetector(CONFLICT_CACHE_FILE)
+        self.conflicts = None
+        self.conflicted_paths = set()
+        self.analyzing_conflicts = False
+        self.conflicts_window = None
+        self.merging = False
+        self.merge_window = None
+        self.preview_loader = PreviewLoader(PreviewCache(), self.hash_index)
+        self.previews = {}
+        self.preview_path = None
+        self.preview_photo = None
+        self.rules = RuleSet(RULES_FILE, RULE_CACHE_FILE)
+        self.rules_error = None
+        self.applying_rules = False
+
+        self.create_widgets()
+        self.after(PREVIEW_POLL_MS, self.poll_previews)
+        self.journal = LibraryJournal()
+        self.recover_autosave()
+        self.load_rules()
+
+    def recover_autosave(self):
+        """Restore the library from the autosave journal and start journaling."""
+        try:
+            self.journal.recover(self.library)
+        except (KeyError, OSError, TypeError, ValueError) as error:
+            for path in (self.journal.snapshot_path, self.journal.journal_path):
+                if os.path.exists(path):
+                    os.replace(path, f"{path}.corrupt")
+            messagebox.showwarning(
+                "Autosave", f"The autosaved library could not be restored ({error}); "
+                            "the damaged files were kept with a .corrupt suffix.")
+            self.journal = LibraryJournal()
+            self.library.clear()
+        if self.library:
+            self.view.set_rows(self.library.records)
+            self.refresh_search()
+        self.journal.attach(self.library)
+        self.after(AUTOSAVE_CHECK_MS, self.check_autosave)
+
+    def check_autosave(self):
+        if self.journal.needs_compaction:
+            self.journal.compact()
+        self.after(AUTOSAVE_CHECK_MS, self.check_autosave)
+
+    def shutdown(self):
+        """Stop background work and flush the autosave before the window closes."""
+        self.stop_watching()
+        self.preview_loader.shutdown()
+        self.preview_loader.cache.close()
+        self.rules.save()
+        self.journal.close()
+        if self.store is not None:
+            self.store.close()
+
+    def create_widgets(self):
+        """Create and configure the necessary widgets."""
+        self.create_mods_label()
+        self.create_treeview()
+        self.create_scrollbar()
+        self.create_preview_pane()
+        self.create_search_bar()
+        self.create_entry_box()  # added new method to create the mod_entry widget
+        self.create_buttons()
+
+    def create_entry_box(self):
+        """Create the entry box for adding new mods."""
+        self.mod_entry_label = ttk.Label(
+            self, text="Add a new mod or custom content:")
+        self.mod_entry_label.grid(
+            row=2, column=0, padx=10, pady=10, sticky=tk.W)
+
+        self.mod_entry = ttk.Entry(self)
+        self.mod_entry.grid(row=2, column=1, padx=10, pady=10, sticky=tk.W)
+
+        self.mod_category_label = ttk.Label(self, text="Category:")
+        self.mod_category_label.grid(
+            row=2, column=2, padx=(20, 0), pady=10, sticky=tk.W)
+
+        self.category_options = ["CAS", "Build/Buy", "Gameplay", "Other"]
+        self.selected_category = tk.StringVar(value=self.category_options[0])
+        self.category_menu = ttk.OptionMenu(
+            self, self.selected_category, *self.category_options)
+        self.category_menu.grid(row=2, column=3, pady=10, sticky=tk.W)
+
+        self.inspect_packages_check = ttk.Checkbutton(
+            self, text="Read package contents", variable=self.inspect_packages)
+        self.inspect_packages_check.grid(
+            row=3, column=0, padx=10, pady=(0, 10), sticky=tk.W)
+
+        self.watch_folders_check = ttk.Checkbutton(
+            self, text="Watch Mods folder", variable=self.watch_folders,
+            command=self.toggle_watching)
+        self.watch_folders_check.grid(
+            row=3, column=1, padx=10, pady=(0, 10), sticky=tk.W)
+
+    def create_mods_label(self):
+        """Create the mods label."""
+        self.mods_label = ttk.Label(self, text="Mods and Custom Content")
+        self.mods_label.grid(row=0, column=0, padx=10,
+                             pady=(10, 0), sticky=tk.W)
+
+    def mod_exists(self, mod_name):
+        """Check if a mod with the given name already exists in the library."""
+        return self.library.exists(mod_name)
+
+    def record_for_item(self, item):
+        """Return the library record shown by a treeview item."""
+        return self.library.get(int(item))
+
+    @profiled("view.insert_records")
+    def insert_records(self, records):
+        self.view.append_rows([record.id for record in records])
+        self.refresh_search()
+
+    def refresh_record(self, record):
+        self.view.refresh_rows([record.id])
+
+    def create_treeview(self):
+        self.treeview = ttk.Treeview(self, columns=(
+            'Name', 'Category', 'Tags', 'Source'), show='headings', selectmode="extended")
+        self.treeview.heading("#0", text="Mod Name")
+        self.treeview.heading('Name', text='Name')
+        self.treeview.heading('Category', text='Category')
+        self.treeview.heading('Tags', text='Tags')
+        self.treeview.heading('Source', text='Source')
+        self.treeview.grid(row=1, column=0, padx=10,
+                           pady=(5, 10), sticky=tk.NSEW)
+        self.treeview.tag_configure("matched", background="")
+        self.treeview.tag_configure("not_matched", background="gray")
+        self.treeview.tag_configure("conflict", foreground="red")
+        self.treeview.bind('<Up>', self.navigate_treeview)
+        self.treeview.bind('<Down>', self.navigate_treeview)
+        self.treeview.grid(row=1, column=0, padx=10, pady=(
+            5, 10), sticky=tk.W+tk.E+tk.N+tk.S)
+        self.bind_treeview_sort()
+
+    def create_scrollbar(self):
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical')
+        self.scrollbar.grid(row=1, column=1, pady=(5, 10), sticky=tk.NS)
+        self.view = VirtualTreeview(
+            self.treeview, self.scrollbar, self.library.get, self.row_tags_for,
+            self.prefetch_previews)
+
+    def create_preview_pane(self):
+        self.preview_frame = ttk.LabelFrame(self, text="Preview")
+        self.preview_frame.grid(row=1, column=2, columnspan=2, padx=(0, 10), pady=(5, 10),
+                                sticky=tk.NSEW)
+        self.preview_image_label = ttk.Label(self.preview_frame)
+        self.preview_image_label.pack(padx=5, pady=5)
+        self.preview_text = tk.StringVar(value="Select a mod to preview it.")
+        ttk.Label(self.preview_frame, textvariable=self.preview_text, wraplength=200,
+                  justify=tk.LEFT).pack(padx=5, pady=(0, 5), anchor=tk.W)
+        self.treeview.bind('<<TreeviewSelect>>', self.show_preview, add='+')
+
+    def preview_path_for(self, record_id):
+        record = self.library.get(record_id) if record_id is not None else None
+        if record is not None and record.path and record.path.lower().endswith('.package'):
+            return record.path
+        return None
+
+    def prefetch_previews(self, record_ids):
+        """Queue previews for the focused row and the rows on screen, skipping cached ones."""
+        paths = [path for record_id in [self.view.focus_id, *record_ids]
+                 if (path := self.preview_path_for(record_id)) and path not in self.previews]
+        self.preview_loader.request(list(dict.fromkeys(paths)))
+
+    def poll_previews(self):
+        while True:
+            try:
+                path, metadata, thumbnail = self.preview_loader.results.get_nowait()
+            except queue.Empty:
+                break
+            self.previews.pop(path, None)
+            self.previews[path] = (metadata, thumbnail)
+            if len(self.previews) > PREVIEW_MEMORY_LIMIT:
+                self.previews.pop(next(iter(self.previews)))
+            if path == self.preview_path:
+                self.show_preview()
+        self.after(PREVIEW_POLL_MS, self.poll_previews)
+
+    def show_preview(self, event=None):
+        """Show the focused mod's thumbnail and metadata, or queue them if not loaded yet."""
+        record_id = self.view.focus_id
+        self.preview_path = path = self.preview_path_for(record_id)
+        self.preview_photo = None
+        if path is None:
+            self.preview_image_label.config(image="")
+            self.preview_text.set("Select a mod to preview it." if record_id is None
+                                  else "No package to preview.")
+            return
+        if (preview := self.previews.get(path)) is None:
+            self.preview_image_label.config(image="")
+            self.preview_text.set("Loading preview...")
+            self.prefetch_previews(self.view.rendered_ids)
+            return
+        metadata, thumbnail = preview
+        self.preview_photo = self.photo_for(thumbnail)
+        self.preview_image_label.config(image=self.preview_photo or "")
+        self.preview_text.set(self.describe_preview(metadata))
+
+    @staticmethod
+    def photo_for(thumbnail):
+        if not thumbnail:
+            return None
+        try:
+            photo = tk.PhotoImage(data=base64.b64encode(thumbnail))
+        except tk.TclError:
+            return None
+        # Without Pillow thumbnails arrive at full size; shrink them here
+        if (factor := -(-max(photo.width(), photo.height()) // PREVIEW_THUMBNAIL_SIZE)) > 1:
+            photo = photo.subsample(factor)
+        return photo
+
+    @staticmethod
+    def describe_preview(metadata):
+        if "failed" in metadata:
+            return f"Couldn't load a preview: {metadata['failed']}"
+        if "error" in metadata:
+            return "Not a readable package."
+        lines = [f"{(metadata['kind'] or 'unknown').capitalize()} package, "
+                 f"{format_size(metadata['size'])}, {metadata['resources']} resources"]
+        if metadata["creator"]:
+            lines.append(f"Creator: {metadata['creator']}")
+        lines.extend(metadata["names"][:4])
+        return "\n".join(lines)
+
+    def create_search_bar(self):
+        self.search_label = ttk.Label(self, text="Search:")
+        self.search_label.grid(
+            row=0, column=1, sticky=tk.E, padx=(50, 0), pady=(10, 0))
+
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", self.update_search)
+        self.search_entry = ttk.Entry(self, textvariable=self.search_var)
+        self.search_entry.grid(row=0, column=2, padx=10, pady=(10, 0))
+        self.create_tooltip(
+            self.search_entry,
+            "Type text to search, or a query such as\ntag:hair AND NOT tag:broken category:CAS")
+
+    def create_buttons(self):
+        self.button_frame = ttk.Frame(self)
+
+        self.add_button = self.create_button(
+            'Add', self.add_mod, 0, "Add a new mod or custom content.")
+        self.edit_button = self.create_button(
+            'Edit', self.edit_mod, 1, "Edit the selected mod or custom content.")
+        self.remove_button = self.create_button(
+            'Remove', self.remove_mod, 2, "Remove the selected mod or custom content.")
+        self.manage_tags_button = self.create_button(
+            'Manage Tags', self.manage_tags, 3, "Manage tags for mods and custom content.")
+        self.save_mods_button = self.create_button(
+            'Save Mods', self.save_mods, 4, "Save the current list of mods and custom content.")
+        self.load_mods_button = self.create_button(
+            'Load Mods', self.load_mods, 5, "Load a saved list of mods and custom content.")
+        self.scan_folder_button = self.create_button(
+            'Scan Folder', self.scan_library_folder, 6, "Index every mod in your Mods folder.")
+        self.bulk_edit_button = self.create_button(
+            'Bulk Edit', self.show_bulk_edit, 7,
+            "Recategorize, retag, rename or remove many mods at once.")
+        self.undo_button = self.create_button(
+            'Undo', self.undo, 8, "Undo the last edit (Ctrl+Z).")
+        self.redo_button = self.create_button(
+            'Redo', self.redo, 9, "Redo the last undone edit (Ctrl+Y).")
+        self.conflicts_button = self.create_button(
+            'Conflicts', self.show_conflicts, 10,
+            "Find packages that override the same game resources.")
+        self.merge_button = self.create_button(
+            'Merge', self.show_merge, 11,
+            "Combine many small packages into a few large ones so the game loads faster.")
+        self.treeview.bind('<Control-z>', self.undo)
+        self.treeview.bind('<Control-y>', self.redo)
+
+        self.button_frame.grid(row=2, column=0, columnspan=2,
+                               padx=10, pady=10, sticky=tk.W)
+
+        self.add_button.config(command=self.add_mod)
+        self.edit_button.config(command=self.edit_mod)
+        self.remove_button.config(command=self.remove_mod)
+        self.manage_tags_button.config(command=self.manage_tags)
+        self.save_mods_button.config(command=self.save_mods)
+        self.load_mods_button.config(command=self.load_mods)
+
+    def create_button(self, text, command, column, tooltip_text):
+        button = ttk.Button(self.button_frame, text=text,
+                            command=command, width=10)
+        button.grid(row=0, column=column, padx=(0 if column == 0 else 5, 5))
+        self.create_tooltip(button, tooltip_text)
+        return button
+
+    def create_tooltip(self, widget, text):
+        tooltip = ToolTip(widget, text)
+        widget.bind('<Enter>', tooltip.show)
+        widget.bind('<Leave>', tooltip.hide)
+
+    def navigate_treeview(self, event):
+        """Navigate the treeview using arrow keys."""
+        return self.view.move_focus(-1 if event.keysym == 'Up' else 1)
+
+    def update_search(self, *args):
+        # Debounce keystrokes so fast typing runs one search, not one per key
+        if self.search_after_id is not None:
+            self.after_cancel(self.search_after_id)
+        self.search_after_id = self.after(SEARCH_DEBOUNCE_MS, self.apply_search)
+
+    def apply_search(self):
+        self.search_after_id = None
+        self.filter_treeview_items(self.search_var.get())
+
+    @profiled("ui.search")
+    def filter_treeview_items(self, search_term):
+        """Highlight the rows matching ``search_term`` and grey out the rest."""
+        previous = self.search_matches
+        try:
+            self.search_matches = self.library.search(search_term)
+        except ValueError:
+            # Half-typed queries fall back to a plain substring search
+            self.search_matches = self.library.search_index.search(search_term)
+        if not self.library.search_index.built and self.index_build_id is None:
+            self.index_build_id = self.after_idle(self.build_search_index)
+
+        # Only rows on screen exist in the widget; redraw those that flipped
+        self.view.refresh_rows([
+            record_id for record_id in self.view.rendered_ids
+            if self.is_search_match(record_id, previous) != self.is_search_match(record_id)])
+
+    def build_search_index(self):
+        """Fill the search index a small step at a time between UI events."""
+        if self.library.search_index.build_step():
+            self.index_build_id = self.after(1, self.build_search_index)
+        else:
+            self.index_build_id = None
+
+    def refresh_search(self):
+        """Re-run the active search after the library changed."""
+        if self.search_matches is not None:
+            self.filter_treeview_items(self.search_var.get())
+
+    def is_search_match(self, record_id, matches=False):
+        if matches is False:
+            matches = self.search_matches
+        return matches is None or record_id in matches
+
+    def row_tags_for(self, record_id):
+        tags = ()
+        if self.search_matches is not None:
+            tags = ("matched", ) if record_id in self.search_matches else ("not_matched", )
+        if self.conflicted_paths and self.library.records[record_id].path in self.conflicted_paths:
+            tags += ("conflict", )
+        return tags
+
+    @profiled("ui.sort")
+    def sort_treeview(self, column, add=False):
+        """Sort the treeview by the selected column.
+
+        Clicking the primary sort column again reverses the current order
+        without re-sorting, as long as no row was added or edited since the
+        last sort. With ``add`` (Shift-click) the column becomes an extra
+        sort key, or flips direction if it already is one.
+        """
+        if self.resort_id is not None:
+            self.after_cancel(self.resort_id)
+            self.resort_id = None
+        if not add and self.sort_columns and self.sort_columns[0][0] == column:
+            self.sort_columns = [(sort_column, not descending)
+                                 for sort_column, descending in self.sort_columns]
+        else:
+            self.sort_order_valid = False
+            if not add:
+                self.sort_columns = [(column, False)]
+            elif column in dict(self.sort_columns):
+                self.sort_columns = [(sort_column, descending != (sort_column == column))
+                                     for sort_column, descending in self.sort_columns]
+            else:
+                self.sort_columns.append((column, False))
+
+        if self.sort_order_valid:
+            self.view.set_rows(self.view.row_ids[::-1])
+        else:
+            self.resort_rows()
+        self.update_sort_headings()
+
+    def resort_rows(self):
+        """Put the rows back in ``sort_columns`` order; cached sort keys keep this cheap."""
+        self.resort_id = None
+        if self.sort_columns:
+            # Only the visible window of rows is redrawn
+            self.view.set_rows(sort_record_ids(
+                self.library.records, self.view.row_ids,
+                [(SORT_FIELDS[sort_column], descending)
+                 for sort_column, descending in self.sort_columns]))
+            self.sort_order_valid = True
+
+    def on_library_change(self, operation, record):
+        """Re-sort once the current batch of adds and edits has reached the view."""
+        if operation == "remove" or not self.sort_order_valid:
+            return
+        self.sort_order_valid = False
+        if self.resort_id is None:
+            self.resort_id = self.after_idle(self.resort_rows)
+
+    def update_sort_headings(self):
+        sort_columns = dict(self.sort_columns)
+        for position, column in enumerate(self.treeview["columns"]):
+            text = column
+            if column in sort_columns:
+                text += " \u25bc" if sort_columns[column] else " \u25b2"
+                if len(sort_columns) > 1:
+                    text += str([sort_column for sort_column, _ in self.sort_columns].index(column) + 1)
+            self.treeview.heading(column, text=text)
+
+    def on_heading_shift_click(self, event):
+        """Shift-click on a column header adds it as a secondary sort key."""
+        if self.treeview.identify_region(event.x, event.y) != "heading":
+            return None
+        column_number = int(self.treeview.identify_column(event.x)[1:])
+        self.sort_treeview(self.treeview["columns"][column_number - 1], add=True)
+        return "break"
+
+    # Bind the treeview column headers to the sorting function
+    def bind_treeview_sort(self):
+        for col in self.treeview["columns"]:
+            self.treeview.heading(
+                col, text=col, command=lambda c=col: self.sort_treeview(c))
+        self.treeview.bind('<Shift-Button-1>', self.on_heading_shift_click)
+
+    def add_mod(self):
+        # Add mod(s) to the treeview
+        mod_files = filedialog.askopenfilenames(
+            initialdir="/", title="Select mod files", filetypes=[("Package files", "*.package")])
+
+        mod_names = [os.path.basename(mod_file) for mod_file in mod_files]
+
+        # Automatically categorize the mod files from their contents or names
+        categories = MOD_CLASSIFIER.classify_files(
+            mod_files, self.inspect_packages.get())
+
+        new_mods = []
+        for mod_file, mod_name, category in zip(mod_files, mod_names, categories):
+            if mod_name and not self.mod_exists(mod_name):
+                new_mods.append((mod_file, mod_name, category))
+
+        # Skip files whose content is already somewhere in the library
+        added, duplicates = self.hash_index.add_unique(
+            [mod_file for mod_file, _, _ in new_mods])
+        added = set(added)
+        self.insert_records([
+            self.add_record(mod_name, category, mod_file)
+            for mod_file, mod_name, category in new_mods
+            if mod_file in added and not self.mod_exists(mod_name)])
+
+        if duplicates:
+            shown = [f"{os.path.basename(duplicate)} (same as {os.path.basename(original)})"
+                     for duplicate, original in list(duplicates.items())[:20]]
+            if len(duplicates) > len(shown):
+                shown.append(f"...and {len(duplicates) - len(shown)} more")
+            messagebox.showinfo(
+                "Duplicates Skipped", "These files are already in the library:\n" + "\n".join(shown))
+
+    def scan_library_folder(self):
+        """Index a Mods folder in the background and merge the changes."""
+        if self.scanning:
+            return
+        initial_dir = self.scanner.root if self.scanner else None
+        if folder := filedialog.askdirectory(
+                title="Select Mods Folder", initialdir=initial_dir):
+            self.start_scan(folder)
+
+    def start_scan(self, folder, quiet=False):
+        if self.scanning:
+            return
+        if self.scanner is None or self.scanner.root != os.path.normpath(folder):
+            self.scanner = LibraryScanner(folder, LIBRARY_SNAPSHOT_FILE)
+            self.scanner.load()
+            if self.watcher is not None:
+                self.watcher.add_root(folder)
+        self.scanning = True
+        results = queue.Queue()
+        threading.Thread(
+            target=self._scan_worker,
+            args=(self.scanner, self.rules, self.inspect_packages.get(), results),
+            name="library-scan", daemon=True).start()
+        self.after(50, self._poll_scan, results, quiet)
+
+    @staticmethod
+    def classify_paths(rules, paths, inspect_contents):
+        """Classify files, evaluating the rules too so the Tk thread finds them memoized."""
+        rules.evaluate_many(paths)
+        return MOD_CLASSIFIER.classify_files(paths, inspect_contents)
+
+    @classmethod
+    def _scan_worker(cls, scanner, rules, inspect_contents, results):
+        try:
+            result = scanner.scan()
+            paths = result.added + result.modified
+            categories = dict(zip(paths, cls.classify_paths(rules, paths, inspect_contents)))
+            scanner.save()
+        except Exception as error:
+            results.put((None, error))
+        else:
+            results.put((result, categories))
+
+    def _poll_scan(self, results, quiet=False):
+        try:
+            result, categories = results.get_nowait()
+        except queue.Empty:
+            self.after(50, self._poll_scan, results, quiet)
+            return
+        self.scanning = False
+        if result is None:
+            messagebox.showerror("Scan Failed", str(categories))
+            return
+        summary = self.apply_scan_result(result, categories)
+        if not quiet:
+            messagebox.showinfo("Scan Folder", summary)
+
+    def toggle_watching(self):
+        if not self.watch_folders.get():
+            self.stop_watching()
+            return
+        if self.scanner is None:
+            messagebox.showinfo(
+                "Watch Mods Folder", "Scan your Mods folder first, then turn on watching.")
+            self.watch_folders.set(False)
+            return
+        inspect_contents, rules = self.inspect_packages.get(), self.rules
+        self.watcher = FolderWatcher(
+            classify=lambda paths: self.classify_paths(rules, paths, inspect_contents))
+        self.watcher.add_root(self.scanner.root)
+        self.watcher.start()
+        self.after(200, self._poll_watcher, self.watcher)
+
+    def watch_folder(self, folder):
+        """Also watch ``folder`` (e.g. an extraction destination) while watching is on."""
+        if self.watcher is not None:
+            self.watcher.add_root(folder)
+
+    def stop_watching(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def _poll_watcher(self, watcher):
+        if watcher is not self.watcher:
+            return
+        # Schedule the next poll first so a failing batch can't stop watching
+        self.after(200, self._poll_watcher, watcher)
+        batches = []
+        while True:
+            try:
+                batches.append(watcher.results.get_nowait())
+            except queue.Empty:
+                break
+        for result, categories in batches:
+            if result.overflowed and self.scanner is not None:
+                self.start_scan(self.scanner.root, quiet=True)
+            self.apply_scan_result(result, categories)
+
+    def apply_scan_result(self, result, categories):
+        """Apply a scan's added, removed and modified files to the library."""
+        removed_ids = [record.id for path in result.removed
+                       if (record := self.library.find_path(path)) is not None]
+        removed_ids.extend(record.id for directory in result.removed_dirs
+                           for record in self.library.find_under(directory))
+        removed_ids = list(dict.fromkeys(removed_ids))
+        for record_id in removed_ids:
+            self.library.remove(record_id)
+
+        modified_ids = []
+        for path in result.modified:
+            self.previews.pop(path, None)
+            if (record := self.library.find_path(path)) is not None:
+                rule_result = self.rules.evaluate(path)
+                changes = rule_result.changes_for(record)
+                changes.setdefault("category", rule_result.category or categories[path])
+                self.library.update(record.id, **changes)
+                modified_ids.append(record.id)
+
+        new_records = []
+        skipped = 0
+        for path in result.added:
+            name = os.path.basename(path)
+            if self.library.find_path(path) is not None:
+                continue
+            if self.library.exists(name):
+                skipped += 1
+                continue
+            new_records.append(self.add_record(name, categories[path], path))
+
+        if removed_ids:
+            self.view.remove_rows(removed_ids)
+        self.view.refresh_rows(modified_ids)
+        self.insert_records(new_records)
+        if self.conflicts is not None:
+            self.analyze_conflicts()
+
+        summary = (f"{result.total_files} mod files indexed in {result.elapsed:.2f}s: "
+                   f"{len(new_records)} added, {len(removed_ids)} removed, "
+                   f"{len(modified_ids)} updated.")
+        if skipped:
+            summary += f" {skipped} skipped because a mod with the same name is already listed."
+        return summary
+
+    def show_conflicts(self):
+        if self.conflicts_window is None or not self.conflicts_window.winfo_exists():
+            self.conflicts_window = ConflictsWindow(self)
+        else:
+            self.conflicts_window.deiconify()
+            self.conflicts_window.lift()
+        self.analyze_conflicts()
+
+    def analyze_conflicts(self):
+        """Re-check the library's packages for shared resources in the background."""
+        if self.analyzing_conflicts:
+            return
+        paths = [record.path for record in self.library
+                 if record.path and record.path.lower().endswith('.package')]
+        self.analyzing_conflicts = True
+        if self.conflicts_window is not None and self.conflicts_window.winfo_exists():
+            self.conflicts_window.set_status(f"Analyzing {len(paths)} packages...")
+        results = queue.Queue()
+        threading.Thread(
+            target=self._conflict_worker, args=(self.conflict_detector, paths, results),
+            name="conflict-analysis", daemon=True).start()
+        self.after(100, self._poll_conflicts, results)
+
+    @staticmethod
+    def _conflict_worker(detector, paths, results):
+        try:
+            if not detector.files:
+                detector.load()
+            conflicts = detector.analyze(paths)
+            detector.save()
+        except Exception as error:
+            results.put((None, error))
+        else:
+            results.put((conflicts, None))
+
+    def _poll_conflicts(self, results):
+        try:
+            conflicts, error = results.get_nowait()
+        except queue.Empty:
+            self.after(100, self._poll_conflicts, results)
+            return
+        self.analyzing_conflicts = False
+        if conflicts is None:
+            messagebox.showerror("Conflicts", f"Conflict analysis failed: {error}")
+            return
+        self.conflicts = conflicts
+        self.conflicted_paths = {path for conflict in conflicts for path in conflict[:2]}
+        self.view.refresh_rows(self.view.rendered_ids)
+        if self.conflicts_window is not None and self.conflicts_window.winfo_exists():
+            self.conflicts_window.show(conflicts)
+
+    def show_merge(self):
+        if self.merge_window is None or not self.merge_window.winfo_exists():
+            self.merge_window = MergeWindow(self)
+        else:
+            self.merge_window.refresh_scope()
+            self.merge_window.deiconify()
+            self.merge_window.lift()
+
+    def start_merge(self, manifest_path, operation, paths=None, category=None,
+                    remove_sources=False):
+        """Run a merge or unmerge of ``manifest_path`` in the background."""
+        if self.merging:
+            return
+        self.merging = True
+        results = queue.Queue()
+        threading.Thread(
+            target=self._merge_worker,
+            args=(manifest_path, operation, paths, category, remove_sources,
+                  self.inspect_packages.get(), results),
+            name="package-merge", daemon=True).start()
+        self.after(100, self._poll_merge, results, operation)
+
+    @staticmethod
+    def _merge_worker(manifest_path, operation, paths, category, remove_sources,
+                      inspect_contents, results):
+        try:
+            merger = PackageMerger(manifest_path)
+            merger.load()
+            if operation == "merge":
+                result = merger.merge(paths, remove_sources)
+                additions = [(path, category) for path in result.written]
+            else:
+                result = merger.unmerge(paths)
+                additions = list(zip(result.merged, MOD_CLASSIFIER.classify_files(
+                    result.merged, inspect_contents)))
+        except Exception as error:
+            results.put((None, error))
+        else:
+            results.put((result, additions))
+
+    def _poll_merge(self, results, operation):
+        try:
+            result, additions = results.get_nowait()
+        except queue.Empty:
+            self.after(100, self._poll_merge, results, operation)
+            return
+        self.merging = False
+        if result is None:
+            messagebox.showerror("Merge", str(additions))
+            return
+        self.apply_merge_result(result, additions)
+        if operation == "merge":
+            summary = (f"{len(result.merged)} packages merged, {result.unchanged} already merged; "
+                       f"{len(result.written)} merged packages written.")
+            if result.skipped:
+                summary += f" {len(result.skipped)} skipped because they are not readable packages."
+            if result.kept_sources:
+                summary += (f" {len(result.kept_sources)} originals kept because they could "
+                            "not be verified to rebuild exactly.")
+            elif not result.removed_sources and (result.merged or result.unchanged):
+                summary += (" The originals were kept; move them out of the Mods folder "
+                            "or the game loads their resources twice.")
+        else:
+            summary = (f"{len(result.merged)} packages restored; {len(result.written)} merged "
+                       f"packages rewritten, {len(result.deleted)} removed.")
+        if self.merge_window is not None and self.merge_window.winfo_exists():
+            self.merge_window.set_status(summary)
+            self.merge_window.refresh_scope()
+
+    def apply_merge_result(self, result, additions):
+        """Swap the records of merged-away and restored packages in one pass."""
+        removed_ids = []
+        for path in result.removed_sources + result.deleted:
+            self.hash_index.remove(path)
+            if (record := self.library.find_path(path)) is not None:
+                self.library.remove(record.id)
+                removed_ids.append(record.id)
+        new_records = []
+        for path, category in additions:
+            if self.library.find_path(path) is not None or self.library.exists(
+                    name := os.path.basename(path)):
+                continue
+            new_records.append(self.add_record(name, category, path))
+            self.hash_index.add(path)
+        if removed_ids:
+            self.view.remove_rows(removed_ids)
+        self.insert_records(new_records)
+        if self.conflicts is not None:
+            self.analyze_conflicts()
+
+    def mod_label(self, path):
+        record = self.library.find_path(path)
+        return record.name if record is not None else os.path.basename(path)
+
+    def detect_category(self, mod_name, mod_path=None):
+        """Detect the category of the mod from its name or package contents."""
+        return detect_category(mod_name, mod_path)
+
+    def get_mod_source(self, mod_name, mod_path=None):
+        """Return the source the rules give a mod file, or "" if none does."""
+        result = self.rules.evaluate(mod_path) if mod_path else self.rules.match_name(mod_name)
+        return result.source or ""
+
+    def add_record(self, name, category, path):
+        """Add an imported file to the library with the category, source and tags its rules give."""
+        rule_result = self.rules.evaluate(path)
+        return self.library.add(name, rule_result.category or category, tags=rule_result.tags,
+                                source=rule_result.source or "", path=path)
+
+    def load_rules(self):
+        try:
+            self.rules.load()
+        except ValueError as error:
+            self.report_rules_error(error)
+        self.after(RULES_CHECK_MS, self.check_rules)
+
+    def report_rules_error(self, error):
+        """Show a rules file error once, not on every check."""
+        if str(error) != self.rules_error:
+            self.rules_error = str(error)
+            messagebox.showwarning(
+                "Rules", f"{error}\nThe previous rules stay in effect until the file is fixed.")
+
+    def check_rules(self):
+        """Reload the rules file when it changes and re-apply it to the library."""
+        try:
+            if self.rules.reload_if_changed():
+                self.rules_error = None
+                self.apply_rules(quiet=True)
+        except ValueError as error:
+            self.report_rules_error(error)
+        self.after(RULES_CHECK_MS, self.check_rules)
+
+    def open_rules_file(self):
+        """Open the rules file in the system editor, writing the defaults first if needed."""
+        path = os.path.abspath(self.rules.path)
+        try:
+            if not os.path.exists(path):
+                self.rules.write()
+            if hasattr(os, "startfile"):
+                os.startfile(path)
+            else:
+                subprocess.Popen(["open" if sys.platform == "darwin" else "xdg-open", path])
+        except OSError:
+            messagebox.showinfo("Rules", f"Edit the rules in {path}; changes apply automatically.")
+
+    def apply_rules(self, mod_ids=None, quiet=False):
+        """Evaluate the rules for every mod (or ``mod_ids``) in the background, then apply them."""
+        if self.applying_rules:
+            return
+        records = self.library.records
+        targets = {mod_id: path for mod_id in (records if mod_ids is None else mod_ids)
+                   if mod_id in records and (path := records[mod_id].path)}
+        if not targets:
+            return
+        self.applying_rules = True
+        results = queue.Queue()
+        threading.Thread(
+            target=self._rules_worker, args=(self.rules, targets, results),
+            name="apply-rules", daemon=True).start()
+        self.after(100, self._poll_rules, results, quiet)
+
+    @staticmethod
+    def _rules_worker(rules, targets, results):
+        try:
+            evaluated = dict(zip(targets, rules.evaluate_many(list(targets.values()))))
+            rules.save()
+        except Exception as error:
+            results.put((None, error))
+        else:
+            results.put((evaluated, None))
+
+    def _poll_rules(self, results, quiet):
+        try:
+            evaluated, error = results.get_nowait()
+        except queue.Empty:
+            self.after(100, self._poll_rules, results, quiet)
+            return
+        self.applying_rules = False
+        if evaluated is None:
+            messagebox.showerror("Rules", f"Applying the rules failed: {error}")
+            return
+        result = self.run_bulk("apply_rules", evaluated)
+        if not quiet and result is not None:
+            messagebox.showinfo(
+                "Rules", f"{len(result.updated)} of {len(evaluated)} mods changed by the rules.")
+
+    def remove_mod(self):
+        if selected_items := self.view.selection():
+            self.apply_bulk_result(self.editor.delete(selected_items))
+
+    def show_bulk_edit(self):
+        if self.bulk_window is None or not self.bulk_window.winfo_exists():
+            self.bulk_window = BulkEditWindow(self)
+        else:
+            self.bulk_window.refresh_scope()
+            self.bulk_window.deiconify()
+            self.bulk_window.lift()
+
+    def search_result_ids(self):
+        """Return the records matching the active search in display order, or None."""
+        if self.search_matches is None:
+            return None
+        return [row_id for row_id in self.view.row_ids if row_id in self.search_matches]
+
+    def run_bulk(self, operation, *args):
+        """Run a BulkEditor operation, reporting a rejected edit instead of raising."""
+        try:
+            result = getattr(self.editor, operation)(*args)
+        except ValueError as error:
+            messagebox.showerror("Bulk Edit", str(error))
+            return None
+        self.apply_bulk_result(result)
+        return result
+
+    def apply_bulk_result(self, result):
+        """Bring the view and hash index in line with a bulk edit in one pass."""
+        if result is None:
+            return
+        for path in result.removed_paths:
+            self.hash_index.remove(path)
+        if result.removed:
+            self.view.remove_rows(result.removed)
+        if result.added:
+            for mod_id in result.added:
+                if path := self.library.records[mod_id].path:
+                    self.hash_index.add(path)
+            self.view.append_rows(result.added)
+        self.view.refresh_rows(result.updated)
+        self.refresh_search()
+
+    def undo(self, event=None):
+        self.apply_bulk_result(self.editor.undo())
+
+    def redo(self, event=None):
+        self.apply_bulk_result(self.editor.redo())
+
+    def manage_tags(self):
+        selected_items = self.view.selection()
+
+        if not selected_items:
+            messagebox.showerror(
+                "Error", "Please select a mod to manage tags.")
+            return
+
+        manage_tags_window = tk.Toplevel(self.parent)
+        manage_tags_window.title("Manage Tags")
+        manage_tags_window.geometry("300x300")
+
+        tags_frame = ttk.Frame(manage_tags_window)
+        tags_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        tags_label = ttk.Label(tags_frame, text="Custom Tags:")
+        tags_label.pack(side=tk.TOP)
+
+        tags_listbox = tk.Listbox(tags_frame, selectmode=tk.MULTIPLE)
+        tags_listbox.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+        # Load tags for the selected mod(s)
+        tags_to_load = set()
+        for item in selected_items:
+            tags_to_load.update(self.record_for_item(item).tags)
+        for tag in tags_to_load:
+            tags_listbox.insert(tk.END, tag)
+
+        tag_var = tk.StringVar()
+        tag_combobox = ttk.Combobox(tags_frame, textvariable=tag_var)
+        tag_combobox.pack(side=tk.TOP, fill=tk.X, pady=(5, 0))
+        tag_combobox.configure(postcommand=lambda: self.suggest_tags(tag_combobox))
+        tag_combobox.bind('<KeyRelease>', lambda event: self.suggest_tags(tag_combobox))
+        tag_combobox.bind('<Return>', lambda event: self.add_tag(tags_listbox, tag_var))
+
+        add_tag_button = ttk.Button(
+            tags_frame, text="Add Tag", command=lambda: self.add_tag(tags_listbox, tag_var))
+        add_tag_button.pack(side=tk.LEFT, padx=5, pady=10)
+        remove_tag_button = ttk.Button(
+            tags_frame, text="Remove Tag", command=lambda: self.remove_tag(tags_listbox))
+        remove_tag_button.pack(side=tk.LEFT, padx=5, pady=10)
+
+        # Apply the tags added or removed in the window to every selected mod
+        def on_close():
+            new_tags = tags_listbox.get(0, tk.END)
+            self.run_bulk(
+                "retag", selected_items,
+                [tag for tag in new_tags if tag not in tags_to_load],
+                [tag for tag in tags_to_load if tag not in new_tags])
+            manage_tags_window.destroy()
+
+        manage_tags_window.protocol("WM_DELETE_WINDOW", on_close)
+
+    def suggest_tags(self, tag_combobox):
+        """Offer the most used tags starting with what has been typed."""
+        tag_combobox["values"] = [
+            tag for tag, _count in self.library.tag_index.frequencies(
+                tag_combobox.get(), TAG_SUGGESTION_LIMIT)]
+
+    def add_tag(self, tags_listbox, tag_var):
+        # Add a tag to the listbox
+        new_tag = tag_var.get().strip()
+        if new_tag and new_tag not in tags_listbox.get(0, tk.END):
+            tags_listbox.insert(tk.END, new_tag)
+        tag_var.set("")
+
+    def remove_tag(self, tags_listbox):
+        if selected_tag := tags_listbox.curselection():
+            tags_listbox.delete(selected_tag)
+
+    @profiled("ui.save_mods")
+    def save_mods(self):
+        initial_file = os.path.basename(self.store.path) if self.store else None
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=LIBRARY_STORE_EXTENSION, initialfile=initial_file,
+            filetypes=[("ArchiStack library", f"*{LIBRARY_STORE_EXTENSION}"),
+                       ("JSON files", "*.json")],
+            title="Save Mods")
+        if not file_path:
+            return
+        if file_path.lower().endswith(".json"):
+            save_json_library(
+                file_path, [self.record_for_item(item) for item in self.view.row_ids])
+            return
+        self.open_store(file_path).save(self.hash_index.known_digest)
+
+    def open_store(self, file_path):
+        """Bind the library to the store at ``file_path``, reusing the open one."""
+        if self.store is not None and os.path.abspath(self.store.path) == os.path.abspath(file_path):
+            return self.store
+        if self.store is not None:
+            self.store.close()
+        self.store = LibraryStore(file_path)
+        self.store.attach(self.library)
+        return self.store
+
+    @profiled("ui.load_mods")
+    def load_mods(self):
+        if not (file_path := filedialog.askopenfilename(
+            defaultextension=LIBRARY_STORE_EXTENSION,
+            filetypes=[("ArchiStack library", f"*{LIBRARY_STORE_EXTENSION}"),
+                       ("JSON files", "*.json")],
+            title="Load Mods",
+        )):
+            return
+        self.search_matches = None
+        if file_path.lower().endswith(".json"):
+            load_json_library(file_path, self.library)
+        else:
+            if self.store is not None:
+                self.store.close()
+            self.store = LibraryStore(file_path)
+            self.store.load(self.library)
+        self.view.set_rows(self.library.records)
+        self.refresh_search()
+
+    def edit_mod(self):
+        if not (selected_items := self.view.selection()):
+            return
+        if len(selected_items) > 1:
+            self.show_bulk_edit()
+            return
+        for item in selected_items:
+            record = self.record_for_item(item)
+
+            new_mod_name = simpledialog.askstring(
+                "Edit Mod Name", "Enter the new mod name:", initialvalue=record.name)
+            new_mod_category = simpledialog.askstring(
+                "Edit Mod Category", "Enter the new mod category:", initialvalue=record.category)
+            new_mod_tags = simpledialog.askstring(
+                "Edit Mod Tags", "Enter the new mod tags (comma-separated):", initialvalue=record.tags_text)
+            new_mod_source = simpledialog.askstring(
+                "Edit Mod Source", "Enter the new mod source:", initialvalue=record.source)
+
+            if new_mod_name and new_mod_category and new_mod_tags and new_mod_source:
+                try:
+                    result = self.editor.set_fields(
+                        [record.id], f"Edit {record.name}", name=new_mod_name,
+                        category=new_mod_category, tags=parse_tags(new_mod_tags),
+                        source=new_mod_source)
+                except ValueError as error:
+                    messagebox.showerror("Error", str(error))
+                    continue
+                self.apply_bulk_result(result)
+
+
+SEARCH_DEBOUNCE_MS = 120
+TAG_SUGGESTION_LIMIT = 20
+PREVIEW_POLL_MS = 100
+PREVIEW_MEMORY_LIMIT = 256
+RULES_CHECK_MS = 2000
+SORT_FIELDS = {'Name': 'name', 'Category': 'category',
+               'Tags': 'tags_text', 'Source': 'source'}
+
+
+class VirtualTreeview:
+    """Show a large list of records through a small ``ttk.Treeview``.
+
+    The full row order lives in ``row_ids``; only the rows in the visible
+    window, plus ``BUFFER_ROWS`` extra, exist as Treeview items. Scrolling
+    re-renders that window instead of keeping one Tcl item per record, so
+    loading is near-instant and widget memory stays flat whatever the
+    library size. Selection and focus are tracked by record id in Python.
+    ``on_render`` is called with the record ids of each rendered window.
+    """
+
+    BUFFER_ROWS = 5
+
+    def __init__(self, treeview, scrollbar, get_record, get_tags=None, on_render=None):
+        self.treeview = treeview
+        self.scrollbar = scrollbar
+        self.get_record = get_record
+        self.get_tags = get_tags or (lambda record_id: ())
+        self.on_render = on_render
+        self.row_ids = []
+        self.selected_ids = set()
+        self.focus_id = None
+        self.first_row = 0
+        self.visible_rows = 20
+        self.rendered_ids = []
+        self._positions = None
+
+        self.scrollbar.configure(command=self.yview)
+        self.treeview.configure(yscrollcommand="")
+        self.treeview.bind('<Configure>', self._on_configure)
+        self.treeview.bind('<<TreeviewSelect>>', self._on_select)
+        self.treeview.bind('<MouseWheel>', self._on_mousewheel)
+        self.treeview.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.treeview.bind('<Button-5>', lambda event: self.scroll(3))
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    def index_of(self, record_id):
+        if self._positions is None:
+            self._positions = {
+                row_id: index for index, row_id in enumerate(self.row_ids)}
+        return self._positions.get(record_id)
+
+    def set_rows(self, record_ids):
+        """Replace the displayed rows, keeping the selection that still exists."""
+        self.row_ids = list(record_ids)
+        self._positions = None
+        present = set(self.row_ids)
+        self.selected_ids &= present
+        if self.focus_id not in present:
+            self.focus_id = None
+        self.render()
+
+    def append_rows(self, record_ids):
+        self.row_ids.extend(record_ids)
+        self._positions = None
+        self.render()
+
+    def remove_rows(self, record_ids):
+        removed = set(record_ids)
+        self.row_ids = [row_id for row_id in self.row_ids if row_id not in removed]
+        self._positions = None
+        self.selected_ids -= removed
+        if self.focus_id in removed:
+            self.focus_id = None
+        self.render()
+
+    def refresh_rows(self, record_ids):
+        """Redraw rows whose record or tags changed, if they are on screen."""
+        record_ids = set(record_ids)
+        for record_id in self.rendered_ids:
+            if record_id in record_ids:
+                self.treeview.item(
+                    str(record_id), values=self.get_record(record_id).values(),
+                    tags=self.get_tags(record_id))
+
+    def selection(self):
+        """Return the selected record ids in display order."""
+        return sorted((record_id for record_id in self.selected_ids
+                       if self.index_of(record_id) is not None), key=self.index_of)
+
+    def yview(self, *args):
+        """Scrollbar command: handle ``moveto`` and ``scroll`` requests."""
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self.first_row = int(float(args[1]) * len(self.row_ids))
+            self.render()
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            self.scroll(amount * self.visible_rows if args[2] == 'pages' else amount)
+
+    def scroll(self, rows):
+        self.first_row += rows
+        self.render()
+        return "break"
+
+    def see(self, record_id):
+        """Scroll just enough to make the row visible."""
+        if (index := self.index_of(record_id)) is None:
+            return
+        if index < self.first_row:
+            self.first_row = index
+        elif index >= self.first_row + self.visible_rows:
+            self.first_row = index - self.visible_rows + 1
+        self.render()
+
+    def move_focus(self, delta):
+        """Move focus and selection by ``delta`` rows, as the arrow keys do."""
+        if not self.row_ids:
+            return "break"
+        index = self.index_of(self.focus_id)
+        index = 0 if index is None else min(
+            max(index + delta, 0), len(self.row_ids) - 1)
+        self.focus_id = self.row_ids[index]
+        self.selected_ids = {self.focus_id}
+        self.see(self.focus_id)
+        return "break"
+
+    @profiled("view.render")
+    def render(self):
+        """Materialize the current window of rows in the Treeview."""
+        total = len(self.row_ids)
+        self.first_row = max(0, min(self.first_row, total - self.visible_rows))
+        window = self.row_ids[self.first_row:
+                              self.first_row + self.visible_rows + self.BUFFER_ROWS]
+
+        if self.rendered_ids:
+            self.treeview.delete(*(str(record_id) for record_id in self.rendered_ids))
+        for record_id in window:
+            self.treeview.insert('', 'end', iid=str(record_id),
+                                 values=self.get_record(record_id).values(),
+                                 tags=self.get_tags(record_id))
+        self.rendered_ids = window
+
+        self.treeview.selection_set(
+            [str(record_id) for record_id in window if record_id in self.selected_ids])
+        if self.focus_id in window:
+            self.treeview.focus(str(self.focus_id))
+        self.treeview.yview_moveto(0)
+
+        if total:
+            self.scrollbar.set(self.first_row / total,
+                               min(1.0, (self.first_row + self.visible_rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        if self.on_render is not None:
+            self.on_render(window)
+
+    def _on_configure(self, event):
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        visible_rows = max(1, event.height // row_height - 1)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.render()
+
+    def _on_select(self, event):
+        rendered = {str(record_id): record_id for record_id in self.rendered_ids}
+        selected = {rendered[item] for item in self.treeview.selection()
+                    if item in rendered}
+        self.selected_ids = (self.selected_ids - set(self.rendered_ids)) | selected
+        if (focus := self.treeview.focus()) in rendered:
+            self.focus_id = rendered[focus]
+
+    def _on_mousewheel(self, event):
+        step = -1 if event.delta > 0 else 1
+        return self.scroll(step * max(1, abs(event.delta) // 120) * 3)
+
+
+class BulkEditWindow(tk.Toplevel):
+    """A window applying one edit to the selected mods or the search results."""
+
+    ACTIONS = (("Set category", "set_category"), ("Add tags", "add_tags"),
+               ("Remove tags", "remove_tags"), ("Rename (regex)", "rename"),
+               ("Delete", "delete"))
+
+    def __init__(self, frame):
+        super().__init__(frame.parent)
+        self.frame = frame
+        self.title("Bulk Edit")
+        self.resizable(False, False)
+        self.protocol("WM_DELETE_WINDOW", self.withdraw)
+
+        self.scope = tk.StringVar(value="selection")
+        self.action = tk.StringVar(value="set_category")
+        self.value_var = tk.StringVar()
+        self.replacement_var = tk.StringVar()
+
+        scope_frame = ttk.LabelFrame(self, text="Apply to")
+        scope_frame.grid(row=0, column=0, columnspan=2, padx=10, pady=(10, 5), sticky=tk.EW)
+        self.selection_radio = ttk.Radiobutton(
+            scope_frame, variable=self.scope, value="selection")
+        self.selection_radio.pack(anchor=tk.W, padx=5)
+        self.search_radio = ttk.Radiobutton(
+            scope_frame, variable=self.scope, value="search")
+        self.search_radio.pack(anchor=tk.W, padx=5)
+
+        action_frame = ttk.LabelFrame(self, text="Action")
+        action_frame.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky=tk.EW)
+        for label, action in self.ACTIONS:
+            ttk.Radiobutton(action_frame, text=label, variable=self.action,
+                            value=action).pack(anchor=tk.W, padx=5)
+
+        ttk.Label(self, text="Value:").grid(row=2, column=0, padx=10, pady=5, sticky=tk.W)
+        ttk.Entry(self, textvariable=self.value_var).grid(
+            row=2, column=1, padx=10, pady=5, sticky=tk.EW)
+        ttk.Label(self, text="Replacement:").grid(row=3, column=0, padx=10, pady=5, sticky=tk.W)
+        ttk.Entry(self, textvariable=self.replacement_var).grid(
+            row=3, column=1, padx=10, pady=5, sticky=tk.EW)
+
+        ttk.Button(self, text="Apply", command=self.apply).grid(
+            row=4, column=1, padx=10, pady=(5, 10), sticky=tk.E)
+        self.refresh_scope()
+
+    def refresh_scope(self):
+        """Update the scope labels with the current selection and search sizes."""
+        self.selection_radio.config(text=f"Selected mods ({len(self.frame.view.selection())})")
+        if (results := self.frame.search_result_ids()) is None:
+            self.search_radio.config(text="Search results (no active search)", state=tk.DISABLED)
+            self.scope.set("selection")
+        else:
+            self.search_radio.config(text=f"Search results ({len(results)})", state=tk.NORMAL)
+
+    def apply(self):
+        if self.scope.get() == "search":
+            mod_ids = self.frame.search_result_ids() or []
+        else:
+            mod_ids = self.frame.view.selection()
+        if not mod_ids:
+            messagebox.showerror("Bulk Edit", "There are no mods to edit.", parent=self)
+            return
+        action, value = self.action.get(), self.value_var.get()
+        if action == "delete":
+            if not messagebox.askyesno(
+                    "Bulk Edit", f"Remove {len(mod_ids)} mods from the library?", parent=self):
+                return
+            self.frame.run_bulk(action, mod_ids)
+        elif action == "rename":
+            self.frame.run_bulk(action, mod_ids, value, self.replacement_var.get())
+        elif not value.strip():
+            messagebox.showerror("Bulk Edit", "Enter a value first.", parent=self)
+            return
+        else:
+            self.frame.run_bulk(action, mod_ids, value.strip())
+        self.refresh_scope()
+
+
+class ConflictsWindow(tk.Toplevel):
+    """Pairs of packages that contain the same resources, most overlap first."""
+
+    KEY_PREVIEW_LIMIT = 20
+
+    def __init__(self, frame):
+        super().__init__(frame.parent)
+        self.frame = frame
+        self.title("Conflicts")
+        self.geometry("720x420")
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+        self.rows = {}
+
+        self.status_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.status_var).grid(
+            row=0, column=0, padx=10, pady=(10, 5), sticky=tk.W)
+        ttk.Button(self, text="Re-analyze", command=frame.analyze_conflicts).grid(
+            row=0, column=1, padx=10, pady=(10, 5))
+
+        self.conflict_tree = ttk.Treeview(self, columns=(
+            'Mod', 'Conflicts With', 'Shared Resources'), show='headings', selectmode="browse")
+        for column in self.conflict_tree["columns"]:
+            self.conflict_tree.heading(column, text=column)
+        self.conflict_tree.column('Shared Resources', width=120, anchor=tk.E)
+        self.conflict_tree.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky=tk.NSEW)
+        self.conflict_tree.bind('<<TreeviewSelect>>', self.show_keys)
+        self.conflict_tree.bind('<Double-1>', self.reveal_mod)
+
+        self.keys_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.keys_var, wraplength=680, justify=tk.LEFT).grid(
+            row=2, column=0, columnspan=2, padx=10, pady=(5, 10), sticky=tk.W)
+        if frame.conflicts is not None:
+            self.show(frame.conflicts)
+
+    def set_status(self, text):
+        self.status_var.set(text)
+
+    def show(self, conflicts):
+        self.conflict_tree.delete(*self.conflict_tree.get_children())
+        self.rows = {}
+        for first, second, count in conflicts:
+            item = self.conflict_tree.insert('', 'end', values=(
+                self.frame.mod_label(first), self.frame.mod_label(second), count))
+            self.rows[item] = (first, second)
+        detector = self.frame.conflict_detector
+        self.set_status(f"{len(conflicts)} conflicting pairs among {len(detector)} packages "
+                        f"({detector.files_read} read this time).")
+        self.keys_var.set("")
+
+    def show_keys(self, event=None):
+        if self.frame.analyzing_conflicts:
+            return
+        if (selection := self.conflict_tree.selection()) and selection[0] in self.rows:
+            keys = self.frame.conflict_detector.shared_keys(*self.rows[selection[0]])
+            shown = [format_resource_key(key) for key in keys[:self.KEY_PREVIEW_LIMIT]]
+            if len(keys) > len(shown):
+                shown.append(f"...and {len(keys) - len(shown)} more")
+            self.keys_var.set("Shared resources (type:group:instance):\n" + "\n".join(shown))
+
+    def reveal_mod(self, event=None):
+        """Select the first mod of the double-clicked pair in the main list."""
+        if (selection := self.conflict_tree.selection()) and selection[0] in self.rows:
+            if (record := self.frame.library.find_path(self.rows[selection[0]][0])) is not None:
+                view = self.frame.view
+                view.selected_ids = {record.id}
+                view.focus_id = record.id
+                view.see(record.id)
+
+
+class MergeWindow(tk.Toplevel):
+    """Merge the selected mods or a category into merged packages, or undo a merge."""
+
+    def __init__(self, frame):
+        super().__init__(frame.parent)
+        self.frame = frame
+        self.title("Merge Packages")
+        self.resizable(False, False)
+        self.protocol("WM_DELETE_WINDOW", self.withdraw)
+
+        self.scope = tk.StringVar(value="selection")
+        self.category_var = tk.StringVar()
+        self.keep_sources = tk.BooleanVar(value=True)
+        self.status_var = tk.StringVar()
+
+        scope_frame = ttk.LabelFrame(self, text="Merge")
+        scope_frame.grid(row=0, column=0, columnspan=2, padx=10, pady=(10, 5), sticky=tk.EW)
+        self.selection_radio = ttk.Radiobutton(
+            scope_frame, variable=self.scope, value="selection")
+        self.selection_radio.grid(row=0, column=0, columnspan=2, padx=5, sticky=tk.W)
+        ttk.Radiobutton(scope_frame, text="Category:", variable=self.scope,
+                        value="category").grid(row=1, column=0, padx=5, sticky=tk.W)
+        self.category_combobox = ttk.Combobox(
+            scope_frame, textvariable=self.category_var, state="readonly")
+        self.category_combobox.grid(row=1, column=1, padx=5, pady=(0, 5), sticky=tk.W)
+        ttk.Checkbutton(self, text="Keep the original packages", variable=self.keep_sources).grid(
+            row=1, column=0, columnspan=2, padx=10, pady=5, sticky=tk.W)
+
+        ttk.Button(self, text="Merge...", command=self.merge).grid(
+            row=2, column=0, padx=10, pady=5, sticky=tk.W)
+        ttk.Button(self, text="Unmerge...", command=self.unmerge).grid(
+            row=2, column=1, padx=10, pady=5, sticky=tk.E)
+        ttk.Label(self, textvariable=self.status_var, wraplength=320).grid(
+            row=3, column=0, columnspan=2, padx=10, pady=(5, 10), sticky=tk.W)
+        self.refresh_scope()
+
+    def set_status(self, text):
+        self.status_var.set(text)
+
+    def refresh_scope(self):
+        self.selection_radio.config(
+            text=f"Selected mods ({len(self.frame.view.selection())})")
+        categories = sorted({record.category for record in self.frame.library})
+        self.category_combobox.config(values=categories)
+        if self.category_var.get() not in categories:
+            self.category_var.set(categories[0] if categories else "")
+
+    def package_records(self):
+        if self.scope.get() == "category":
+            records = [record for record in self.frame.library
+                       if record.category == self.category_var.get()]
+        else:
+            records = [self.frame.library.get(mod_id) for mod_id in self.frame.view.selection()]
+        return [record for record in records
+                if record.path and record.path.lower().endswith('.package')]
+
+    def merge(self):
+        if self.frame.merging:
+            return
+        if not (records := self.package_records()):
+            messagebox.showerror("Merge", "There are no package files to merge.", parent=self)
+            return
+        categories = {record.category for record in records}
+        category = categories.pop() if len(categories) == 1 else "Other"
+        if manifest_path := filedialog.asksaveasfilename(
+                parent=self, title="Merge Into", defaultextension=MERGE_MANIFEST_SUFFIX,
+                initialdir=os.path.dirname(records[0].path),
+                initialfile=f"{category.replace('/', ' ')} Merged{MERGE_MANIFEST_SUFFIX}",
+                confirmoverwrite=False,
+                filetypes=[("Merge set", f"*{MERGE_MANIFEST_SUFFIX}")]):
+            if not self.keep_sources.get() and not messagebox.askyesno(
+                    "Merge", f"Delete the {len(records)} original packages once they are merged?\n"
+                             "Each is checked to rebuild exactly with Unmerge first; "
+                             "any that don't are kept.", parent=self):
+                return
+            self.set_status(f"Merging {len(records)} packages...")
+            self.frame.start_merge(manifest_path, "merge", [record.path for record in records],
+                                   category, not self.keep_sources.get())
+
+    def unmerge(self):
+        if self.frame.merging:
+            return
+        if manifest_path := filedialog.askopenfilename(
+                parent=self, title="Unmerge",
+                filetypes=[("Merge set", f"*{MERGE_MANIFEST_SUFFIX}")]):
+            self.set_status("Restoring packages...")
+            self.frame.start_merge(manifest_path, "unmerge")
+
+
+class PerformanceWindow(tk.Toplevel):
+    """Live timing spans and counters from the profiler, with trace export."""
+
+    REFRESH_MS = 500
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Performance")
+        self.geometry("640x360")
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        self.enabled_var = tk.BooleanVar(value=PROFILER.enabled)
+        ttk.Checkbutton(self, text="Record timings", variable=self.enabled_var,
+                        command=self.toggle).grid(row=0, column=0, padx=10, pady=(10, 5),
+                                                  sticky=tk.W)
+        ttk.Button(self, text="Reset", command=PROFILER.reset).grid(
+            row=0, column=1, padx=5, pady=(10, 5))
+        ttk.Button(self, text="Save Trace...", command=self.save_trace).grid(
+            row=0, column=2, padx=(5, 10), pady=(10, 5))
+
+        self.stats_tree = ttk.Treeview(self, columns=(
+            'Span', 'Calls', 'Total ms', 'Mean ms', 'Max ms'), show='headings')
+        for column in self.stats_tree["columns"]:
+            self.stats_tree.heading(column, text=column)
+            self.stats_tree.column(column, width=80, anchor=tk.E)
+        self.stats_tree.column('Span', width=220, anchor=tk.W)
+        self.stats_tree.grid(row=1, column=0, columnspan=3, padx=10, pady=5, sticky=tk.NSEW)
+
+        self.counters_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.counters_var, wraplength=600).grid(
+            row=2, column=0, columnspan=3, padx=10, pady=(5, 10), sticky=tk.W)
+        self.refresh()
+
+    def toggle(self):
+        if self.enabled_var.get():
+            PROFILER.enable(trace=True)
+        else:
+            PROFILER.disable()
+
+    def save_trace(self):
+        if file_path := filedialog.asksaveasfilename(
+                parent=self, defaultextension=".json", title="Save Trace",
+                filetypes=[("Chrome trace", "*.json")]):
+            PROFILER.dump_trace(file_path)
+
+    def refresh(self):
+        if not self.winfo_exists():
+            return
+        if self.winfo_viewable():
+            spans, counters = PROFILER.snapshot()
+            self.stats_tree.delete(*self.stats_tree.get_children())
+            for name, calls, total, mean, longest in spans:
+                self.stats_tree.insert('', 'end', values=(
+                    name, calls, f"{total * 1000:.1f}", f"{mean * 1000:.3f}",
+                    f"{longest * 1000:.1f}"))
+            self.counters_var.set("  ".join(
+                f"{name}: {value:,}" for name, value in sorted(counters.items())))
+        self.after(self.REFRESH_MS, self.refresh)
+
+
+class ArchiveInspectWindow(tk.Toplevel):
+    """An archive's members with their predicted category and status, to pick from.
+
+    Click a row (or press space) to tick or untick it; only ticked members
+    are extracted. New members start ticked, duplicates and conflicts don't.
+    """
+
+    CHECKED = "\u2611"
+    UNCHECKED = "\u2610"
+    POLL_MS = 100
+
+    def __init__(self, app, archive_path, destination_path):
+        super().__init__(app)
+        self.app = app
+        self.archive_path = archive_path
+        self.destination_path = destination_path
+        self.title(f"Inspect {os.path.basename(archive_path)}")
+        self.geometry("760x420")
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        self.entries = {}
+        self.checked = set()
+        self.results = queue.Queue()
+
+        self.member_tree = ttk.Treeview(self, columns=(
+            'Extract', 'Member', 'Category', 'Size', 'Status'), show='headings', selectmode="browse")
+        for column in self.member_tree["columns"]:
+            self.member_tree.heading(column, text=column)
+        self.member_tree.column('Extract', width=60, anchor=tk.CENTER, stretch=False)
+        self.member_tree.column('Member', width=280)
+        self.member_tree.column('Size', width=90, anchor=tk.E)
+        self.member_tree.tag_configure("conflict", foreground="red")
+        self.member_tree.tag_configure("duplicate", foreground="gray")
+        self.member_tree.grid(row=0, column=0, columnspan=5, padx=10, pady=(10, 5), sticky=tk.NSEW)
+        self.member_tree.bind('<ButtonRelease-1>', self.toggle_clicked)
+        self.member_tree.bind('<space>', self.toggle_selected)
+
+        self.status_var = tk.StringVar(value="Reading archive...")
+        ttk.Label(self, textvariable=self.status_var).grid(
+            row=1, column=0, padx=10, pady=(5, 10), sticky=tk.W)
+        ttk.Button(self, text="All", command=lambda: self.check(self.entries)).grid(
+            row=1, column=1, pady=(5, 10))
+        ttk.Button(self, text="None", command=lambda: self.check(())).grid(
+            row=1, column=2, pady=(5, 10))
+        ttk.Button(self, text="Only New", command=self.check_new).grid(
+            row=1, column=3, pady=(5, 10))
+        self.extract_button = ttk.Button(
+            self, text="Extract Selected", command=self.extract, state=tk.DISABLED)
+        self.extract_button.grid(row=1, column=4, padx=10, pady=(5, 10))
+
+        threading.Thread(target=self._inspect_worker, daemon=True).start()
+        self.after(self.POLL_MS, self._poll_inspection)
+
+    def _inspect_worker(self):
+        try:
+            self.results.put(inspect_archive(
+                self.archive_path, self.destination_path, self.app.hash_index))
+        except (OSError, ValueError) as error:
+            self.results.put(error)
+
+    def _poll_inspection(self):
+        if not self.winfo_exists():
+            return
+        try:
+            result = self.results.get_nowait()
+        except queue.Empty:
+            self.after(self.POLL_MS, self._poll_inspection)
+            return
+        if isinstance(result, Exception):
+            self.status_var.set(f"Could not read the archive: {result}")
+            return
+        for entry in result:
+            size = format_size(entry.member.size) if entry.member.size is not None else "?"
+            item = self.member_tree.insert('', 'end', values=(
+                "", entry.member.name, entry.category, size,
+                f"{entry.status}: {entry.note}" if entry.note else entry.status),
+                tags=(entry.status,))
+            self.entries[item] = entry
+        self.check_new()
+        self.extract_button.config(state=tk.NORMAL)
+
+    def check(self, items):
+        self.checked = set(items)
+        for item in self.entries:
+            self.member_tree.set(
+                item, 'Extract', self.CHECKED if item in self.checked else self.UNCHECKED)
+        self.update_status()
+
+    def check_new(self):
+        self.check(item for item, entry in self.entries.items() if entry.status == "new")
+
+    def toggle(self, item):
+        if item not in self.entries:
+            return
+        self.checked ^= {item}
+        self.member_tree.set(
+            item, 'Extract', self.CHECKED if item in self.checked else self.UNCHECKED)
+        self.update_status()
+
+    def toggle_clicked(self, event):
+        if self.member_tree.identify_region(event.x, event.y) == "cell":
+            self.toggle(self.member_tree.identify_row(event.y))
+
+    def toggle_selected(self, event=None):
+        for item in self.member_tree.selection():
+            self.toggle(item)
+
+    def update_status(self):
+        statuses = [entry.status for entry in self.entries.values()]
+        size = sum(self.entries[item].member.size or 0 for item in self.checked)
+        self.status_var.set(
+            f"{len(self.checked)} of {len(self.entries)} selected ({format_size(size)}); "
+            f"{statuses.count('duplicate')} duplicates, {statuses.count('conflict')} conflicts")
+
+    def extract(self):
+        if not self.checked:
+            messagebox.showinfo("Inspect Archive", "No members are selected.", parent=self)
+            return
+        members = [self.entries[item].member.name for item in self.member_tree.get_children()
+                   if item in self.checked]
+        self.app.extract_members(self.archive_path, self.destination_path, members)
+        self.destroy()
+
+
+class ExtractionProgressWindow(tk.Toplevel):
+    """A window listing queued extractions with progress and cancel controls."""
+
+    def __init__(self, parent, manager):
+        super().__init__(parent)
+        self.manager = manager
+        self.title("Extractions")
+        self.geometry("640x300")
+        self.protocol("WM_DELETE_WINDOW", self.withdraw)
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.job_tree = ttk.Treeview(self, columns=(
+            'Archive', 'Status', 'Files', 'Size', 'Speed'), show='headings', selectmode="extended")
+        for column in self.job_tree["columns"]:
+            self.job_tree.heading(column, text=column)
+        self.job_tree.column('Archive', width=220)
+        self.job_tree.grid(row=0, column=0, columnspan=3,
+                           padx=10, pady=(10, 5), sticky=tk.NSEW)
+
+        self.progress_bar = ttk.Progressbar(
+            self, orient='horizontal', mode='determinate', maximum=100)
+        self.progress_bar.grid(row=1, column=0, columnspan=3,
+                               padx=10, pady=5, sticky=tk.EW)
+
+        self.summary_var = tk.StringVar()
+        self.summary_label = ttk.Label(self, textvariable=self.summary_var)
+        self.summary_label.grid(row=2, column=0, padx=10,
+                                pady=(5, 10), sticky=tk.W)
+
+        self.cancel_button = ttk.Button(
+            self, text="Cancel Selected", command=self.cancel_selected)
+        self.cancel_button.grid(row=2, column=1, padx=5, pady=(5, 10))
+        self.cancel_all_button = ttk.Button(
+            self, text="Cancel All", command=self.manager.cancel_all)
+        self.cancel_all_button.grid(row=2, column=2, padx=(5, 10), pady=(5, 10))
+
+        self.jobs_by_item = {}
+        self.refresh()
+
+    def cancel_selected(self):
+        for item in self.job_tree.selection():
+            if job := self.jobs_by_item.get(item):
+                job.cancel()
+
+    def refresh(self):
+        """Update the job rows and the overall progress bar."""
+        for job in self.manager.jobs:
+            item = str(id(job))
+            if item not in self.jobs_by_item:
+                self.jobs_by_item[item] = job
+                self.job_tree.insert('', 'end', iid=item)
+
+            files = f"{job.files_done}/{job.total_files}" if job.total_files is not None else str(
+                job.files_done)
+            if notes := ", ".join(f"{count} {label}" for count, label in (
+                    (job.duplicates, "duplicates"), (job.renamed, "renamed"),
+                    (job.skipped, "skipped"), (job.overwritten, "overwritten")) if count):
+                files = f"{files} ({notes})"
+            size = format_size(job.bytes_done)
+            if job.total_bytes:
+                size = f"{size} / {format_size(job.total_bytes)}"
+            speed = f"{format_size(job.throughput())}/s" if job.started_at else ""
+            status = job.status if job.error is None else f"Failed: {job.error}"
+            self.job_tree.item(item, values=(
+                job.name, status, files, size, speed))
+
+        running = [job for job in self.manager.jobs if not job.finished]
+        known_totals = all(job.total_bytes is not None for job in running)
+        if running and not known_totals:
+            if str(self.progress_bar["mode"]) != "indeterminate":
+                self.progress_bar.config(mode="indeterminate")
+                self.progress_bar.start(50)
+        else:
+            if str(self.progress_bar["mode"]) != "determinate":
+                self.progress_bar.stop()
+                self.progress_bar.config(mode="determinate")
+            total = sum(job.total_bytes or 0 for job in self.manager.jobs)
+            done = sum(job.bytes_done for job in self.manager.jobs)
+            self.progress_bar["value"] = 100 * done / total if total else (
+                0 if running else 100)
+
+        files_done = sum(job.files_done for job in self.manager.jobs)
+        bytes_done = sum(job.bytes_done for job in self.manager.jobs)
+        speed = sum(job.throughput() for job in running)
+        self.summary_var.set(
+            f"{len(running)} active, {files_done} files, "
+            f"{format_size(bytes_done)} at {format_size(speed)}/s")
+
+
+class ToolTip:
+    def __init__(self, widget, text):
+        self.widget = widget
+        self.text = text
+        self.tooltip_window = None
+
+    def show(self, event):
+        """Show the tooltip."""
+        x, y, _, _ = self.widget.bbox("insert")
+        x += self.widget.winfo_rootx() + 25
+        y += self.widget.winfo_rooty() + 25
+
+        self.tooltip_window = tk.Toplevel(self.widget)
+        self.tooltip_window.wm_overrideredirect(True)
+        self.tooltip_window.wm_geometry(f"+{x}+{y}")
+
+        label = ttk.Label(self.tooltip_window, text=self.text,
+                          background="#ffffe0", relief="solid", borderwidth=1)
+        label.pack()
+
+    def hide(self, event):
+        """Hide the tooltip."""
+        if self.tooltip_window:
+            self.tooltip_window.destroy()
+            self.tooltip_window = None
+
+
+if __name__ == "__main__":
+    app = ArchiStackApp()
+    app.mainloop()
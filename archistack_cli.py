@@ -0,0 +1,325 @@
+"""Command line interface to the ArchiStack engine.
+
+Every subcommand prints one JSON object per line, so the output can be
+piped into other tools. Run without a subcommand (or with ``gui``) to start
+the desktop app; Tk is only imported in that case.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from archistack_engine import (
+    ARCHIVE_CLASSIFIER, AUTOSAVE_JOURNAL_FILE, AUTOSAVE_SNAPSHOT_FILE, BatchExtraction,
+    ConflictDetector, ExtractionJob, HashIndex, LIBRARY_STORE_EXTENSION, LibraryJournal, LibraryScanner,
+    LibraryStore, MERGE_PACKAGE_LIMIT, MOD_CLASSIFIER, MOD_FILE_EXTENSIONS, ModLibrary,
+    PROFILER, PackageMerger, RULES_FILE, RuleSet, find_archives, inspect_archive, load_json_library,
+)
+
+
+def emit(record):
+    sys.stdout.write(json.dumps(record) + "\n")
+
+
+def expand_paths(paths, extensions):
+    """Yield files from ``paths``, walking directories for matching extensions."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if os.path.splitext(name)[1].lower() in extensions:
+                    yield os.path.join(directory, name)
+
+
+def command_extract(args):
+    archive_paths = []
+    for path in args.archives:
+        archive_paths.extend(find_archives(path) if os.path.isdir(path) else [path])
+    if not archive_paths:
+        emit({"event": "error", "message": "no archives found"})
+        return 1
+    if args.members and len(archive_paths) > 1:
+        emit({"event": "error", "message": "--member needs a single archive"})
+        return 1
+
+    hash_index = None
+    if args.hash_index:
+        hash_index = HashIndex(args.hash_index)
+        hash_index.load()
+    jobs = [ExtractionJob(path, args.destination, members=args.members)
+            for path in sorted(archive_paths)]
+    summary = BatchExtraction(
+        jobs, args.destination, args.collision, args.workers, hash_index).run()
+    if hash_index is not None:
+        hash_index.save()
+
+    for job in jobs:
+        record = {"event": "archive", "archive": job.archive_path,
+                  "status": job.status.lower(), "files": job.files_done,
+                  "bytes": job.bytes_done}
+        if job.error is not None:
+            record["error"] = str(job.error)
+        emit(record)
+    emit({"event": "summary", "archives": summary.archives, "files": summary.files,
+          "bytes": summary.bytes, "duplicates": summary.duplicates,
+          "renamed": summary.renamed, "skipped": summary.skipped,
+          "overwritten": summary.overwritten, "categories": dict(summary.categories),
+          "failed": summary.failed, "elapsed": round(summary.elapsed, 3)})
+    return 1 if summary.failed else 0
+
+
+def command_inspect(args):
+    hash_index = None
+    if args.hash_index:
+        hash_index = HashIndex(args.hash_index)
+        hash_index.load()
+    try:
+        inspected = inspect_archive(args.archive, args.destination, hash_index)
+    except (OSError, ValueError) as error:
+        emit({"event": "error", "message": str(error)})
+        return 1
+    for entry in inspected:
+        record = {"event": "member", "name": entry.member.name, "size": entry.member.size,
+                  "category": entry.category, "status": entry.status}
+        if entry.member.compressed_size is not None:
+            record["compressed_size"] = entry.member.compressed_size
+        if entry.note:
+            record["note"] = entry.note
+        emit(record)
+    statuses = [entry.status for entry in inspected]
+    emit({"event": "summary", "members": len(inspected),
+          "bytes": sum(entry.member.size or 0 for entry in inspected),
+          **{status: statuses.count(status) for status in ("new", "duplicate", "conflict")}})
+    return 0
+
+
+def command_scan(args):
+    scanner = LibraryScanner(args.folder, args.snapshot)
+    scanner.load()
+    result = scanner.scan(verify_files=args.verify_files)
+    paths = result.added + result.modified
+    categories = MOD_CLASSIFIER.classify_files(paths, not args.names_only)
+    category_for = dict(zip(paths, categories))
+    scanner.save()
+
+    for event, changed in (("added", result.added), ("modified", result.modified)):
+        for path in changed:
+            emit({"event": event, "path": path, "category": category_for[path]})
+    for path in result.removed:
+        emit({"event": "removed", "path": path})
+    emit({"event": "summary", "files": result.total_files, "added": len(result.added),
+          "modified": len(result.modified), "removed": len(result.removed),
+          "dirs_scanned": result.dirs_scanned, "dirs_reused": result.dirs_reused,
+          "elapsed": round(result.elapsed, 3)})
+    return 0
+
+
+def command_classify(args):
+    classifier = ARCHIVE_CLASSIFIER if args.archive_categories else MOD_CLASSIFIER
+    paths = list(expand_paths(args.paths, MOD_FILE_EXTENSIONS))
+    categories = classifier.classify_files(paths, not args.names_only)
+    rules = RuleSet(args.rules, args.rule_cache)
+    try:
+        rules.load()
+    except ValueError as error:
+        emit({"event": "error", "message": str(error)})
+        return 1
+    for path, category, result in zip(paths, categories, rules.evaluate_many(paths)):
+        emit({"path": path, "category": result.category or category,
+              "source": result.source or "Unknown", "tags": result.tags})
+    rules.save()
+    return 0
+
+
+def command_conflicts(args):
+    started = time.perf_counter()
+    detector = ConflictDetector(args.cache, args.workers)
+    detector.load()
+    paths = list(expand_paths(args.paths, ('.package',)))
+    conflicts = detector.analyze(paths)
+    detector.save()
+    for first, second, shared in conflicts:
+        emit({"event": "conflict", "first": first, "second": second, "shared": shared})
+    emit({"event": "summary", "packages": len(detector), "read": detector.files_read,
+          "conflicts": len(conflicts), "elapsed": round(time.perf_counter() - started, 3)})
+    return 0
+
+
+def emit_merge_result(result):
+    for key in ("merged", "skipped", "written", "deleted", "removed_sources", "kept_sources"):
+        for path in getattr(result, key):
+            emit({"event": key, "path": path})
+    emit({"event": "summary", "merged": len(result.merged), "unchanged": result.unchanged,
+          "skipped": len(result.skipped), "written": len(result.written),
+          "deleted": len(result.deleted)})
+
+
+def command_merge(args):
+    merger = PackageMerger(args.manifest, args.limit_mb * 1024 * 1024)
+    merger.load()
+    paths = list(expand_paths(args.paths, ('.package',)))
+    emit_merge_result(merger.merge(paths, remove_sources=args.remove_sources))
+    return 0
+
+
+def command_unmerge(args):
+    if not os.path.exists(args.manifest):
+        emit({"event": "error", "message": f"{args.manifest} does not exist"})
+        return 1
+    merger = PackageMerger(args.manifest)
+    merger.load()
+    emit_merge_result(merger.unmerge(args.paths or None))
+    return 0
+
+
+def command_export(args):
+    library = ModLibrary()
+    if args.library is None:
+        # The GUI may be appending to the autosave, so only read it
+        try:
+            LibraryJournal(AUTOSAVE_SNAPSHOT_FILE, AUTOSAVE_JOURNAL_FILE).recover(
+                library, read_only=True)
+        except (KeyError, OSError, TypeError, ValueError) as error:
+            emit({"event": "error", "message": f"The autosave could not be read: {error}"})
+            return 1
+    elif not os.path.exists(args.library):
+        emit({"event": "error", "message": f"{args.library} does not exist"})
+        return 1
+    elif args.library.lower().endswith(".json"):
+        load_json_library(args.library, library)
+    else:
+        store = LibraryStore(args.library)
+        store.load(library)
+        store.close()
+
+    try:
+        matches = library.search(args.query or "")
+    except ValueError as error:
+        emit({"event": "error", "message": str(error)})
+        return 1
+    # A blank query gives None, meaning every record, as in the search box
+    records = (list(library) if matches is None
+               else [library.records[mod_id] for mod_id in sorted(matches)])
+    for record in records:
+        emit({"id": record.id, **record.to_dict()})
+    return 0
+
+
+def command_gui(args):
+    from ARCNE import ArchiStackApp
+
+    ArchiStackApp().mainloop()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="archistack", description="Extract, scan and catalogue Sims 4 mods.")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="record timing spans and write a Chrome trace to FILE")
+    subparsers = parser.add_subparsers(dest="command")
+
+    extract = subparsers.add_parser(
+        "extract", help="extract archives into category folders")
+    extract.add_argument("archives", nargs="+",
+                         help="archive files, or folders to search for archives")
+    extract.add_argument("-d", "--destination", required=True)
+    extract.add_argument("--collision", choices=("rename", "skip", "overwrite"),
+                         default="rename")
+    extract.add_argument("--workers", type=int, default=None)
+    extract.add_argument("--hash-index", default=None,
+                         help="skip files already recorded in this hash index")
+    extract.add_argument("--member", dest="members", action="append", default=None,
+                         help="only extract this member (repeatable; see inspect)")
+    extract.set_defaults(func=command_extract)
+
+    inspect = subparsers.add_parser(
+        "inspect", help="list an archive's members without extracting them")
+    inspect.add_argument("archive")
+    inspect.add_argument("-d", "--destination", default=None,
+                         help="flag members that clash with files already here")
+    inspect.add_argument("--hash-index", default=None,
+                         help="flag members already recorded in this hash index")
+    inspect.set_defaults(func=command_inspect)
+
+    scan = subparsers.add_parser(
+        "scan", help="report mod files added, changed or removed since the last scan")
+    scan.add_argument("folder")
+    scan.add_argument("--snapshot", default=None,
+                      help="snapshot file that makes rescans incremental")
+    scan.add_argument("--verify-files", action="store_true",
+                      help="stat every file to catch in-place edits")
+    scan.add_argument("--names-only", action="store_true",
+                      help="classify by file name without reading packages")
+    scan.set_defaults(func=command_scan)
+
+    classify = subparsers.add_parser("classify", help="print the category of mod files")
+    classify.add_argument("paths", nargs="+", help="files, or folders to search for mods")
+    classify.add_argument("--names-only", action="store_true",
+                          help="classify by file name without reading packages")
+    classify.add_argument("--archive-categories", action="store_true",
+                          help="use the extraction folder categories")
+    classify.add_argument("--rules", default=RULES_FILE,
+                          help="rules file giving categories, sources and tags "
+                               "(the built-in rules if it is missing)")
+    classify.add_argument("--rule-cache", default=None,
+                          help="cache file that makes reruns evaluate only changed files")
+    classify.set_defaults(func=command_classify)
+
+    conflicts = subparsers.add_parser(
+        "conflicts", help="list packages that override the same resources")
+    conflicts.add_argument("paths", nargs="+", help="packages, or folders to search for them")
+    conflicts.add_argument("--cache", default=None,
+                           help="per-package cache file that makes reruns incremental")
+    conflicts.add_argument("--workers", type=int, default=None)
+    conflicts.set_defaults(func=command_conflicts)
+
+    merge = subparsers.add_parser(
+        "merge", help="combine packages into a few large merged packages")
+    merge.add_argument("manifest", help="merge set manifest (NAME.merge.json), "
+                                        "created or extended; packages go next to it")
+    merge.add_argument("paths", nargs="+", help="packages, or folders to search for them")
+    merge.add_argument("--remove-sources", action="store_true",
+                       help="delete each source package once its exact rebuild from the "
+                            "merge set has been checked")
+    merge.add_argument("--limit-mb", type=int, default=MERGE_PACKAGE_LIMIT // (1024 * 1024),
+                       help="start a new merged package past this size")
+    merge.set_defaults(func=command_merge)
+
+    unmerge = subparsers.add_parser("unmerge", help="restore packages from a merge set")
+    unmerge.add_argument("manifest")
+    unmerge.add_argument("paths", nargs="*", help="sources to restore (default: all)")
+    unmerge.set_defaults(func=command_unmerge)
+
+    export = subparsers.add_parser("export", help="print the records of a saved library")
+    export.add_argument("library", nargs="?", default=None,
+                        help=f"a {LIBRARY_STORE_EXTENSION} or .json library "
+                             "(default: the autosaved library)")
+    export.add_argument("--query", default=None,
+                        help="only export records matching a search or tag query")
+    export.set_defaults(func=command_export)
+
+    gui = subparsers.add_parser("gui", help="start the desktop app")
+    gui.set_defaults(func=command_gui)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        PROFILER.enable(trace=True)
+    try:
+        if args.command is None:
+            return command_gui(args)
+        return args.func(args)
+    finally:
+        if args.trace:
+            PROFILER.dump_trace(args.trace)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
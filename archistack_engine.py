@@ -0,0 +1,4201 @@
+"""ArchiStack core: archive extraction, classification and the mod library.
+
+Nothing here imports tkinter, so it can be scripted or run headless; the
+GUI lives in ARCNE.py and the command line in archistack_cli.py.
+"""
+import base64
+import bz2
+import contextlib
+import ctypes
+import ctypes.util
+import fnmatch
+import functools
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import lzma
+import mmap
+import multiprocessing
+import os
+import pathlib
+import queue
+import re
+import select
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+import rarfile
+import tarfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from collections import defaultdict, deque
+
+try:
+    import py7zr
+except ImportError:
+    py7zr = None
+
+
+def format_size(num_bytes):
+    """Format a byte count as a short human readable string."""
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+TRACE_EVENT_LIMIT = 1_000_000
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "args", "started")
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.started, time.perf_counter() - self.started, self.args)
+        return False
+
+
+class Profiler:
+    """Timing spans and counters around the hot paths.
+
+    While disabled, ``span`` returns a shared no-op context manager and
+    ``count`` returns immediately, so instrumented code pays one attribute
+    check; the tightest loops test ``enabled`` themselves. When enabled,
+    each span name accumulates its call count, total and maximum duration.
+    With tracing on, every span is also kept as a Chrome trace event
+    (``ph: "X"``) that ``dump_trace`` writes for chrome://tracing or
+    Perfetto. Safe to use from any thread.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.tracing = False
+        self.stats = {}
+        self.counters = defaultdict(int)
+        self.trace_events = []
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def enable(self, trace=False):
+        self.enabled = True
+        self.tracing = self.tracing or trace
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.counters.clear()
+            self.trace_events.clear()
+            self.origin = time.perf_counter()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, args)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += amount
+
+    def record(self, name, started, duration, args=None):
+        with self.lock:
+            if (stat := self.stats.get(name)) is None:
+                self.stats[name] = [1, duration, duration]
+            else:
+                stat[0] += 1
+                stat[1] += duration
+                if duration > stat[2]:
+                    stat[2] = duration
+            if self.tracing:
+                if len(self.trace_events) < TRACE_EVENT_LIMIT:
+                    event = {"name": name, "ph": "X", "pid": os.getpid(),
+                             "tid": threading.get_ident(),
+                             "ts": round((started - self.origin) * 1e6, 1),
+                             "dur": round(duration * 1e6, 1)}
+                    if args:
+                        event["args"] = args
+                    self.trace_events.append(event)
+                else:
+                    self.counters["trace.dropped_events"] += 1
+
+    def snapshot(self):
+        """Return ``(spans, counters)``: spans as ``(name, calls, total_s, mean_s, max_s)``."""
+        with self.lock:
+            spans = [(name, calls, total, total / calls, longest)
+                     for name, (calls, total, longest) in self.stats.items()]
+            counters = dict(self.counters)
+        spans.sort(key=lambda span: span[2], reverse=True)
+        return spans, counters
+
+    def dump_trace(self, path):
+        """Write the collected spans and counters as a Chrome trace-event file."""
+        with self.lock:
+            events = list(self.trace_events)
+            counters = dict(self.counters)
+        if counters:
+            events.append({"name": "counters", "ph": "C", "pid": os.getpid(), "tid": 0,
+                           "ts": round((time.perf_counter() - self.origin) * 1e6, 1),
+                           "args": counters})
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        os.replace(temp_path, path)
+
+
+PROFILER = Profiler()
+
+
+def profiled(name):
+    """Decorate a function so each call is a ``PROFILER`` span when profiling is on."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with PROFILER.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+COMPRESSED_EXTENSIONS = {'.gz': 'gz', '.bz2': 'bz2', '.xz': 'xz'}
+TARBALL_EXTENSIONS = {'.tgz': 'gz', '.tbz2': 'bz2', '.tbz': 'bz2', '.txz': 'xz'}
+ARCHIVE_EXTENSIONS = (('.zip', '.rar', '.tar') + tuple(TARBALL_EXTENSIONS)
+                      + tuple(COMPRESSED_EXTENSIONS) + (('.7z',) if py7zr else ()))
+COPY_CHUNK_SIZE = 1024 * 1024
+MAX_COMPRESSION_RATIO = 100
+# Tiny members compress absurdly well, so ratios only count past this much output.
+COMPRESSION_RATIO_ALLOWANCE = 16 * 1024 * 1024
+MAX_EXTRACTED_BYTES = 64 * 1024 ** 3
+DISK_SPACE_MARGIN = 64 * 1024 * 1024
+# Pools are started from worker threads; forking there can copy a lock held by
+# another thread into the child and deadlock it, so workers are spawned fresh.
+PROCESS_CONTEXT = multiprocessing.get_context("spawn")
+
+
+class ArchiveLimitError(ValueError):
+    """An archive expands past the zip-bomb limits."""
+
+
+class InsufficientDiskSpace(OSError):
+    """The destination cannot hold an archive's extracted contents."""
+
+
+class ArchiveMember:
+    """A regular file inside an archive."""
+
+    def __init__(self, name, size, compressed_size=None):
+        self.name = name
+        self.size = size
+        self.compressed_size = compressed_size
+
+    @property
+    def basename(self):
+        return os.path.basename(self.name.replace("\\", "/"))
+
+
+def _open_compressed(path, compression):
+    opener = {'gz': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}[compression]
+    return opener(path, 'rb')
+
+
+def _is_tar_header(block):
+    if len(block) < tarfile.BLOCKSIZE:
+        return False
+    try:
+        tarfile.TarInfo.frombuf(block[:tarfile.BLOCKSIZE], tarfile.ENCODING, "surrogateescape")
+    except tarfile.HeaderError:
+        return False
+    return True
+
+
+def _gzip_size_hint(path):
+    """Return the uncompressed size a gzip trailer records (modulo 4 GiB)."""
+    with open(path, "rb") as file:
+        if file.seek(0, os.SEEK_END) < 18:
+            return None
+        file.seek(-4, os.SEEK_END)
+        return struct.unpack("<I", file.read(4))[0]
+
+
+class ArchiveReader:
+    """Iterate the regular file members of an archive or compressed file.
+
+    Handles zip, rar and tar, tarballs compressed with gzip, bzip2 or xz,
+    bare ``.gz``/``.bz2``/``.xz`` files (one member named after the file)
+    and 7z when py7zr is installed. A ``.gz``, ``.bz2`` or ``.xz`` is read
+    as a tarball when its first block is a tar header. ``listing()`` returns
+    member metadata without decompressing anything, or None when sizes are
+    only known by reading the archive front to back. Iterating yields
+    ``(member, stream)`` pairs; each stream is only valid until the next
+    member is requested. 7z members are decompressed by py7zr into a
+    temporary folder under ``work_dir`` and removed as they are consumed;
+    every chunk py7zr writes there is held to the zip-bomb limits, since
+    nothing downstream sees the data until a whole batch is unpacked.
+    """
+
+    def __init__(self, archive_path, work_dir=None):
+        self.archive_path = archive_path
+        self.work_dir = work_dir
+        self.extension = os.path.splitext(archive_path)[1].lower()
+        self.single_member = None
+
+        if self.extension == '.zip':
+            self.archive = zipfile.ZipFile(archive_path, 'r')
+        elif self.extension == '.rar':
+            self.archive = rarfile.RarFile(archive_path, 'r')
+        elif self.extension == '.tar':
+            self.archive = tarfile.open(archive_path, 'r')
+        elif self.extension == '.7z':
+            if py7zr is None:
+                raise ValueError("7z archives need the py7zr package")
+            self.archive = py7zr.SevenZipFile(archive_path, 'r')
+        elif self.extension in TARBALL_EXTENSIONS:
+            stream = _open_compressed(archive_path, TARBALL_EXTENSIONS[self.extension])
+            self.archive = tarfile.open(fileobj=stream, mode='r|')
+            self.stream = stream
+        elif self.extension in COMPRESSED_EXTENSIONS:
+            stream = _open_compressed(archive_path, COMPRESSED_EXTENSIONS[self.extension])
+            try:
+                is_tarball = _is_tar_header(stream.read(tarfile.BLOCKSIZE))
+                stream.seek(0)
+            except BaseException:
+                stream.close()
+                raise
+            self.stream = stream
+            if is_tarball:
+                self.archive = tarfile.open(fileobj=stream, mode='r|')
+            else:
+                self.archive = stream
+                self.single_member = os.path.basename(archive_path)[:-len(self.extension)]
+        else:
+            raise ValueError(
+                f"Unsupported archive format: {self.extension}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.archive.close()
+        if (stream := getattr(self, "stream", None)) is not None:
+            stream.close()
+
+    @property
+    def streaming(self):
+        return (isinstance(self.archive, tarfile.TarFile) and self.extension != '.tar'
+                or self.single_member is not None)
+
+    def members(self):
+        """Return every member, reading a streaming archive through if there is no listing.
+
+        A streaming archive can't be iterated again afterwards; use a new reader.
+        """
+        if (listing := self.listing()) is not None:
+            return listing
+        if self.single_member is not None:
+            return [ArchiveMember(self.single_member, None, os.path.getsize(self.archive_path))]
+        return [ArchiveMember(info.name, info.size) for info in self.archive if info.isfile()]
+
+    def listing(self):
+        if self.single_member is not None:
+            if self.extension != '.gz':
+                return None
+            return [ArchiveMember(self.single_member, _gzip_size_hint(self.archive_path),
+                                  os.path.getsize(self.archive_path))]
+        if self.streaming:
+            return None
+        if isinstance(self.archive, tarfile.TarFile):
+            return [ArchiveMember(info.name, info.size)
+                    for info in self.archive.getmembers() if info.isfile()]
+        if py7zr is not None and isinstance(self.archive, py7zr.SevenZipFile):
+            return [ArchiveMember(info.filename, info.uncompressed, info.compressed)
+                    for info in self.archive.list() if not info.is_directory]
+        return [ArchiveMember(info.filename, info.file_size, info.compress_size)
+                for info in self.archive.infolist() if not info.is_dir()]
+
+    def __iter__(self):
+        return self.iter_members()
+
+    def iter_members(self, names=None):
+        """Yield ``(member, stream)`` for every member, or only those named in ``names``.
+
+        Unselected members are never decompressed, except where a streaming
+        tarball has to be read through to reach the next selected one;
+        reading stops once every selected tar member has been seen.
+        """
+        wanted = None if names is None else set(names)
+        if self.single_member is not None:
+            if wanted is None or self.single_member in wanted:
+                yield ArchiveMember(
+                    self.single_member, None, os.path.getsize(self.archive_path)), self.archive
+            return
+        if isinstance(self.archive, tarfile.TarFile):
+            remaining = None if wanted is None else set(wanted)
+            for info in self.archive:
+                if info.isfile() and (wanted is None or info.name in wanted):
+                    yield ArchiveMember(info.name, info.size), self.archive.extractfile(info)
+                    if remaining is not None:
+                        remaining.discard(info.name)
+                        if not remaining:
+                            return
+            return
+        if py7zr is not None and isinstance(self.archive, py7zr.SevenZipFile):
+            yield from self._iter_7z(wanted)
+            return
+        for info in self.archive.infolist():
+            if info.is_dir() or wanted is not None and info.filename not in wanted:
+                continue
+            with self.archive.open(info) as stream:
+                yield ArchiveMember(info.filename, info.file_size, info.compress_size), stream
+
+    def _iter_7z(self, wanted=None):
+        members = [ArchiveMember(info.filename, info.uncompressed, info.compressed)
+                   for info in self.archive.list()
+                   if not info.is_directory and (wanted is None or info.filename in wanted)]
+        unpack_path = tempfile.mkdtemp(prefix=".archistack-7z-", dir=self.work_dir)
+        writers = _Limited7zWriterFactory(
+            {pathlib.Path(unpack_path, member.name).as_posix(): member for member in members},
+            ExtractionLimits(os.path.getsize(self.archive_path)))
+        try:
+            try:
+                if wanted is None:
+                    self.archive.extractall(path=unpack_path, factory=writers)
+                else:
+                    self.archive.extract(path=unpack_path, factory=writers,
+                                         targets=[member.name for member in members])
+            finally:
+                writers.close()
+            for member in members:
+                member_path = os.path.join(unpack_path, member.name)
+                if not os.path.isfile(member_path):
+                    continue
+                with open(member_path, "rb", buffering=0) as stream:
+                    yield member, stream
+                os.remove(member_path)
+        finally:
+            shutil.rmtree(unpack_path, ignore_errors=True)
+
+
+class _Limited7zWriter:
+    """A py7zr output file that counts each decompressed chunk against ``limits``."""
+
+    def __init__(self, path, member, limits, lock):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, "wb")
+        self.member = member
+        self.limits = limits
+        self.lock = lock
+        self.written = 0
+
+    def write(self, data):
+        # py7zr may unpack several folders at once, all sharing one total
+        with self.lock:
+            self.written += len(data)
+            self.limits.consume(self.member, self.written, len(data))
+        return self.file.write(data)
+
+    def read(self, size=None):
+        return b""
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def flush(self):
+        self.file.flush()
+
+    def size(self):
+        return self.written
+
+    def close(self):
+        self.file.close()
+
+
+class _Limited7zWriterFactory:
+    """Hands py7zr a ``_Limited7zWriter`` per member, in place of writing files itself."""
+
+    def __init__(self, members_by_path, limits):
+        self.members_by_path = members_by_path
+        self.limits = limits
+        self.lock = threading.Lock()
+        self.writers = []
+
+    def create(self, filename):
+        member = self.members_by_path.get(filename) or ArchiveMember(filename, None)
+        writer = _Limited7zWriter(filename, member, self.limits, self.lock)
+        self.writers.append(writer)
+        return writer
+
+    def close(self):
+        # py7zr leaves a writer open when extraction fails part way through it
+        for writer in self.writers:
+            writer.close()
+
+
+class ExtractionLimits:
+    """Zip-bomb guards for one archive, checked up front and as data streams.
+
+    Output may not exceed ``max_ratio`` times the archive size overall, or
+    times a member's compressed size where the format records it, plus
+    ``COMPRESSION_RATIO_ALLOWANCE``; nor ``max_bytes`` in total.
+    """
+
+    def __init__(self, archive_size, max_ratio=MAX_COMPRESSION_RATIO,
+                 max_bytes=MAX_EXTRACTED_BYTES):
+        self.max_ratio = max_ratio
+        self.max_bytes = min(max_bytes, archive_size * max_ratio + COMPRESSION_RATIO_ALLOWANCE)
+        self.total = 0
+
+    def check_listing(self, listing):
+        total = 0
+        for member in listing:
+            if member.size is None:
+                continue
+            self.check_member(member, member.size)
+            total += member.size
+        if total > self.max_bytes:
+            raise ArchiveLimitError(
+                f"archive would expand to {format_size(total)}, "
+                f"over the {format_size(self.max_bytes)} limit")
+
+    def check_member(self, member, member_bytes):
+        if (member.compressed_size is not None and member_bytes > member.compressed_size
+                * self.max_ratio + COMPRESSION_RATIO_ALLOWANCE):
+            raise ArchiveLimitError(
+                f"{member.name} expands more than {self.max_ratio}x its compressed size")
+
+    def consume(self, member, member_bytes, count):
+        self.total += count
+        if self.total > self.max_bytes:
+            raise ArchiveLimitError(
+                f"archive expanded past the {format_size(self.max_bytes)} limit")
+        self.check_member(member, member_bytes)
+
+
+def check_disk_space(path, required):
+    """Raise InsufficientDiskSpace unless ``path`` has ``required`` bytes to spare."""
+    free = shutil.disk_usage(path).free
+    if required + DISK_SPACE_MARGIN > free:
+        raise InsufficientDiskSpace(
+            f"extracting needs {format_size(required)} but only "
+            f"{format_size(free)} is free in {path}")
+
+
+_COPY_BUFFERS = threading.local()
+
+
+def copy_buffer():
+    """Return this thread's reusable ``COPY_CHUNK_SIZE`` buffer as a memoryview."""
+    if (view := getattr(_COPY_BUFFERS, "view", None)) is None:
+        view = _COPY_BUFFERS.view = memoryview(bytearray(COPY_CHUNK_SIZE))
+    return view
+
+
+def read_chunk(stream, view):
+    """Fill ``view`` from ``stream`` and return the byte count (0 at the end)."""
+    if (readinto := getattr(stream, "readinto", None)) is not None:
+        return readinto(view)
+    chunk = stream.read(len(view))
+    view[:len(chunk)] = chunk
+    return len(chunk)
+
+
+def write_member(stream, target_path, job, hash_index=None, member=None, limits=None):
+    """Copy ``stream`` to ``target_path`` in chunks, reporting to ``job``.
+
+    Data goes to a ``.part`` file first and is renamed into place once
+    complete, so a cancelled or failed copy never leaves a truncated file.
+    Chunks are read into the thread's reusable buffer, so memory use does
+    not grow with the member, and ``limits`` sees every chunk of ``member``.
+    The content is hashed on the way through. If ``hash_index`` already
+    holds a file with the same content, the copy is discarded and the path
+    of that file is returned; otherwise the new file is indexed, recorded on
+    ``job.written`` and None is returned.
+    """
+    with PROFILER.span("extract.write_member"):
+        return _write_member(stream, target_path, job, hash_index, member, limits)
+
+
+def _write_member(stream, target_path, job, hash_index, member, limits):
+    part_path = f"{target_path}.part"
+    content_hash = hashlib.blake2b()
+    view = copy_buffer()
+    size = 0
+    try:
+        with open(part_path, "wb") as target:
+            while count := read_chunk(stream, view):
+                job.check_cancelled()
+                size += count
+                if limits is not None:
+                    limits.consume(member, size, count)
+                chunk = view[:count]
+                target.write(chunk)
+                content_hash.update(chunk)
+                job.advance(file_count=0, byte_count=count)
+        digest = content_hash.hexdigest()
+        PROFILER.count("extract.bytes_written", size)
+        if hash_index is not None and (
+                original := hash_index.find_by_digest(size, digest, exclude=target_path)):
+            os.remove(part_path)
+            PROFILER.count("extract.duplicates")
+            return original
+        os.replace(part_path, target_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    if hash_index is not None:
+        hash_index.add(target_path, digest)
+    job.written.append((target_path, size, digest))
+    return None
+
+
+DBPF_HEADER_SIZE = 96
+
+# Resource type IDs that identify what a package mostly contains.
+DBPF_CONTENT_KINDS = {
+    0x034AEECB: "cas",      # CAS part
+    0x015A1849: "cas",      # Body geometry
+    0x0354796A: "cas",      # Skin tone
+    0xC0DB5AE7: "object",   # Object definition
+    0x319E4F1D: "object",   # Catalog object
+    0x01661233: "object",   # Model
+    0x01D10F34: "object",   # Model LOD
+    0x073FAA07: "script",   # Script assembly
+    0x03B33DDF: "tuning",   # Tuning
+    0x6017E896: "tuning",   # Buff tuning
+    0xCB5FDDC7: "tuning",   # Trait tuning
+    0xE882D22F: "tuning",   # Interaction tuning
+    0x0C772E27: "tuning",   # Loot tuning
+    0x7DF2169C: "tuning",   # Snippet tuning
+    0x545AC67A: "tuning",   # SimData
+}
+# When a package mixes kinds, the first kind present in this order wins.
+DBPF_CONTENT_PRECEDENCE = ("cas", "object", "script", "tuning")
+
+
+class DBPFError(ValueError):
+    """Raised when a file is not a readable DBPF package."""
+
+
+class DBPFResource:
+    """One entry of a DBPF package index."""
+
+    __slots__ = ("type", "group", "instance", "offset", "size", "mem_size", "compression")
+
+    def __init__(self, type, group, instance, offset, size, mem_size, compression):
+        self.type = type
+        self.group = group
+        self.instance = instance
+        self.offset = offset
+        self.size = size
+        self.mem_size = mem_size
+        self.compression = compression
+
+    @property
+    def key(self):
+        return (self.type, self.group, self.instance)
+
+
+def read_dbpf_index(path):
+    """Read the index table of a DBPF 2.x package (Sims 3 and Sims 4).
+
+    Only the 96 byte header and the index itself are read; the index is
+    parsed from a memory map and resource data is never touched, so the
+    cost does not depend on the file size.
+    """
+    with open(path, "rb") as package:
+        header = package.read(DBPF_HEADER_SIZE)
+        if len(header) < DBPF_HEADER_SIZE or header[:4] != b"DBPF":
+            raise DBPFError(f"Not a DBPF package: {path}")
+        major_version, = struct.unpack_from("<I", header, 4)
+        if major_version != 2:
+            raise DBPFError(
+                f"Unsupported DBPF version {major_version}: {path}")
+
+        entry_count, = struct.unpack_from("<I", header, 36)
+        index_size, = struct.unpack_from("<I", header, 44)
+        index_position, = struct.unpack_from("<I", header, 64)
+        if not index_position:
+            index_position, = struct.unpack_from("<I", header, 40)
+        if not entry_count:
+            return []
+
+        # Parse the index straight out of the page cache instead of copying it
+        with mmap.mmap(package.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+                memoryview(mapped) as view, \
+                view[index_position:index_position + index_size] as index:
+            return parse_dbpf_index(index, entry_count, path)
+
+
+def parse_dbpf_index(index, entry_count, path=""):
+    """Decode a raw DBPF 2.x index table into ``DBPFResource`` objects."""
+    if len(index) < 4:
+        raise DBPFError(f"Truncated DBPF index: {path}")
+    flags, = struct.unpack_from("<I", index, 0)
+    offset = 4
+    constants = []
+    for bit in range(3):
+        if flags & (1 << bit):
+            constants.append(struct.unpack_from("<I", index, offset)[0])
+            offset += 4
+        else:
+            constants.append(None)
+    constant_type, constant_group, constant_instance_high = constants
+    varying = sum(value is None for value in constants)
+    entry_format = struct.Struct(f"<{varying + 4}I")
+
+    resources = []
+    try:
+        for _ in range(entry_count):
+            fields = list(entry_format.unpack_from(index, offset))
+            offset += entry_format.size
+            resource_type = constant_type if constant_type is not None else fields.pop(0)
+            group = constant_group if constant_group is not None else fields.pop(0)
+            instance_high = constant_instance_high if constant_instance_high is not None else fields.pop(0)
+            instance_low, position, file_size, mem_size = fields
+            compression = 0
+            if file_size & 0x80000000:
+                compression, _ = struct.unpack_from("<HH", index, offset)
+                offset += 4
+            resources.append(DBPFResource(
+                resource_type, group, (instance_high << 32) | instance_low,
+                position, file_size & 0x7FFFFFFF, mem_size, compression))
+    except struct.error as error:
+        raise DBPFError(f"Truncated DBPF index: {path}") from error
+    return resources
+
+
+DBPF_INDEX_ENTRY = struct.Struct("<7IHH")
+
+
+def write_dbpf(target, blobs):
+    """Write a DBPF 2.1 package with one flat index to the binary file ``target``.
+
+    ``blobs`` yields ``(resource, data)`` pairs in file order. Data is
+    written as stored, so compressed resources stay compressed and no blob
+    is ever decoded. Returns the resources with their new offsets.
+    """
+    target.write(bytes(DBPF_HEADER_SIZE))
+    position = DBPF_HEADER_SIZE
+    written = []
+    for resource, data in blobs:
+        target.write(data)
+        written.append(DBPFResource(
+            resource.type, resource.group, resource.instance, position,
+            resource.size, resource.mem_size, resource.compression))
+        position += resource.size
+
+    index = bytearray(struct.pack("<I", 0))
+    for resource in written:
+        index += DBPF_INDEX_ENTRY.pack(
+            resource.type, resource.group, resource.instance >> 32,
+            resource.instance & 0xFFFFFFFF, resource.offset, resource.size | 0x80000000,
+            resource.mem_size, resource.compression, 1)
+    target.write(index)
+
+    header = bytearray(DBPF_HEADER_SIZE)
+    header[:4] = b"DBPF"
+    struct.pack_into("<II", header, 4, 2, 1)
+    struct.pack_into("<I", header, 36, len(written))
+    struct.pack_into("<I", header, 44, len(index))
+    struct.pack_into("<II", header, 60, 3, position)
+    target.seek(0)
+    target.write(header)
+    return written
+
+
+class MappedFile:
+    """A read-only memory map of a file, exposed as ``view`` (a memoryview)."""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self.file.close()
+            raise
+        self.view = memoryview(self.map)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def blobs(self, resources):
+        """Yield ``(resource, data)`` with data a zero-copy slice of the map."""
+        for resource in resources:
+            with self.view[resource.offset:resource.offset + resource.size] as data:
+                if len(data) != resource.size:
+                    raise DBPFError(f"Resource data runs past the end of {self.file.name}")
+                yield resource, data
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+
+DBPF_COMPRESSION_NONE = 0x0000
+DBPF_COMPRESSION_ZLIB = 0x5A42
+
+
+def read_dbpf_resource(mapped, resource):
+    """Return a resource's decoded bytes from a MappedFile, or None.
+
+    Uncompressed and zlib resources are decoded; RefPack and the other
+    legacy compressions are not, and yield None.
+    """
+    with mapped.view[resource.offset:resource.offset + resource.size] as data:
+        if resource.compression == DBPF_COMPRESSION_NONE:
+            return bytes(data)
+        if resource.compression == DBPF_COMPRESSION_ZLIB:
+            try:
+                return zlib.decompress(data)
+            except zlib.error:
+                return None
+    return None
+
+
+def dbpf_content_kind(resources):
+    """Infer what a package holds ("cas", "object", ...) from its resources."""
+    kinds = {DBPF_CONTENT_KINDS.get(resource.type) for resource in resources}
+    return next((kind for kind in DBPF_CONTENT_PRECEDENCE if kind in kinds), None)
+
+
+class PackageContentCache:
+    """Per-file cache of package content kinds, keyed by path, size and mtime.
+
+    A cached answer is reused while the file's size and mtime are unchanged,
+    so re-scanning a library only opens packages that actually changed.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def content_kind(self, path):
+        """Return the content kind of ``path``, or None if it can't be told."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cached = self._entries.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        try:
+            kind = dbpf_content_kind(read_dbpf_index(path))
+        except (OSError, DBPFError):
+            kind = None
+        self._entries[path] = (signature, kind)
+        return kind
+
+    def clear(self):
+        self._entries.clear()
+
+
+PACKAGE_CONTENT_CACHE = PackageContentCache()
+
+
+class CategoryClassifier:
+    """Classify file names by extension, then by keyword.
+
+    The extension table and the keyword table are built once.
+    ``keyword_categories`` is a list of ``(keyword, category)`` pairs in
+    priority order and the first keyword found in the lowercased name wins.
+    Results are memoized per lowercased name, up to ``cache_size`` entries.
+
+    ``classify_file`` can also look inside ``.package`` files: when the DBPF
+    index reveals a content kind listed in ``content_categories`` that
+    category is used instead of the name-based one.
+    """
+
+    def __init__(self, keyword_categories, extension_categories=None, default="Unknown",
+                 content_categories=None, cache_size=65536):
+        self.extension_categories = dict(extension_categories or {})
+        self.content_categories = dict(content_categories or {})
+        self.keyword_categories = tuple(
+            (keyword.lower(), category) for keyword, category in keyword_categories)
+        self.default = default
+        self.cache_size = cache_size
+        self._cache = {}
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def classify(self, file_name):
+        file_name = file_name.lower()
+        if (category := self._cache.get(file_name)) is None:
+            if PROFILER.enabled:
+                with PROFILER.span("classify.name"):
+                    return self._classify_lowered(file_name)
+            category = self._classify_lowered(file_name)
+        return category
+
+    def classify_many(self, file_names):
+        """Classify a batch of names, returning categories in the same order."""
+        return [self.classify(file_name) for file_name in file_names]
+
+    def classify_file(self, file_path, inspect_contents=True):
+        """Classify a file on disk, reading its DBPF index if it is a package."""
+        if inspect_contents and self.content_categories and file_path.lower().endswith(".package"):
+            with PROFILER.span("classify.package_contents"):
+                kind = PACKAGE_CONTENT_CACHE.content_kind(file_path)
+            if category := self.content_categories.get(kind):
+                return category
+        return self.classify(os.path.basename(file_path))
+
+    def classify_files(self, file_paths, inspect_contents=True):
+        """Classify a batch of files on disk, in the same order."""
+        with PROFILER.span("classify.files", count=len(file_paths)):
+            return [self.classify_file(file_path, inspect_contents)
+                    for file_path in file_paths]
+
+    def _classify_lowered(self, file_name):
+        category = self.extension_categories.get(
+            os.path.splitext(file_name)[1]) if self.extension_categories else None
+        if category is None:
+            category = self.default
+            for keyword, keyword_category in self.keyword_categories:
+                if keyword in file_name:
+                    category = keyword_category
+                    break
+
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[file_name] = category
+        return category
+
+
+ARCHIVE_CLASSIFIER = CategoryClassifier(
+    extension_categories={
+        ".package": "Package Mods",
+        ".sims3pack": "Sims3Pack Mods",
+        ".sim": "Sim Characters",
+        ".blueprint": "Blueprints",
+        ".bak": "Backup Files",
+    },
+    keyword_categories=[
+        ("cas", "Create-A-Sim"),
+        ("clothing", "Clothing"),
+        ("hair", "Hair"),
+        ("acc", "Accessories"),
+        ("makeup", "Makeup"),
+        ("build", "Build Mode"),
+        ("buy", "Buy Mode"),
+        ("script", "Script Mods"),
+    ],
+    content_categories={
+        "cas": "Create-A-Sim",
+        "object": "Buy Mode",
+        "script": "Script Mods",
+        "tuning": "Tuning Mods",
+    },
+)
+
+MOD_CATEGORY_KEYWORDS = {
+    "CAS": ["cas", "create a sim", "sim customization", "sim creation", "sim appearance"],
+    "Build/Buy": ["build", "buy", "build and buy", "furniture", "decor"],
+    "Gameplay": ["gameplay", "gameplay changes", "gameplay tweaks", "gameplay mods", "gameplay adjustments"],
+    "Other": ["other", "miscellaneous", "uncategorized", "unknown"],
+}
+
+MOD_CLASSIFIER = CategoryClassifier(
+    keyword_categories=[(keyword, category)
+                        for category, keywords in MOD_CATEGORY_KEYWORDS.items()
+                        for keyword in keywords],
+    default="Other",
+    content_categories={
+        "cas": "CAS",
+        "object": "Build/Buy",
+        "script": "Gameplay",
+        "tuning": "Gameplay",
+    },
+)
+
+
+def identify_file_category(file_name, file_path=None):
+    """Return the destination category for an extracted file.
+
+    With ``file_path`` a ``.package`` file is classified by its contents.
+    """
+    if file_path is not None:
+        return ARCHIVE_CLASSIFIER.classify_file(file_path)
+    return ARCHIVE_CLASSIFIER.classify(file_name)
+
+
+def detect_category(mod_name, mod_path=None):
+    """Return the organizer category for a mod file.
+
+    With ``mod_path`` a ``.package`` file is classified by its contents.
+    """
+    if mod_path is not None:
+        return MOD_CLASSIFIER.classify_file(mod_path)
+    return MOD_CLASSIFIER.classify(mod_name)
+
+
+@profiled("categorize_files")
+def categorize_files(extracted_path, inspect_contents=True):
+    """Group every file below ``extracted_path`` by its extraction category."""
+    categorized_files = defaultdict(list)
+
+    for root, _, files in os.walk(extracted_path):
+        file_paths = [os.path.join(root, file) for file in files]
+        for file_path, category in zip(file_paths, ARCHIVE_CLASSIFIER.classify_files(file_paths, inspect_contents)):
+            categorized_files[category].append(file_path)
+
+    return categorized_files
+
+
+RULES_FILE = 'archistack_rules.json'
+RULE_CACHE_FILE = 'rule_cache.json'
+RULE_PREDICATES = ("glob", "regex", "extension", "min_size", "max_size", "dbpf_type")
+DEFAULT_RULES = [
+    {"name": "MaxisMatch", "match": {"regex": "maxismatch"}, "source": "MaxisMatch"},
+    {"name": "Alpha", "match": {"regex": "alpha"}, "source": "Alpha"},
+]
+
+
+def _rule_values(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _rule_type_id(value):
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+class RuleResult:
+    """What the matching rules say about a file; None where no rule said anything."""
+
+    def __init__(self, category=None, source=None, tags=()):
+        self.category = category
+        self.source = source
+        self.tags = list(tags)
+
+    def __bool__(self):
+        return bool(self.category or self.source or self.tags)
+
+    def changes_for(self, record):
+        """Return the field changes that bring ``record`` in line; tags are only added."""
+        changes = {}
+        if self.category and self.category != record.category:
+            changes["category"] = self.category
+        if self.source and self.source != record.source:
+            changes["source"] = self.source
+        if missing := [tag for tag in self.tags if tag not in record.tags]:
+            changes["tags"] = list(record.tags) + missing
+        return changes
+
+
+class CompiledRules:
+    """A rule list compiled once into per-rule matchers, cheapest checks first.
+
+    Each rule's globs and regexes are compiled on their own, so a
+    backreference, inline flag or named group means the same as it would in
+    a standalone pattern. Raises ValueError naming the rule at fault.
+    """
+
+    def __init__(self, rules):
+        self.rules = []
+        for index, rule in enumerate(rules):
+            label = rule.get("name") or f"#{index + 1}"
+            conditions = rule.get("match") or {}
+            if unknown := set(conditions) - set(RULE_PREDICATES):
+                raise ValueError(f"Rule {label}: unknown predicate {', '.join(sorted(unknown))}")
+            try:
+                glob_matcher = re.compile("|".join(
+                    fnmatch.translate(str(glob)) for glob in _rule_values(conditions["glob"])
+                ), re.IGNORECASE) if "glob" in conditions else None
+            except re.error as error:
+                raise ValueError(f"Rule {label}: invalid glob: {error}") from error
+            regex_matchers = []
+            for expression in _rule_values(conditions.get("regex", [])):
+                try:
+                    regex_matchers.append(re.compile(expression, re.IGNORECASE))
+                except (re.error, TypeError) as error:
+                    raise ValueError(f"Rule {label}: invalid regex {expression!r}: {error}") from error
+            try:
+                extensions = frozenset(
+                    extension.lower() if extension.startswith(".") else f".{extension.lower()}"
+                    for extension in _rule_values(conditions["extension"])
+                ) if "extension" in conditions else None
+                dbpf_types = frozenset(
+                    _rule_type_id(value) for value in _rule_values(conditions["dbpf_type"])
+                ) if "dbpf_type" in conditions else None
+                min_size = int(conditions["min_size"]) if "min_size" in conditions else None
+                max_size = int(conditions["max_size"]) if "max_size" in conditions else None
+            except (AttributeError, TypeError, ValueError) as error:
+                raise ValueError(f"Rule {label}: {error}") from error
+            self.rules.append((extensions, min_size, max_size, glob_matcher,
+                               tuple(regex_matchers), dbpf_types,
+                               rule.get("category") or None, rule.get("source") or None,
+                               parse_tags(rule.get("tags"))))
+        self.needs_size = any(rule[1] is not None or rule[2] is not None for rule in self.rules)
+        self.needs_dbpf = any(rule[5] is not None for rule in self.rules)
+
+    def match(self, name, size=None, load_types=None):
+        """Evaluate every rule against a file name, size and lazily loaded DBPF types."""
+        category = source = None
+        tags = []
+        types = None
+        extension = os.path.splitext(name)[1].lower()
+        for (extensions, min_size, max_size, glob_matcher, regex_matchers, dbpf_types,
+             rule_category, rule_source, rule_tags) in self.rules:
+            if extensions is not None and extension not in extensions:
+                continue
+            if min_size is not None and (size is None or size < min_size):
+                continue
+            if max_size is not None and (size is None or size > max_size):
+                continue
+            if glob_matcher is not None and glob_matcher.match(name) is None:
+                continue
+            if regex_matchers and not any(matcher.search(name) for matcher in regex_matchers):
+                continue
+            if dbpf_types is not None:
+                if types is None:
+                    types = load_types() if load_types is not None else frozenset()
+                if types.isdisjoint(dbpf_types):
+                    continue
+            category = category or rule_category
+            source = source or rule_source
+            tags.extend(tag for tag in rule_tags if tag not in tags)
+        return RuleResult(category, source, tags)
+
+
+def _package_types(path):
+    try:
+        return frozenset(resource.type for resource in read_dbpf_index(path))
+    except (OSError, DBPFError):
+        return frozenset()
+
+
+class RuleSet:
+    """User-editable rules that set the category, source and tags of mod files.
+
+    The rules file is JSON: ``{"rules": [{"name", "match", "category",
+    "source", "tags"}, ...]}``. Every predicate in "match" must hold:
+    "glob" (the whole file name), "regex" (searched for in the file name),
+    "extension", "min_size" / "max_size" in bytes and "dbpf_type" (the
+    package holds a resource of that type, e.g. "0x034AEECB"); a list means
+    any of. Names match case-insensitively. The first matching rule with a
+    category (or source) sets it; tags of all matching rules are collected.
+
+    ``reload_if_changed`` recompiles when the file changes on disk.
+    Results are memoized by path, size and mtime, so re-applying the rules
+    only evaluates new or changed files; the memo persists to
+    ``cache_path`` and is dropped whenever the rules themselves change.
+    """
+
+    def __init__(self, path=RULES_FILE, cache_path=None):
+        self.path = path
+        self.cache_path = cache_path
+        self.rules = [dict(rule) for rule in DEFAULT_RULES]
+        self.compiled = CompiledRules(self.rules)
+        self.digest = self._digest(self.rules)
+        self.signature = None
+        self.memo = {}
+        self.files_evaluated = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _digest(rules):
+        return hashlib.sha1(json.dumps(rules, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _file_signature(self):
+        if not self.path:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def load(self):
+        """Read the rules file (the defaults stand in if it is missing) and the memo."""
+        self.reload_if_changed()
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get("rules") == self.digest:
+            self.memo = {path: (size, mtime_ns, RuleResult(category, source, tags))
+                         for path, (size, mtime_ns, category, source, tags)
+                         in data.get("files", {}).items()}
+
+    def reload_if_changed(self):
+        """Recompile if the rules file changed; return True if the rules did.
+
+        Raises ValueError for an unreadable or invalid file, leaving the
+        previous rules in effect.
+        """
+        if (signature := self._file_signature()) == self.signature:
+            return False
+        self.signature = signature
+        rules = self._read_rules()
+        compiled = CompiledRules(rules)
+        if (digest := self._digest(rules)) == self.digest:
+            return False
+        with self.lock:
+            self.rules, self.compiled, self.digest = rules, compiled, digest
+            self.memo.clear()
+            self.dirty = True
+        return True
+
+    def _read_rules(self):
+        if not self.path or not os.path.exists(self.path):
+            return [dict(rule) for rule in DEFAULT_RULES]
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return list(json.load(file).get("rules", []))
+        except (OSError, ValueError, AttributeError, TypeError) as error:
+            raise ValueError(f"Could not read {self.path}: {error}") from error
+
+    def write(self):
+        """Write the current rules to the rules file, e.g. to seed it for editing."""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"rules": self.rules}, file, indent=2)
+        os.replace(temp_path, self.path)
+        self.signature = self._file_signature()
+
+    def save(self):
+        """Write the memo atomically if anything changed."""
+        if not self.cache_path or not self.dirty:
+            return
+        with self.lock:
+            data = {"version": 1, "rules": self.digest, "files": {
+                path: [size, mtime_ns, result.category, result.source, result.tags]
+                for path, (size, mtime_ns, result) in self.memo.items()}}
+            self.dirty = False
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.cache_path)
+
+    def categories(self):
+        return list(dict.fromkeys(rule["category"] for rule in self.rules if rule.get("category")))
+
+    def add_categories(self, categories):
+        """Add a name keyword rule for each new category and write the rules file.
+
+        The file is re-read first so edits not yet loaded are kept; raises
+        ValueError if it is invalid.
+        """
+        rules = self._read_rules()
+        known = {rule["category"].casefold() for rule in rules if rule.get("category")}
+        added = []
+        for category in categories:
+            if category and category.casefold() not in known:
+                known.add(category.casefold())
+                added.append(category)
+        if not added:
+            return []
+        rules += [{"name": category, "match": {"regex": re.escape(category)},
+                   "category": category} for category in added]
+        compiled = CompiledRules(rules)
+        with self.lock:
+            self.rules, self.compiled, self.digest = rules, compiled, self._digest(rules)
+            self.memo.clear()
+            self.dirty = True
+        self.write()
+        return added
+
+    def match_name(self, name):
+        """Evaluate the rules on a bare file name; size and DBPF predicates fail."""
+        return self.compiled.match(name)
+
+    def evaluate(self, path):
+        """Return the RuleResult for a file on disk, reusing it while the file is unchanged."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return self.match_name(os.path.basename(path))
+        with self.lock:
+            compiled = self.compiled
+            if (cached := self.memo.get(path)) is not None and cached[:2] == (
+                    stat.st_size, stat.st_mtime_ns):
+                return cached[2]
+        load_types = (functools.partial(_package_types, path)
+                      if compiled.needs_dbpf and path.lower().endswith(".package") else None)
+        result = compiled.match(os.path.basename(path), stat.st_size, load_types)
+        with self.lock:
+            if compiled is self.compiled:
+                self.memo[path] = (stat.st_size, stat.st_mtime_ns, result)
+                self.files_evaluated += 1
+                self.dirty = True
+        return result
+
+    @profiled("rules.evaluate")
+    def evaluate_many(self, paths):
+        """Evaluate a batch of files, returning results in the same order."""
+        return [self.evaluate(path) for path in paths]
+
+
+@functools.cache
+def default_rules():
+    return CompiledRules(DEFAULT_RULES)
+
+
+def detect_mod_source(mod_name):
+    """Guess which creator site a mod came from by its name, using the default rules."""
+    return default_rules().match(mod_name).source or "Unknown"
+
+
+class ExtractionCancelled(Exception):
+    """Raised inside a worker when its extraction job has been cancelled."""
+
+
+class ExtractionJob:
+    """Progress and cancellation state for a single archive extraction.
+
+    The worker thread updates the counters and posts ``(kind, job)`` events to
+    ``events``; the Tk thread only ever reads them.
+    """
+
+    def __init__(self, archive_path, destination_path, events=None, members=None,
+                 collision_policy="rename"):
+        self.archive_path = archive_path
+        self.destination_path = destination_path
+        self.events = events
+        self.members = members
+        self.collision_policy = collision_policy
+        self.status = "Queued"
+        self.total_files = None
+        self.total_bytes = None
+        self.files_done = 0
+        self.bytes_done = 0
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.batch = None
+        self.duplicates = 0
+        self.renamed = 0
+        self.skipped = 0
+        self.overwritten = 0
+        self.written = []
+        self._cancel_event = threading.Event()
+
+    @property
+    def name(self):
+        return os.path.basename(self.archive_path)
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.status in ("Done", "Cancelled", "Failed")
+
+    def cancel(self):
+        """Ask the worker to stop at the next chunk boundary."""
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise ExtractionCancelled(self.archive_path)
+
+    def set_totals(self, total_files, total_bytes):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.post("progress")
+
+    def advance(self, file_count=1, byte_count=0):
+        self.files_done += file_count
+        self.bytes_done += byte_count
+        self.post("progress")
+
+    def throughput(self):
+        """Return the average extraction speed in bytes per second."""
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return self.bytes_done / elapsed if elapsed > 0 else 0.0
+
+    def post(self, kind):
+        if self.events is not None:
+            self.events.put((kind, self))
+
+
+@profiled("extract.archive")
+def extract_archive(archive_path, destination_path, job=None, hash_index=None, members=None):
+    """Extract an archive, or only the ``members`` named, straight into its category folders.
+
+    Members are streamed one at a time, classified by name and written
+    once to their final path through a fixed-size buffer, so memory use
+    does not depend on the archive size. When the format records member
+    sizes, the free disk space and zip-bomb limits are checked before
+    anything is written; the limits are enforced again as data streams.
+    Safe to call from a worker thread: it never touches Tk. ``job``
+    receives progress and is checked for cancellation between chunks.
+    Members whose content is already in ``hash_index`` are skipped and
+    counted in ``job.duplicates``. Without ``members``, ``job.members``
+    (if set) selects what to extract.
+
+    A member whose target already exists, from an earlier extraction or
+    an earlier member of the same name, is handled by
+    ``job.collision_policy`` as in ``BatchExtraction`` and counted on the
+    job. If the extraction is cancelled or fails, every file it wrote is
+    removed again and any file it overwrote is put back.
+    """
+    if job is None:
+        job = ExtractionJob(archive_path, destination_path, members=members)
+    if members is None:
+        members = job.members
+    os.makedirs(destination_path, exist_ok=True)
+    category_folders = {}
+    created_folders = []
+    replaced = []
+    try:
+        _extract_members(archive_path, destination_path, job, hash_index, members,
+                         category_folders, created_folders, replaced)
+    except BaseException:
+        _undo_extraction(job, hash_index, created_folders, replaced)
+        raise
+    for _, backup_path in replaced:
+        os.remove(backup_path)
+
+
+def _undo_extraction(job, hash_index, created_folders, replaced):
+    """Remove what an interrupted extraction wrote and restore what it overwrote."""
+    for path, _, _ in job.written:
+        if hash_index is not None:
+            hash_index.remove(path)
+        with contextlib.suppress(OSError):
+            os.remove(path)
+    job.written.clear()
+    for target_path, backup_path in replaced:
+        with contextlib.suppress(OSError):
+            os.replace(backup_path, target_path)
+    for folder in reversed(created_folders):
+        with contextlib.suppress(OSError):
+            os.rmdir(folder)
+
+
+def _extract_members(archive_path, destination_path, job, hash_index, members,
+                     category_folders, created_folders, replaced):
+    limits = ExtractionLimits(os.path.getsize(archive_path))
+
+    with ArchiveReader(archive_path, work_dir=destination_path) as archive:
+        if (listing := archive.listing()) is not None:
+            if members is not None:
+                selected = set(members)
+                listing = [member for member in listing if member.name in selected]
+            limits.check_listing(listing)
+            total_bytes = sum(member.size or 0 for member in listing)
+            required = total_bytes
+            if archive.extension == '.7z' and listing:
+                required += max(member.size or 0 for member in listing)
+            check_disk_space(destination_path, required)
+            job.set_totals(len(listing), total_bytes)
+
+        for member, stream in archive.iter_members(members):
+            job.check_cancelled()
+            if not member.basename:
+                continue
+            category = identify_file_category(member.basename)
+            if (category_folder := category_folders.get(category)) is None:
+                category_folder = os.path.join(destination_path, category)
+                if not os.path.isdir(category_folder):
+                    os.makedirs(category_folder)
+                    created_folders.append(category_folder)
+                category_folders[category] = category_folder
+
+            target_path = os.path.join(category_folder, member.basename)
+            backup_path = None
+            if os.path.exists(target_path):
+                if job.collision_policy == "skip":
+                    job.skipped += 1
+                    job.advance()
+                    continue
+                if job.collision_policy == "rename":
+                    target_path = unique_target_path(target_path, archive_path)
+                else:
+                    backup_path = f"{target_path}.replaced"
+                    os.replace(target_path, backup_path)
+                    replaced.append((target_path, backup_path))
+
+            if write_member(stream, target_path, job, hash_index, member, limits):
+                job.duplicates += 1
+                if backup_path is not None:
+                    os.replace(backup_path, target_path)
+                    replaced.remove((target_path, backup_path))
+            elif backup_path is not None:
+                job.overwritten += 1
+            elif target_path != os.path.join(category_folder, member.basename):
+                job.renamed += 1
+            job.advance()
+
+
+class InspectedMember:
+    """An archive member as it would be extracted: category, target and status.
+
+    ``status`` is "new"; "duplicate" when a file with the same name and size
+    is already at the target or in the hash index; or "conflict" when a
+    different file already has that name, or the archive holds two members
+    that would land on the same path.
+    """
+
+    def __init__(self, member, category, target_path, status="new", note=""):
+        self.member = member
+        self.category = category
+        self.target_path = target_path
+        self.status = status
+        self.note = note
+
+
+@profiled("extract.inspect")
+def inspect_archive(archive_path, destination_path=None, hash_index=None):
+    """List what extracting an archive would do, without writing anything.
+
+    Only the central directory or member headers are read, so this is
+    quick however large the archive; streaming tarballs and bare
+    compressed files are the exception and are decompressed to be listed.
+    """
+    with ArchiveReader(archive_path) as archive:
+        members = [member for member in archive.members() if member.basename]
+
+    inspected = []
+    seen_targets = {}
+    for member in members:
+        category = identify_file_category(member.basename)
+        target_key = (category, member.basename.lower())
+        target_path = (os.path.join(destination_path, category, member.basename)
+                       if destination_path else None)
+        entry = InspectedMember(member, category, target_path)
+        if (first := seen_targets.get(target_key)) is not None:
+            entry.status, entry.note = "conflict", f"same name as {first.member.name}"
+            if first.status == "new":
+                first.status, first.note = "conflict", f"same name as {member.name}"
+        elif target_path is not None and os.path.exists(target_path):
+            if member.size is not None and os.path.getsize(target_path) == member.size:
+                entry.status, entry.note = "duplicate", "already extracted"
+            else:
+                entry.status, entry.note = "conflict", "a different file has this name"
+        elif hash_index is not None and member.size is not None and (matches := [
+                path for path in hash_index.paths_with_size(member.size)
+                if os.path.basename(path).lower() == member.basename.lower()]):
+            entry.status, entry.note = "duplicate", f"already in library: {matches[0]}"
+        seen_targets.setdefault(target_key, entry)
+        inspected.append(entry)
+    return inspected
+
+
+def find_archives(folder):
+    """Return the archives directly inside ``folder``, sorted by path."""
+    with os.scandir(folder) as entries:
+        return sorted(
+            entry.path for entry in entries
+            if entry.is_file()
+            and os.path.splitext(entry.name)[1].lower() in ARCHIVE_EXTENSIONS)
+
+
+def unique_target_path(target_path, archive_path):
+    """Return a free path next to ``target_path`` tagged with the archive name."""
+    root, extension = os.path.splitext(target_path)
+    archive_stem = os.path.splitext(os.path.basename(archive_path))[0]
+    candidate = f"{root} ({archive_stem}){extension}"
+    counter = 2
+    while os.path.exists(candidate):
+        candidate = f"{root} ({archive_stem} {counter}){extension}"
+        counter += 1
+    return candidate
+
+
+class ProcessExtractionJob(ExtractionJob):
+    """The worker-process side of a batch job.
+
+    Progress snapshots are sent over ``progress_queue`` at most every
+    ``PROGRESS_INTERVAL`` seconds, and cancellation is read from a shared
+    event owned by the parent process.
+    """
+
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, index, archive_path, destination_path, progress_queue, cancel_event):
+        super().__init__(archive_path, destination_path)
+        self.index = index
+        self.progress_queue = progress_queue
+        self._cancel_event = cancel_event
+        self._last_post = 0.0
+
+    def post(self, kind):
+        now = time.monotonic()
+        if now - self._last_post < self.PROGRESS_INTERVAL:
+            return
+        self._last_post = now
+        self.progress_queue.put((self.index, self.files_done, self.bytes_done,
+                                 self.total_files, self.total_bytes))
+
+
+def _extract_to_staging(index, archive_path, staging_path, progress_queue, cancel_event,
+                        members=None, collision_policy="rename"):
+    job = ProcessExtractionJob(
+        index, archive_path, staging_path, progress_queue, cancel_event)
+    job.collision_policy = collision_policy
+    extract_archive(archive_path, staging_path, job, members=members)
+    written = {os.path.relpath(path, staging_path): (size, digest)
+               for path, size, digest in job.written}
+    return (job.files_done, job.bytes_done, written,
+            (job.renamed, job.skipped, job.overwritten))
+
+
+class BatchSummary:
+    """Aggregated outcome of a batch extraction."""
+
+    def __init__(self):
+        self.archives = 0
+        self.failed = []
+        self.cancelled = []
+        self.files = 0
+        self.bytes = 0
+        self.renamed = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.overwritten = 0
+        self.categories = defaultdict(int)
+        self.elapsed = 0.0
+
+    def describe(self):
+        lines = [
+            f"Extracted {self.files} files ({format_size(self.bytes)}) from "
+            f"{self.archives} archives in {self.elapsed:.1f}s."
+        ]
+        lines.extend(f"  {category}: {count}"
+                     for category, count in sorted(self.categories.items()))
+        if self.duplicates:
+            lines.append(
+                f"Skipped {self.duplicates} files already in the library.")
+        if self.renamed or self.skipped or self.overwritten:
+            lines.append(f"Collisions: {self.renamed} renamed, "
+                         f"{self.skipped} skipped, {self.overwritten} overwritten.")
+        if self.cancelled:
+            lines.append(f"Cancelled: {', '.join(self.cancelled)}")
+        if self.failed:
+            lines.append(f"Failed: {', '.join(self.failed)}")
+        return "\n".join(lines)
+
+
+class BatchExtraction:
+    """Extract many archives in parallel worker processes.
+
+    Decompression is CPU bound, so archives fan out over a process pool sized
+    to the core count. Each worker writes into its own staging folder inside
+    the destination; once every worker is done the staged files are renamed
+    into the category folders in sorted archive order. Name collisions are
+    therefore resolved the same way on every run, according to
+    ``collision_policy``: "rename" keeps the earlier file and tags the later
+    one with its archive name, "skip" keeps the earlier file only and
+    "overwrite" lets the later archive win. Files whose content is already
+    in ``hash_index`` are not placed at all.
+    """
+
+    def __init__(self, jobs, destination_path, collision_policy="rename", max_workers=None, hash_index=None):
+        self.jobs = sorted(jobs, key=lambda job: job.archive_path)
+        self.destination_path = destination_path
+        self.collision_policy = collision_policy
+        self.hash_index = hash_index
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.summary = BatchSummary()
+
+    @profiled("extract.batch")
+    def run(self):
+        started = time.monotonic()
+        os.makedirs(self.destination_path, exist_ok=True)
+        staging_root = tempfile.mkdtemp(
+            prefix=".batch_extraction_", dir=self.destination_path)
+        try:
+            staged = self._extract_all(staging_root)
+            for index, job in enumerate(self.jobs):
+                if index in staged:
+                    staging_name, written = staged[index]
+                    self._place_staged_files(
+                        job, os.path.join(staging_root, staging_name), written)
+                    job.status = "Done"
+                    job.finished_at = time.monotonic()
+                    job.post("done")
+        finally:
+            shutil.rmtree(staging_root, ignore_errors=True)
+        self.summary.elapsed = time.monotonic() - started
+        return self.summary
+
+    def _extract_all(self, staging_root):
+        staged = {}
+        workers = max(1, min(self.max_workers, len(self.jobs)))
+        with PROCESS_CONTEXT.Manager() as sync, ProcessPoolExecutor(
+                max_workers=workers, mp_context=PROCESS_CONTEXT) as executor:
+            progress_queue = sync.Queue()
+            cancel_events = [sync.Event() for _ in self.jobs]
+            futures = {}
+            for index, job in enumerate(self.jobs):
+                staging_name = f"{index:04d}"
+                future = executor.submit(
+                    _extract_to_staging, index, job.archive_path,
+                    os.path.join(staging_root, staging_name),
+                    progress_queue, cancel_events[index], job.members,
+                    self.collision_policy)
+                futures[future] = (index, staging_name)
+
+            pending = set(futures)
+            while pending:
+                done, pending = wait(
+                    pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                self._relay_progress(progress_queue, cancel_events)
+                for future in done:
+                    index, staging_name = futures[future]
+                    if (written := self._finish_worker(self.jobs[index], future)) is not None:
+                        staged[index] = (staging_name, written)
+        return staged
+
+    def _relay_progress(self, progress_queue, cancel_events):
+        for index, job in enumerate(self.jobs):
+            if job.cancelled and not cancel_events[index].is_set():
+                cancel_events[index].set()
+        while True:
+            try:
+                index, files_done, bytes_done, total_files, total_bytes = progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            job = self.jobs[index]
+            if job.finished:
+                continue
+            if job.started_at is None:
+                job.status = "Running"
+                job.started_at = time.monotonic()
+            job.files_done = files_done
+            job.bytes_done = bytes_done
+            job.total_files = total_files
+            job.total_bytes = total_bytes
+            job.post("progress")
+
+    def _finish_worker(self, job, future):
+        """Record a finished worker; return its written files if they should be placed."""
+        if job.started_at is None:
+            job.started_at = time.monotonic()
+        try:
+            job.files_done, job.bytes_done, written, collisions = future.result()
+        except ExtractionCancelled:
+            job.status = "Cancelled"
+            self.summary.cancelled.append(job.name)
+        except Exception as error:
+            job.status = "Failed"
+            job.error = error
+            self.summary.failed.append(job.name)
+        else:
+            # Members of one archive that collided with each other in staging
+            job.renamed, job.skipped, job.overwritten = collisions
+            self.summary.renamed += job.renamed
+            self.summary.skipped += job.skipped
+            self.summary.overwritten += job.overwritten
+            job.status = "Placing"
+            job.post("progress")
+            return written
+        job.finished_at = time.monotonic()
+        job.post(job.status.lower())
+        return None
+
+    @profiled("extract.place_files")
+    def _place_staged_files(self, job, staging_path, written):
+        self.summary.archives += 1
+        if not os.path.isdir(staging_path):
+            return
+        for category in sorted(os.listdir(staging_path)):
+            category_staging = os.path.join(staging_path, category)
+            category_folder = os.path.join(self.destination_path, category)
+            os.makedirs(category_folder, exist_ok=True)
+
+            for file_name in sorted(os.listdir(category_staging)):
+                source = os.path.join(category_staging, file_name)
+                target = os.path.join(category_folder, file_name)
+                size, digest = written.get(
+                    os.path.join(category, file_name), (None, None))
+                if self.hash_index is not None and digest and self.hash_index.find_by_digest(size, digest):
+                    self.summary.duplicates += 1
+                    job.duplicates += 1
+                    continue
+                if os.path.exists(target):
+                    if self.collision_policy == "skip":
+                        self.summary.skipped += 1
+                        continue
+                    if self.collision_policy == "rename":
+                        target = unique_target_path(target, job.archive_path)
+                        self.summary.renamed += 1
+                    else:
+                        self.summary.overwritten += 1
+                self.summary.bytes += os.path.getsize(source)
+                os.replace(source, target)
+                if self.hash_index is not None:
+                    self.hash_index.add(target, digest)
+                self.summary.files += 1
+                self.summary.categories[category] += 1
+
+
+class ExtractionManager:
+    """Run archive extractions off the Tk main thread.
+
+    Single archives go to a thread pool where ``extract_func(archive_path,
+    destination_path, job)`` does the work and reports through ``job``;
+    batches run in worker processes via ``BatchExtraction``. Progress events
+    are queued on ``events`` for the UI to drain with ``consume_events()``
+    from an ``after()`` loop.
+    """
+
+    TERMINAL_EVENTS = ("done", "cancelled", "failed", "batch_done")
+
+    def __init__(self, extract_func=extract_archive, max_workers=None, hash_index=None):
+        self.extract_func = extract_func
+        self.hash_index = hash_index
+        self.events = queue.Queue()
+        self.jobs = []
+        self.outstanding = 0
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(4, os.cpu_count() or 1),
+            thread_name_prefix="extract")
+
+    def submit(self, archive_path, destination_path, members=None, collision_policy="rename"):
+        """Queue an archive (or just the named ``members``) for extraction and return its job."""
+        job = ExtractionJob(archive_path, destination_path, self.events, members, collision_policy)
+        self.jobs.append(job)
+        self.outstanding += 1
+        job.post("queued")
+        self.executor.submit(self._run, job)
+        return job
+
+    def submit_batch(self, archive_paths, destination_path, collision_policy="rename"):
+        """Extract several archives in parallel and return the batch.
+
+        A ``("batch_done", batch)`` event is posted once every file has been
+        placed; ``batch.summary`` then holds the aggregated result.
+        """
+        jobs = [ExtractionJob(archive_path, destination_path, self.events)
+                for archive_path in sorted(archive_paths)]
+        self.jobs.extend(jobs)
+        self.outstanding += len(jobs) + 1
+        batch = BatchExtraction(jobs, destination_path,
+                                collision_policy, hash_index=self.hash_index)
+        for job in jobs:
+            job.batch = batch
+            job.post("queued")
+        threading.Thread(target=self._run_batch, args=(batch,),
+                         name="extract-batch", daemon=True).start()
+        return batch
+
+    def _run(self, job):
+        if job.cancelled:
+            job.status = "Cancelled"
+            job.post("cancelled")
+            return
+        job.status = "Running"
+        job.started_at = time.monotonic()
+        job.post("started")
+        try:
+            self.extract_func(job.archive_path, job.destination_path, job)
+        except ExtractionCancelled:
+            job.status = "Cancelled"
+        except Exception as error:
+            job.status = "Failed"
+            job.error = error
+        else:
+            job.status = "Done"
+        job.finished_at = time.monotonic()
+        job.post(job.status.lower())
+
+    def _run_batch(self, batch):
+        try:
+            batch.run()
+        except Exception as error:
+            for job in batch.jobs:
+                if not job.finished:
+                    job.status = "Failed"
+                    job.error = error
+                    batch.summary.failed.append(job.name)
+                    job.post("failed")
+        self.events.put(("batch_done", batch))
+
+    def consume_events(self):
+        """Drain pending events; call from the Tk thread only."""
+        events = []
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] in self.TERMINAL_EVENTS:
+                self.outstanding -= 1
+            events.append(event)
+        return events
+
+    def active(self):
+        return self.outstanding > 0
+
+    def cancel_all(self):
+        for job in self.jobs:
+            job.cancel()
+
+    def clear_finished(self):
+        self.jobs = [job for job in self.jobs if not job.finished]
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
+
+
+HASH_INDEX_FILE = 'hash_index.json'
+PARTIAL_HASH_BYTES = 64 * 1024
+
+
+def partial_file_hash(path):
+    """Hash the first and last 64 KB of a file as a cheap duplicate prefilter."""
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        content_hash.update(file.read(PARTIAL_HASH_BYTES))
+        if file.seek(0, os.SEEK_END) > 2 * PARTIAL_HASH_BYTES:
+            file.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+            content_hash.update(file.read(PARTIAL_HASH_BYTES))
+    return content_hash.hexdigest()
+
+
+def full_file_hash(path):
+    """Hash a whole file in chunks; matches the hash ``write_member`` records."""
+    content_hash = hashlib.blake2b()
+    buffer = bytearray(COPY_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as file:
+        while size := file.readinto(buffer):
+            content_hash.update(view[:size])
+    return content_hash.hexdigest()
+
+
+class HashIndex:
+    """Persistent content fingerprints of library files, for deduplication.
+
+    Each entry is ``[size, mtime_ns, partial_hash, full_hash]`` keyed by
+    path, and is reused while the file's size and mtime are unchanged, so
+    only new or modified files are ever read. Hashing is staged: files are
+    compared by partial hash only when their sizes collide, and fully hashed
+    only when the partial hashes match too. Hashes are computed on a thread
+    pool; the index is safe to share between extraction threads.
+    """
+
+    def __init__(self, index_path=None, max_workers=None):
+        self.index_path = index_path
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) + 4)
+        self.entries = {}
+        self.size_map = defaultdict(set)
+        self.digest_map = defaultdict(set)
+        self.lock = threading.RLock()
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        with self.lock:
+            for path, entry in data.get("entries", {}).items():
+                self._set(path, list(entry))
+            self.dirty = False
+
+    def save(self):
+        """Write the index atomically if anything changed."""
+        if not self.index_path or not self.dirty:
+            return
+        with self.lock:
+            data = {"version": 1, "entries": dict(self.entries)}
+            self.dirty = False
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.index_path)
+
+    def _set(self, path, entry):
+        self._discard(path)
+        self.entries[path] = entry
+        self.size_map[entry[0]].add(path)
+        if entry[3]:
+            self.digest_map[entry[3]].add(path)
+        self.dirty = True
+
+    def _discard(self, path):
+        if (entry := self.entries.pop(path, None)) is None:
+            return
+        for mapping, key in ((self.size_map, entry[0]), (self.digest_map, entry[3])):
+            if (paths := mapping.get(key)) is not None:
+                paths.discard(path)
+                if not paths:
+                    del mapping[key]
+        self.dirty = True
+
+    def remove(self, path):
+        with self.lock:
+            self._discard(path)
+
+    def _current_entry(self, path):
+        """Return an up-to-date entry for ``path``, or None if it is gone."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.remove(path)
+            return None
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+                entry = [stat.st_size, stat.st_mtime_ns, None, None]
+                self._set(path, entry)
+            return entry
+
+    def _fill_hashes(self, paths, field, hasher):
+        """Compute the partial (field 2) or full (field 3) hash where missing."""
+        with self.lock:
+            todo = [path for path in paths
+                    if (entry := self.entries.get(path)) is not None and entry[field] is None]
+        if not todo:
+            return
+
+        def hash_path(path):
+            try:
+                return path, hasher(path)
+            except OSError:
+                return path, None
+
+        if len(todo) == 1:
+            results = [hash_path(todo[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(hash_path, todo))
+
+        with self.lock:
+            for path, digest in results:
+                if digest is None:
+                    self._discard(path)
+                elif (entry := self.entries.get(path)) is not None:
+                    entry[field] = digest
+                    if field == 3:
+                        self.digest_map[digest].add(path)
+                    self.dirty = True
+
+    def add(self, path, digest=None):
+        """Index a file, optionally with a full hash computed while writing it."""
+        entry = self._current_entry(path)
+        if entry is not None and digest is not None and entry[3] != digest:
+            with self.lock:
+                entry[3] = digest
+                self.digest_map[digest].add(path)
+                self.dirty = True
+
+    def digest(self, path):
+        """Return the full hash of ``path``, hashing it only if it changed since last time."""
+        if self._current_entry(path) is None:
+            return None
+        self._fill_hashes([path], 3, full_file_hash)
+        return self.known_digest(path)
+
+    def paths_with_size(self, size):
+        with self.lock:
+            return sorted(self.size_map.get(size, ()))
+
+    def known_digest(self, path):
+        """Return the full hash already recorded for ``path``, without reading it."""
+        with self.lock:
+            entry = self.entries.get(path)
+        return entry[3] if entry else None
+
+    def find_by_digest(self, size, digest, exclude=None):
+        """Return an indexed file with this size and full hash, or None."""
+        with self.lock:
+            peers = [path for path in self.size_map.get(size, ()) if path != exclude]
+        peers = [path for path in peers
+                 if (entry := self._current_entry(path)) is not None and entry[0] == size]
+        self._fill_hashes(peers, 3, full_file_hash)
+        with self.lock:
+            matches = sorted(self.digest_map.get(digest, set()) - {exclude})
+        return matches[0] if matches else None
+
+    @profiled("hash_index.add_unique")
+    def add_unique(self, paths):
+        """Index new files, skipping any whose content is already indexed.
+
+        Returns ``(added, duplicates)`` where ``duplicates`` maps each
+        skipped path to the file it duplicates. Earlier paths win over later
+        ones in the same call, and paths that are already indexed are kept.
+        """
+        with self.lock:
+            indexed = {path for path in paths if path in self.entries}
+        candidates = [path for path in dict.fromkeys(paths)
+                      if self._current_entry(path) is not None]
+        candidate_set = set(candidates) - indexed
+
+        with self.lock:
+            sizes = {self.entries[path][0] for path in candidates}
+            colliding = [path for size in sizes if len(self.size_map[size]) > 1
+                         for path in self.size_map[size]]
+        colliding = [path for path in colliding if self._current_entry(path) is not None]
+        self._fill_hashes(colliding, 2, partial_file_hash)
+
+        with self.lock:
+            by_partial = defaultdict(list)
+            for path in colliding:
+                if (entry := self.entries.get(path)) is not None and entry[2]:
+                    by_partial[(entry[0], entry[2])].append(path)
+        self._fill_hashes([path for group in by_partial.values() if len(group) > 1
+                           for path in group], 3, full_file_hash)
+
+        added = []
+        added_set = set()
+        duplicates = {}
+        with self.lock:
+            for path in candidates:
+                entry = self.entries.get(path)
+                if entry is None:
+                    continue
+                originals = sorted(
+                    other for other in self.digest_map.get(entry[3], ())
+                    if other != path and (other not in candidate_set or other in added_set)
+                ) if entry[3] and path in candidate_set else []
+                if originals:
+                    duplicates[path] = originals[0]
+                    self._discard(path)
+                else:
+                    added.append(path)
+                    added_set.add(path)
+        return added, duplicates
+
+
+CONFLICT_CACHE_FILE = 'conflict_cache.json'
+CONFLICT_POOL_MIN_FILES = 200
+CONFLICT_POOL_CHUNK_SIZE = 32
+RESOURCE_KEY = struct.Struct("<IIQ")
+
+
+def format_resource_key(key):
+    """Format a packed resource key the way modding tools show it (type:group:instance)."""
+    resource_type, group, instance = RESOURCE_KEY.unpack(key)
+    return f"{resource_type:08X}:{group:08X}:{instance:016X}"
+
+
+def _read_package_keys(path):
+    """Return ``(path, size, mtime_ns, packed keys)``; size is None if the file is gone."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, None, None, None
+    try:
+        keys = b"".join(RESOURCE_KEY.pack(resource.type, resource.group, resource.instance)
+                        for resource in read_dbpf_index(path))
+    except (OSError, DBPFError):
+        keys = b""
+    return path, stat.st_size, stat.st_mtime_ns, keys
+
+
+class ConflictDetector:
+    """Find packages that override the same (type, group, instance) resources.
+
+    Each package's index table is reduced to its packed resource keys,
+    cached per path with the size and mtime it was read at, and merged into
+    ``owners``, one map from key to the package holding it (or a tuple of
+    packages once it is shared). ``analyze`` only reads new or changed
+    packages, on a process pool when there are many, so re-analysing after
+    adding one mod reads only that mod. The cache persists to ``cache_path``.
+    """
+
+    def __init__(self, cache_path=None, max_workers=None):
+        self.cache_path = cache_path
+        self.max_workers = max_workers
+        self.files = {}
+        self.owners = {}
+        self.shared = set()
+        self.files_read = 0
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.files)
+
+    def load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        for path, (size, mtime_ns, keys) in data.get("files", {}).items():
+            self._set(path, size, mtime_ns, base64.b64decode(keys))
+        self.dirty = False
+
+    def save(self):
+        """Write the cache atomically if anything changed."""
+        if not self.cache_path or not self.dirty:
+            return
+        data = {"version": 1, "files": {
+            path: [size, mtime_ns, base64.b64encode(keys).decode("ascii")]
+            for path, (size, mtime_ns, keys) in self.files.items()}}
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.cache_path)
+        self.dirty = False
+
+    @staticmethod
+    def _split(keys):
+        size = RESOURCE_KEY.size
+        return {keys[offset:offset + size] for offset in range(0, len(keys), size)}
+
+    def _set(self, path, size, mtime_ns, keys):
+        self._discard(path)
+        self.files[path] = (size, mtime_ns, keys)
+        owners = self.owners
+        for key in self._split(keys):
+            if (owner := owners.get(key)) is None:
+                owners[key] = path
+                continue
+            owners[key] = (owner, path) if owner.__class__ is str else owner + (path,)
+            self.shared.add(key)
+        self.dirty = True
+
+    def _discard(self, path):
+        if (entry := self.files.pop(path, None)) is None:
+            return
+        owners = self.owners
+        for key in self._split(entry[2]):
+            owner = owners[key]
+            if owner.__class__ is str:
+                del owners[key]
+            elif len(remaining := tuple(other for other in owner if other != path)) > 1:
+                owners[key] = remaining
+            else:
+                owners[key] = remaining[0]
+                self.shared.discard(key)
+        self.dirty = True
+
+    @profiled("conflicts.analyze")
+    def analyze(self, paths):
+        """Track exactly ``paths``, reading only packages that are new or changed."""
+        paths = set(paths)
+        for path in [path for path in self.files if path not in paths]:
+            self._discard(path)
+        stale = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self._discard(path)
+                continue
+            entry = self.files.get(path)
+            if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+                stale.append(path)
+
+        self.files_read = len(stale)
+        if len(stale) >= CONFLICT_POOL_MIN_FILES:
+            with ProcessPoolExecutor(max_workers=self.max_workers,
+                                     mp_context=PROCESS_CONTEXT) as executor:
+                self._apply(executor.map(
+                    _read_package_keys, stale, chunksize=CONFLICT_POOL_CHUNK_SIZE))
+        else:
+            self._apply(map(_read_package_keys, stale))
+        return self.conflicts()
+
+    def _apply(self, results):
+        for path, size, mtime_ns, keys in results:
+            if size is None:
+                self._discard(path)
+            else:
+                self._set(path, size, mtime_ns, keys)
+
+    def conflicts(self):
+        """Return ``[(path_a, path_b, shared_keys)]`` for every overlapping pair, most first."""
+        pairs = defaultdict(int)
+        for key in self.shared:
+            for pair in itertools.combinations(sorted(self.owners[key]), 2):
+                pairs[pair] += 1
+        return sorted(((first, second, count) for (first, second), count in pairs.items()),
+                      key=lambda conflict: (-conflict[2], conflict[0], conflict[1]))
+
+    def shared_keys(self, first, second):
+        """Return the packed keys both packages contain."""
+        return sorted(key for key in self.shared
+                      if first in self.owners[key] and second in self.owners[key])
+
+
+MERGE_MANIFEST_SUFFIX = '.merge.json'
+MERGE_PACKAGE_LIMIT = 512 * 1024 * 1024
+
+
+class MergeResult:
+    """What one ``PackageMerger.merge`` call did."""
+
+    def __init__(self):
+        self.merged = []
+        self.unchanged = 0
+        self.skipped = []
+        self.written = []
+        self.deleted = []
+        self.removed_sources = []
+        self.kept_sources = []
+
+
+def _source_layout(path, resources, size):
+    """Return ``(offsets, gaps)``: each resource's offset and every other byte range.
+
+    Together with the resource blobs the gaps (header, index, padding,
+    anything else) rebuild the file byte for byte.
+    """
+    covered = sorted((resource.offset, resource.offset + resource.size)
+                     for resource in resources if resource.size)
+    gaps = []
+    position = 0
+    with open(path, "rb") as file:
+        for start, end in covered + [(size, size)]:
+            if start > position:
+                file.seek(position)
+                gaps.append([position, base64.b64encode(file.read(start - position)).decode("ascii")])
+            position = max(position, end)
+    return [resource.offset for resource in resources], gaps
+
+
+class PackageMerger:
+    """Combine many small .package files into a few large ones, and split them again.
+
+    The game opens every package separately, so thousands of tiny mods load
+    far slower than the same resources in a few big files. A merge set is
+    described by its manifest (``<name>.merge.json``); its packages
+    (``<name>.package``, ``<name>_2.package``, ...) sit next to it and are
+    filled up to ``package_limit`` bytes each. Resource blobs are copied
+    from memory-mapped sources without being decoded. The manifest records,
+    for every source path, its size, mtime, package and index range, plus
+    the original resource offsets and every byte that isn't resource data,
+    so ``unmerge`` rebuilds each original package byte for byte. Merging
+    again only rewrites packages whose sources were added, changed or
+    unmerged.
+    """
+
+    def __init__(self, manifest_path, package_limit=MERGE_PACKAGE_LIMIT):
+        self.manifest_path = manifest_path
+        self.folder = os.path.dirname(os.path.abspath(manifest_path))
+        self.name = os.path.basename(manifest_path)
+        if self.name.lower().endswith(MERGE_MANIFEST_SUFFIX):
+            self.name = self.name[:-len(MERGE_MANIFEST_SUFFIX)]
+        self.package_limit = package_limit
+        self.packages = {}
+        self.sources = {}
+
+    def load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, "r") as file:
+            data = json.load(file)
+        self.packages = {name: list(sources) for name, sources in data["packages"].items()}
+        self.sources = data["sources"]
+
+    def save(self):
+        if not self.sources:
+            if os.path.exists(self.manifest_path):
+                os.remove(self.manifest_path)
+            return
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"version": 2, "packages": self.packages, "sources": self.sources},
+                      file, indent=1)
+        os.replace(temp_path, self.manifest_path)
+
+    def package_paths(self):
+        return [os.path.join(self.folder, name) for name in self.packages]
+
+    def _assign(self, size, package_sizes):
+        """Return the package a new source of ``size`` bytes should go into."""
+        if self.packages:
+            last = list(self.packages)[-1]
+            if not package_sizes[last] or package_sizes[last] + size <= self.package_limit:
+                package_sizes[last] += size
+                return last
+        number = len(self.packages) + 1
+        while True:
+            name = f"{self.name}.package" if number == 1 else f"{self.name}_{number}.package"
+            if name not in self.packages and not os.path.exists(os.path.join(self.folder, name)):
+                break
+            number += 1
+        self.packages[name] = []
+        package_sizes[name] = size
+        return name
+
+    @profiled("merge.merge")
+    def merge(self, source_paths, remove_sources=False):
+        """Merge ``source_paths`` into the set and rewrite only the packages that changed.
+
+        Sources already merged and unchanged are left alone, as are merged
+        sources whose file has since been removed. With ``remove_sources``
+        every source file now held in the set is deleted, so the game does
+        not load its resources twice, but only once it has been checked
+        that ``unmerge`` would rebuild it exactly; any other source is kept
+        and listed in ``kept_sources``.
+        """
+        result = MergeResult()
+        fresh = {}
+        present = []
+        package_sizes = {name: sum(self.sources[path]["size"] for path in paths)
+                         for name, paths in self.packages.items()}
+        own_packages = set(self.package_paths())
+        for path in dict.fromkeys(os.path.abspath(path) for path in source_paths):
+            if path in own_packages:
+                continue
+            entry = self.sources.get(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                if entry is None:
+                    result.skipped.append(path)
+                else:
+                    result.unchanged += 1
+                continue
+            if entry is not None and (entry["size"], entry["mtime_ns"]) == (
+                    stat.st_size, stat.st_mtime_ns):
+                result.unchanged += 1
+                present.append(path)
+                continue
+            try:
+                resources = read_dbpf_index(path)
+            except (OSError, DBPFError):
+                result.skipped.append(path)
+                continue
+            try:
+                offsets, gaps = _source_layout(path, resources, stat.st_size)
+            except OSError:
+                result.skipped.append(path)
+                continue
+            if entry is None:
+                package = self._assign(stat.st_size, package_sizes)
+                self.packages[package].append(path)
+                entry = self.sources[path] = {"package": package}
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, offsets=offsets, gaps=gaps)
+            fresh[path] = resources
+            result.merged.append(path)
+
+        for package in dict.fromkeys(self.sources[path]["package"] for path in fresh):
+            self._write_package(package, fresh)
+            result.written.append(os.path.join(self.folder, package))
+        self.save()
+        if remove_sources:
+            self._remove_sources(result.merged + present, result)
+        return result
+
+    def _rebuild(self, entry, mapped, resources):
+        """Yield ``(offset, data)`` pieces that together make up a source file.
+
+        ``data`` may be a slice of ``mapped``; use it before the next piece.
+        """
+        for offset, data in entry["gaps"]:
+            yield offset, base64.b64decode(data)
+        held = resources[entry["first"]:entry["first"] + entry["count"]]
+        for resource, offset in zip(held, entry["offsets"]):
+            with mapped.view[resource.offset:resource.offset + resource.size] as data:
+                yield offset, data
+
+    def _remove_sources(self, paths, result):
+        """Delete each source whose rebuild from the set matches it exactly."""
+        by_package = defaultdict(list)
+        for path in paths:
+            by_package[self.sources[path]["package"]].append(path)
+        for package, package_sources in by_package.items():
+            package_path = os.path.join(self.folder, package)
+            resources = read_dbpf_index(package_path)
+            with MappedFile(package_path) as mapped:
+                for path in package_sources:
+                    if self._rebuilds_exactly(path, mapped, resources):
+                        os.remove(path)
+                        result.removed_sources.append(path)
+                    else:
+                        result.kept_sources.append(path)
+
+    def _rebuilds_exactly(self, path, mapped, resources):
+        entry = self.sources[path]
+        if "gaps" not in entry or len(entry["offsets"]) != entry["count"]:
+            return False
+        try:
+            if os.path.getsize(path) != entry["size"]:
+                return False
+            with MappedFile(path) as source, contextlib.closing(
+                    self._rebuild(entry, mapped, resources)) as pieces:
+                for offset, data in pieces:
+                    with source.view[offset:offset + len(data)] as original:
+                        if original != data:
+                            return False
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def _write_package(self, package, fresh):
+        """Rebuild ``package`` from its sources, reusing the old file for unchanged ones."""
+        package_path = os.path.join(self.folder, package)
+        old = MappedFile(package_path) if any(
+            path not in fresh for path in self.packages[package]) else None
+        old_resources = read_dbpf_index(package_path) if old is not None else None
+        ranges = {}
+        opened = []
+
+        def blobs():
+            for path in self.packages[package]:
+                if path in fresh:
+                    source = MappedFile(path)
+                    opened.append(source)
+                    resources = fresh[path]
+                else:
+                    source = old
+                    entry = self.sources[path]
+                    resources = old_resources[entry["first"]:entry["first"] + entry["count"]]
+                ranges[path] = len(resources)
+                yield from source.blobs(resources)
+                if source is not old:
+                    source.close()
+
+        temp_path = f"{package_path}.tmp"
+        blob_stream = blobs()
+        try:
+            with open(temp_path, "wb") as target:
+                write_dbpf(target, blob_stream)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            # Release any slice the generator still holds before unmapping
+            blob_stream.close()
+            for source in opened + [old]:
+                if source is not None and not source.map.closed:
+                    source.close()
+        os.replace(temp_path, package_path)
+
+        first = 0
+        for path in self.packages[package]:
+            self.sources[path].update(first=first, count=ranges[path])
+            first += ranges[path]
+
+    @profiled("merge.unmerge")
+    def unmerge(self, source_paths=None):
+        """Restore merged sources (all by default) and drop them from the set.
+
+        Each source is rebuilt byte for byte at its original path with its
+        original mtime, unless a file already exists there. Sources merged
+        by older versions, which kept no layout, are rebuilt as an
+        equivalent package instead. Packages left empty are deleted,
+        the rest are rewritten. Returns a MergeResult whose ``merged`` lists
+        the restored paths.
+        """
+        result = MergeResult()
+        if source_paths is None:
+            targets = list(self.sources)
+        else:
+            targets = [path for path in dict.fromkeys(
+                os.path.abspath(path) for path in source_paths) if path in self.sources]
+        removing = set(targets)
+
+        for package in dict.fromkeys(self.sources[path]["package"] for path in targets):
+            package_path = os.path.join(self.folder, package)
+            resources = read_dbpf_index(package_path)
+            with MappedFile(package_path) as mapped:
+                for path in (path for path in targets if self.sources[path]["package"] == package):
+                    entry = self.sources[path]
+                    if not os.path.exists(path):
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        temp_path = f"{path}.tmp"
+                        with open(temp_path, "wb") as target:
+                            if "gaps" in entry:
+                                target.truncate(entry["size"])
+                                with contextlib.closing(
+                                        self._rebuild(entry, mapped, resources)) as pieces:
+                                    for offset, data in pieces:
+                                        target.seek(offset)
+                                        target.write(data)
+                            else:
+                                write_dbpf(target, mapped.blobs(
+                                    resources[entry["first"]:entry["first"] + entry["count"]]))
+                        os.replace(temp_path, path)
+                        os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+                        result.merged.append(path)
+            self.packages[package] = [
+                path for path in self.packages[package] if path not in removing]
+            if self.packages[package]:
+                self._write_package(package, {})
+                result.written.append(package_path)
+            else:
+                del self.packages[package]
+                os.remove(package_path)
+                result.deleted.append(package_path)
+        for path in targets:
+            del self.sources[path]
+        self.save()
+        return result
+
+
+PREVIEW_CACHE_FILE = 'preview_cache.db'
+PREVIEW_CACHE_LIMIT = 64 * 1024 * 1024
+PREVIEW_THUMBNAIL_SIZE = 128
+PREVIEW_NAME_LIMIT = 8
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Thumbnail resource types, best first: catalog and CAS thumbnails, then icons.
+DBPF_THUMBNAIL_TYPES = (
+    0x3C2A8647,  # Build/Buy thumbnail
+    0x3C1AF1F2,  # CAS part thumbnail
+    0x5B282D45,  # Body part thumbnail
+    0xCD9DE247,  # Sim thumbnail
+    0x0580A2B4,  # Thumbnail
+    0x0580A2B5,  # Thumbnail
+    0x0580A2B6,  # Thumbnail
+    0x2E75C764,  # Icon
+    0x2F7D0004,  # PNG image
+)
+DBPF_CAS_PART_TYPE = 0x034AEECB
+TUNING_NAME = re.compile(rb'<I\s[^>]*?\bn="([^"]+)"')
+
+PREVIEW_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS previews (
+    digest TEXT PRIMARY KEY,
+    metadata TEXT NOT NULL,
+    thumbnail BLOB,
+    size INTEGER NOT NULL,
+    last_used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS previews_last_used ON previews (last_used);
+"""
+
+
+def make_thumbnail(data, size=PREVIEW_THUMBNAIL_SIZE):
+    """Return PNG bytes at most ``size`` pixels square, or None if undecodable.
+
+    Without Pillow only PNG sources can be shown, and they are kept as is.
+    Pillow is imported on first use, so startup and the CLI don't pay for it.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return data if data.startswith(PNG_SIGNATURE) else None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((size, size))
+            output = io.BytesIO()
+            image.convert("RGBA").save(output, "PNG")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return output.getvalue()
+
+
+def _read_7bit_int(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def _cas_part_name(data):
+    """Read the part name from a CAS part resource without presets, else None."""
+    try:
+        _, _, preset_count = struct.unpack_from("<3I", data, 0)
+        if preset_count:
+            return None
+        length, offset = _read_7bit_int(data, 12)
+    except (struct.error, IndexError):
+        return None
+    return data[offset:offset + length].decode("utf-16-be", "replace") or None
+
+
+@profiled("preview.extract")
+def extract_preview(path, size=PREVIEW_THUMBNAIL_SIZE):
+    """Return ``(metadata, thumbnail)`` for a package; thumbnail is PNG bytes or None.
+
+    Only the index, the best thumbnail and a few named resources (CAS part
+    names and tuning names) are decoded. A ``creator:`` prefix shared by
+    the tuning names is reported as the creator.
+    """
+    metadata = {"size": os.path.getsize(path), "resources": 0, "kind": None,
+                "names": [], "creator": None}
+    try:
+        resources = read_dbpf_index(path)
+    except DBPFError as error:
+        metadata["error"] = str(error)
+        return metadata, None
+    metadata["resources"] = len(resources)
+    metadata["kind"] = dbpf_content_kind(resources)
+
+    thumbnail = None
+    priority = {resource_type: rank for rank, resource_type in enumerate(DBPF_THUMBNAIL_TYPES)}
+    tuning_types = {resource_type for resource_type, kind in DBPF_CONTENT_KINDS.items()
+                    if kind == "tuning"}
+    names = []
+    with MappedFile(path) as mapped:
+        for resource in sorted((resource for resource in resources
+                                if resource.type in priority),
+                               key=lambda resource: priority[resource.type]):
+            if (data := read_dbpf_resource(mapped, resource)) and (
+                    thumbnail := make_thumbnail(data, size)):
+                break
+        for resource in resources:
+            if len(names) >= PREVIEW_NAME_LIMIT:
+                break
+            if resource.type == DBPF_CAS_PART_TYPE:
+                if (data := read_dbpf_resource(mapped, resource)) and (
+                        name := _cas_part_name(data)):
+                    names.append(name)
+            elif resource.type in tuning_types:
+                if (data := read_dbpf_resource(mapped, resource)) and (
+                        match := TUNING_NAME.search(data, 0, 4096)):
+                    names.append(match.group(1).decode("utf-8", "replace"))
+    metadata["names"] = list(dict.fromkeys(names))
+    prefixes = [name.split(":", 1)[0] for name in names if ":" in name]
+    if prefixes:
+        metadata["creator"] = max(set(prefixes), key=prefixes.count)
+    return metadata, thumbnail
+
+
+class PreviewCache:
+    """On-disk LRU cache of package previews keyed by content hash.
+
+    Rows live in one SQLite file; each read refreshes the row's last-used
+    time, and writes evict the least recently used rows once the stored
+    previews exceed ``limit`` bytes. Safe to share between threads.
+    """
+
+    def __init__(self, path=PREVIEW_CACHE_FILE, limit=PREVIEW_CACHE_LIMIT):
+        self.path = path
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(PREVIEW_CACHE_SCHEMA)
+        self.total = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM previews").fetchone()[0]
+
+    def get(self, digest):
+        """Return ``(metadata, thumbnail)`` for ``digest``, or None on a miss."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT metadata, thumbnail FROM previews WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                PROFILER.count("preview.cache_misses")
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE previews SET last_used = ? WHERE digest = ?",
+                                        (time.time_ns(), digest))
+        PROFILER.count("preview.cache_hits")
+        return json.loads(row[0]), row[1]
+
+    def put(self, digest, metadata, thumbnail):
+        encoded = json.dumps(metadata)
+        size = len(encoded) + len(thumbnail or b"")
+        with self.lock, self.connection:
+            if (row := self.connection.execute(
+                    "SELECT size FROM previews WHERE digest = ?", (digest,)).fetchone()):
+                self.total -= row[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO previews VALUES (?, ?, ?, ?, ?)",
+                (digest, encoded, thumbnail, size, time.time_ns()))
+            self.total += size
+            if self.total > self.limit:
+                self._evict()
+
+    def _evict(self):
+        # Evict down to 90% of the limit so every insert doesn't trigger another pass
+        target = self.limit * 9 // 10
+        evicted = []
+        for digest, size in self.connection.execute(
+                "SELECT digest, size FROM previews ORDER BY last_used"):
+            if self.total <= target:
+                break
+            evicted.append((digest,))
+            self.total -= size
+        self.connection.executemany("DELETE FROM previews WHERE digest = ?", evicted)
+        PROFILER.count("preview.cache_evictions", len(evicted))
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM previews").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class PreviewLoader:
+    """Load package previews on a thread pool, newest requests first.
+
+    ``request`` replaces the set of wanted paths: queued loads for paths no
+    longer wanted (rows scrolled away) are cancelled, so a long scroll
+    never builds a backlog. Each finished load is posted to ``results`` as
+    ``(path, metadata, thumbnail)``; a load that fails posts metadata with
+    a ``"failed"`` message instead, and is not cached. Packages are keyed by their content
+    hash from ``hash_index``, which only re-hashes files that changed.
+    """
+
+    def __init__(self, cache, hash_index=None, max_workers=4):
+        self.cache = cache
+        self.hash_index = hash_index
+        self.results = queue.Queue()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="preview")
+
+    def request(self, paths):
+        with self.lock:
+            wanted = set(paths)
+            for path, future in list(self.pending.items()):
+                if path not in wanted and future.cancel():
+                    del self.pending[path]
+            for path in paths:
+                if path not in self.pending:
+                    self.pending[path] = self.executor.submit(self._load, path)
+
+    def _load(self, path):
+        try:
+            if self.hash_index is not None:
+                digest = self.hash_index.digest(path)
+            else:
+                digest = full_file_hash(path)
+            if digest is None:
+                raise FileNotFoundError(f"{path} is missing")
+            if (cached := self.cache.get(digest)) is not None:
+                self.results.put((path, *cached))
+                return
+            metadata, thumbnail = extract_preview(path)
+            self.cache.put(digest, metadata, thumbnail)
+            self.results.put((path, metadata, thumbnail))
+        except Exception as error:
+            # Any failure still answers the request, or the pane waits forever
+            self.results.put((path, {"failed": str(error) or type(error).__name__}, None))
+        finally:
+            with self.lock:
+                self.pending.pop(path, None)
+
+    def shutdown(self):
+        """Cancel queued loads and wait for running ones, which still use the cache."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+LIBRARY_SNAPSHOT_FILE = 'library_snapshot.json'
+MOD_FILE_EXTENSIONS = ('.package', '.ts4script')
+
+
+class ScanResult:
+    """What changed in a library folder since the previous scan."""
+
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.modified = []
+        self.removed_dirs = []
+        self.overflowed = False
+        self.total_files = 0
+        self.dirs_scanned = 0
+        self.dirs_reused = 0
+        self.elapsed = 0.0
+
+    @property
+    def changed(self):
+        return bool(self.added or self.removed or self.modified or self.removed_dirs)
+
+
+class LibraryScanner:
+    """Incrementally index the mod files under a library folder.
+
+    The snapshot records, per directory, its mtime, its subdirectories and
+    the ``[size, mtime_ns, inode]`` of each mod file in it. Adding, removing
+    or renaming an entry changes the directory's mtime, so on a rescan a
+    directory whose mtime is unchanged is reused from the snapshot after a
+    single stat and only changed directories are listed again. Files edited
+    in place do not touch the directory; pass ``verify_files=True`` to stat
+    every file as well. Directories are walked level by level on a thread
+    pool.
+    """
+
+    def __init__(self, root, snapshot_path=None, extensions=MOD_FILE_EXTENSIONS, max_workers=None):
+        self.root = os.path.normpath(root)
+        self.snapshot_path = snapshot_path
+        self.extensions = tuple(extensions)
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        self.dirs = {}
+        self.verify_files = False
+
+    def load(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "r") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get("root") == self.root:
+            self.dirs = data.get("dirs", {})
+
+    def save(self):
+        if not self.snapshot_path:
+            return
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"version": 1, "root": self.root, "dirs": self.dirs}, file)
+        os.replace(temp_path, self.snapshot_path)
+
+    def files(self):
+        """Yield the path of every indexed mod file."""
+        for directory, entry in self.dirs.items():
+            for name in entry["files"]:
+                yield os.path.join(directory, name)
+
+    @profiled("library.scan")
+    def scan(self, verify_files=False):
+        """Walk the folder, update the snapshot and return a ``ScanResult``."""
+        started = time.perf_counter()
+        self.verify_files = verify_files
+        old_dirs = self.dirs
+        new_dirs = {}
+        result = ScanResult()
+
+        frontier = [self.root]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while frontier:
+                next_frontier = []
+                for directory, entry in executor.map(self._scan_directory, frontier):
+                    if entry is None:
+                        continue
+                    new_dirs[directory] = entry
+                    if entry is old_dirs.get(directory):
+                        result.dirs_reused += 1
+                    else:
+                        result.dirs_scanned += 1
+                    next_frontier.extend(
+                        os.path.join(directory, name) for name in entry["dirs"])
+                frontier = next_frontier
+
+        for directory, entry in new_dirs.items():
+            old_entry = old_dirs.get(directory)
+            if entry is old_entry:
+                continue
+            old_files = old_entry["files"] if old_entry else {}
+            for name, stat in entry["files"].items():
+                if (previous := old_files.get(name)) is None:
+                    result.added.append(os.path.join(directory, name))
+                elif previous != stat:
+                    result.modified.append(os.path.join(directory, name))
+            result.removed.extend(os.path.join(directory, name)
+                                  for name in old_files.keys() - entry["files"].keys())
+        for directory in old_dirs.keys() - new_dirs.keys():
+            result.removed.extend(os.path.join(directory, name)
+                                  for name in old_dirs[directory]["files"])
+
+        self.dirs = new_dirs
+        result.total_files = sum(len(entry["files"]) for entry in new_dirs.values())
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def _scan_directory(self, directory):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return directory, None
+        old_entry = self.dirs.get(directory)
+        if old_entry is not None and old_entry["mtime"] == mtime and not self.verify_files:
+            return directory, old_entry
+
+        files = {}
+        dirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif os.path.splitext(entry.name)[1].lower() in self.extensions and entry.is_file():
+                        stat = entry.stat()
+                        files[entry.name] = [stat.st_size, stat.st_mtime_ns, entry.inode()]
+        except OSError:
+            return directory, None
+        return directory, {"mtime": mtime, "files": files, "dirs": sorted(dirs)}
+
+
+WATCH_DEBOUNCE_SECONDS = 0.5
+WATCH_MAX_DELAY_SECONDS = 5.0
+WATCH_POLL_INTERVAL_SECONDS = 2.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+INOTIFY_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+                      | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifyBackend:
+    """Recursive inotify watches through libc; Linux only."""
+
+    def __init__(self, extensions):
+        if not (libc_name := ctypes.util.find_library("c")):
+            raise OSError("libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.extensions = extensions
+        if (fd := self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)) < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.fd = fd
+        self.watches = {}
+        self.overflowed = False
+
+    def add_root(self, root):
+        self._watch_tree(root, None)
+
+    def _watch_tree(self, top, changes):
+        for directory, dirnames, filenames in os.walk(top):
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(directory), INOTIFY_WATCH_MASK)
+            if wd < 0:
+                dirnames[:] = []
+                continue
+            self.watches[wd] = directory
+            if changes is not None:
+                for name in filenames:
+                    if os.path.splitext(name)[1].lower() in self.extensions:
+                        changes[os.path.join(directory, name)] = "added"
+
+    def _unwatch_tree(self, top):
+        prefix = os.path.join(top, "")
+        for wd, directory in list(self.watches.items()):
+            if directory == top or directory.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def wait(self, timeout, changes, removed_dirs):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if (directory := self.watches.get(wd)) is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(path, changes)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._unwatch_tree(path)
+                    removed_dirs.add(path)
+            elif os.path.splitext(name)[1].lower() in self.extensions:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changes[path] = "added"
+                else:
+                    changes.setdefault(path, "modified")
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingBackend:
+    """Periodic incremental rescans for platforms without inotify."""
+
+    def __init__(self, extensions, interval=WATCH_POLL_INTERVAL_SECONDS):
+        self.extensions = extensions
+        self.interval = interval
+        self.scanners = []
+        self.next_poll = time.monotonic() + interval
+        self.overflowed = False
+
+    def add_root(self, root):
+        scanner = LibraryScanner(root, extensions=self.extensions, max_workers=4)
+        scanner.scan()
+        self.scanners.append(scanner)
+
+    def wait(self, timeout, changes, removed_dirs):
+        if (delay := self.next_poll - time.monotonic()) > timeout:
+            time.sleep(timeout)
+            return
+        time.sleep(max(0.0, delay))
+        self.next_poll = time.monotonic() + self.interval
+        for scanner in self.scanners:
+            result = scanner.scan(verify_files=True)
+            for path in result.added:
+                changes[path] = "added"
+            for path in result.modified + result.removed:
+                changes.setdefault(path, "modified")
+
+    def close(self):
+        pass
+
+
+class FolderWatcher:
+    """Watch folders for mod files appearing, changing or disappearing.
+
+    Uses inotify where available and falls back to polling. Events are
+    coalesced until the folders have been quiet for ``debounce`` seconds (or
+    ``max_delay`` has passed since the first one), so extracting an archive
+    of thousands of files yields a few batches rather than thousands of
+    updates. Each batch is put on ``results`` as ``(ScanResult, categories)``
+    with categories from ``classify`` computed on the watcher thread.
+    """
+
+    def __init__(self, extensions=MOD_FILE_EXTENSIONS, classify=None,
+                 debounce=WATCH_DEBOUNCE_SECONDS, max_delay=WATCH_MAX_DELAY_SECONDS,
+                 use_inotify=True):
+        self.extensions = tuple(extensions)
+        self.classify = classify
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.use_inotify = use_inotify
+        self.results = queue.Queue()
+        self.roots = set()
+        self.backend = None
+        self._new_roots = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_root(self, root):
+        if (root := os.path.normpath(root)) in self.roots:
+            return
+        self.roots.add(root)
+        self._new_roots.put(root)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="folder-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _create_backend(self):
+        if self.use_inotify:
+            try:
+                return InotifyBackend(self.extensions)
+            except (OSError, AttributeError):
+                pass
+        return PollingBackend(self.extensions)
+
+    def _run(self):
+        self.backend = backend = self._create_backend()
+        changes = {}
+        removed_dirs = set()
+        first_change = last_change = None
+        try:
+            while not self._stop.is_set():
+                while True:
+                    try:
+                        backend.add_root(self._new_roots.get_nowait())
+                    except queue.Empty:
+                        break
+                pending = len(changes) + len(removed_dirs)
+                backend.wait(self.debounce if pending else 0.5, changes, removed_dirs)
+                now = time.monotonic()
+                if len(changes) + len(removed_dirs) != pending:
+                    last_change = now
+                    first_change = first_change or now
+                if first_change is not None and (
+                        now - last_change >= self.debounce
+                        or now - first_change >= self.max_delay):
+                    self._flush(changes, removed_dirs)
+                    changes = {}
+                    removed_dirs = set()
+                    first_change = last_change = None
+        finally:
+            backend.close()
+
+    def _flush(self, changes, removed_dirs):
+        result = ScanResult()
+        result.removed_dirs = sorted(removed_dirs)
+        result.overflowed = self.backend.overflowed
+        self.backend.overflowed = False
+        for path, kind in sorted(changes.items()):
+            if not os.path.isfile(path):
+                result.removed.append(path)
+            elif kind == "added":
+                result.added.append(path)
+            else:
+                result.modified.append(path)
+        paths = result.added + result.modified
+        categories = dict(zip(paths, self.classify(paths))) if self.classify else {}
+        self.results.put((result, categories))
+
+
+def normalize_mod_name(mod_name):
+    """Return the key used to compare mod names."""
+    return str(mod_name).strip().casefold()
+
+
+def path_key(path):
+    """Return the key used to compare file paths."""
+    return os.path.normcase(os.path.normpath(path))
+
+
+def parse_tags(value):
+    """Turn a saved or typed tags value into a list of tag strings."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [tag for tag in (str(tag).strip() for tag in value) if tag]
+
+
+NATURAL_SORT_SPLIT = re.compile(r"(\d+)").split
+
+
+def natural_sort_key(text):
+    """Casefolded sort key that orders embedded numbers by value."""
+    return tuple(int(part) if index % 2 else part
+                 for index, part in enumerate(NATURAL_SORT_SPLIT(str(text).casefold())))
+
+
+class ModRecord:
+    """One mod or custom content entry in the library."""
+
+    __slots__ = ("id", "name", "category", "tags", "source", "path", "sort_keys")
+
+    def __init__(self, mod_id, name, category="", tags=None, source="", path=None):
+        self.id = mod_id
+        self.name = name
+        self.category = category
+        self.tags = list(tags or [])
+        self.source = source
+        self.path = path
+        self.sort_keys = None
+
+    @property
+    def tags_text(self):
+        return ", ".join(self.tags)
+
+    def sort_key(self, field):
+        """Return the natural sort key for a field, cached until the next edit."""
+        if self.sort_keys is None:
+            self.sort_keys = {}
+        elif (key := self.sort_keys.get(field)) is not None:
+            return key
+        key = self.sort_keys[field] = natural_sort_key(getattr(self, field))
+        return key
+
+    def values(self):
+        """Return the row shown in the treeview."""
+        return (self.name, self.category, self.tags_text, self.source)
+
+    def to_dict(self):
+        return {"name": self.name, "category": self.category,
+                "tags": list(self.tags), "source": self.source, "path": self.path}
+
+
+@profiled("library.sort")
+def sort_record_ids(records, record_ids, sort_fields):
+    """Return ``record_ids`` ordered by ``[(field, descending), ...]``, first field first."""
+    record_ids = list(record_ids)
+    # Stable sorts from the last key to the first give a multi-column sort
+    for field, descending in reversed(sort_fields):
+        record_ids.sort(reverse=descending,
+                        key=lambda record_id: records[record_id].sort_key(field))
+    return record_ids
+
+
+class TagIndex:
+    """Inverted index from tag and from category to the ids of their records.
+
+    Keys are case-insensitive; the first spelling seen is kept for display.
+    ``ModLibrary`` keeps the index in step with every add, edit and removal.
+    """
+
+    def __init__(self):
+        self.tags = defaultdict(set)
+        self.categories = defaultdict(set)
+        self.labels = {}
+
+    @staticmethod
+    def key(value):
+        return str(value).strip().casefold()
+
+    def add(self, record):
+        for tag in record.tags:
+            key = self.key(tag)
+            self.tags[key].add(record.id)
+            self.labels.setdefault(key, tag)
+        if record.category:
+            self.categories[self.key(record.category)].add(record.id)
+
+    def remove(self, record):
+        for tag in record.tags:
+            key = self.key(tag)
+            if (ids := self.tags.get(key)) is not None:
+                ids.discard(record.id)
+                if not ids:
+                    del self.tags[key]
+                    self.labels.pop(key, None)
+        if record.category and (ids := self.categories.get(self.key(record.category))) is not None:
+            ids.discard(record.id)
+            if not ids:
+                del self.categories[self.key(record.category)]
+
+    def clear(self):
+        self.tags.clear()
+        self.categories.clear()
+        self.labels.clear()
+
+    def lookup(self, index, value):
+        """Return the ids for a key; a trailing ``*`` matches every key with that prefix."""
+        key = self.key(value)
+        if not key.endswith("*"):
+            return index.get(key, set())
+        prefix = key[:-1]
+        matches = set()
+        for candidate, ids in index.items():
+            if candidate.startswith(prefix):
+                matches |= ids
+        return matches
+
+    def frequencies(self, prefix="", limit=None):
+        """Return ``(tag, count)`` pairs for tags starting with ``prefix``, most used first."""
+        prefix = self.key(prefix)
+        counts = sorted(((self.labels[key], len(ids)) for key, ids in self.tags.items()
+                         if key.startswith(prefix)),
+                        key=lambda item: (-item[1], item[0].casefold()))
+        return counts[:limit] if limit else counts
+
+
+QUERY_TOKEN = re.compile(r'\s*(?:(\()|(\))|(?:(\w+):)?("[^"]*"|[^\s()"]+))')
+QUERY_OPERATORS = ("AND", "OR", "NOT")
+QUERY_FIELDS = {"tag": "tag", "tags": "tag", "category": "category", "cat": "category",
+                "text": "text"}
+
+
+def is_structured_query(text):
+    """Tell whether a search uses the query language rather than plain substring search.
+
+    Only a known field prefix (see ``QUERY_FIELDS``) makes a query; operators
+    and parentheses just combine fielded terms. Without one, names like
+    ``Sims NOT Included``, ``Hair (long)`` or ``Note: WIP`` stay substring
+    searches.
+    """
+    return any(token[2].lower() in QUERY_FIELDS for token in QUERY_TOKEN.findall(text))
+
+
+def parse_query(text):
+    """Parse ``tag:hair AND NOT tag:broken category:CAS`` style queries.
+
+    Terms are ``tag:``, ``category:`` or bare words (substring search);
+    values may be quoted and end in ``*`` for a prefix match. ``NOT`` binds
+    tightest, then ``AND`` (also implied between adjacent terms), then
+    ``OR``; parentheses group. Returns a tree of tuples; raises ValueError
+    on malformed input.
+    """
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        if not (match := QUERY_TOKEN.match(text, position)) or match.end() == position:
+            raise ValueError(f"Unexpected input at {text[position:]!r}")
+        position = match.end()
+        opening, closing, field, value = match.groups()
+        if opening or closing:
+            tokens.append(opening or closing)
+        elif field is None and value in QUERY_OPERATORS:
+            tokens.append(value)
+        else:
+            if field is not None and field.lower() not in QUERY_FIELDS:
+                raise ValueError(f"Unknown field {field!r}")
+            kind = QUERY_FIELDS[field.lower()] if field else "text"
+            if value.startswith('"'):
+                value = value[1:-1]
+            tokens.append((kind, value))
+
+    index = 0
+
+    def peek():
+        return tokens[index] if index < len(tokens) else None
+
+    def parse_or():
+        nonlocal index
+        terms = [parse_and()]
+        while peek() == "OR":
+            index += 1
+            terms.append(parse_and())
+        return terms[0] if len(terms) == 1 else ("or", terms)
+
+    def parse_and():
+        nonlocal index
+        terms = [parse_not()]
+        while (token := peek()) is not None and token not in ("OR", ")"):
+            if token == "AND":
+                index += 1
+            terms.append(parse_not())
+        return terms[0] if len(terms) == 1 else ("and", terms)
+
+    def parse_not():
+        nonlocal index
+        if (token := peek()) == "NOT":
+            index += 1
+            return ("not", parse_not())
+        if token == "(":
+            index += 1
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("Missing closing parenthesis")
+            index += 1
+            return node
+        if token is None or isinstance(token, str):
+            raise ValueError(f"Expected a term, found {token or 'end of query'!r}")
+        index += 1
+        return token
+
+    if not tokens:
+        raise ValueError("Empty query")
+    tree = parse_or()
+    if index != len(tokens):
+        raise ValueError(f"Unexpected {tokens[index]!r}")
+    return tree
+
+
+class SearchIndex:
+    """Trigram index for substring search over mod name, category and tags.
+
+    Nothing is indexed until the first search. The search texts are then
+    computed in one pass, while the trigram postings are filled in small
+    steps through ``build_step`` so the UI never blocks; until they are
+    complete, queries scan the texts. Afterwards ``ModLibrary`` keeps the
+    index current. A query of three or more characters intersects the
+    posting sets of its trigrams and only verifies the survivors. When a
+    query extends the previous one, only the previous matches are checked.
+    """
+
+    BUILD_STEP = 500
+
+    def __init__(self, library):
+        self.library = library
+        self.texts = {}
+        self.postings = defaultdict(set)
+        self.pending = deque()
+        self.started = False
+        self.last_query = None
+        self.last_matches = None
+
+    @staticmethod
+    def search_text(record):
+        return "\n".join((record.name, record.category, " ".join(record.tags))).lower()
+
+    @staticmethod
+    def trigrams(text):
+        return {text[index:index + 3] for index in range(len(text) - 2)}
+
+    @property
+    def built(self):
+        return self.started and not self.pending
+
+    def start(self):
+        """Compute the search texts and queue every record for indexing."""
+        if self.started:
+            return
+        for record in self.library:
+            self.texts[record.id] = self.search_text(record)
+        self.pending.extend(self.texts)
+        self.started = True
+
+    def build_step(self, limit=BUILD_STEP):
+        """Index up to ``limit`` queued records; return True while work remains."""
+        postings = self.postings
+        while self.pending and limit:
+            record_id = self.pending.popleft()
+            if (text := self.texts.get(record_id)) is not None:
+                for trigram in self.trigrams(text):
+                    postings[trigram].add(record_id)
+            limit -= 1
+        return bool(self.pending)
+
+    def build(self):
+        self.start()
+        while self.build_step():
+            pass
+
+    def _index(self, record):
+        built = self.built
+        text = self.texts[record.id] = self.search_text(record)
+        if built:
+            for trigram in self.trigrams(text):
+                self.postings[trigram].add(record.id)
+        else:
+            self.pending.append(record.id)
+
+    def _unindex(self, record_id):
+        if (text := self.texts.pop(record_id, None)) is None:
+            return
+        for trigram in self.trigrams(text):
+            if (ids := self.postings.get(trigram)) is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del self.postings[trigram]
+
+    def add(self, record):
+        self.last_query = self.last_matches = None
+        if self.started:
+            self._index(record)
+
+    def update(self, record):
+        self.last_query = self.last_matches = None
+        if self.started:
+            self._unindex(record.id)
+            self._index(record)
+
+    def remove(self, record_id):
+        self.last_query = self.last_matches = None
+        if self.started:
+            self._unindex(record_id)
+
+    def clear(self):
+        self.texts.clear()
+        self.postings.clear()
+        self.pending.clear()
+        self.started = False
+        self.last_query = self.last_matches = None
+
+    def search(self, query):
+        """Return the ids of matching records, or None when the query is empty."""
+        query = query.lower()
+        if not query:
+            return None
+        self.start()
+
+        if self.last_matches is not None and self.last_query in query:
+            candidates = self.last_matches
+        elif len(query) >= 3 and self.built:
+            trigrams = sorted(self.trigrams(query),
+                              key=lambda trigram: len(self.postings.get(trigram, ())))
+            candidates = set(self.postings.get(trigrams[0], ()))
+            for trigram in trigrams[1:]:
+                if not candidates:
+                    break
+                candidates &= self.postings[trigram]
+        else:
+            candidates = self.texts
+
+        texts = self.texts
+        matches = {record_id for record_id in candidates if query in texts[record_id]}
+        self.last_query, self.last_matches = query, matches
+        return matches
+
+
+class ModLibrary:
+    """The authoritative, widget-free store of mod records.
+
+    Records are kept by id and indexed by normalized name and by file path,
+    so existence checks, lookups and edits are dict operations instead of
+    Treeview scans.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.name_index = {}
+        self.path_index = {}
+        self.search_index = SearchIndex(self)
+        self.tag_index = TagIndex()
+        self.listeners = []
+        self._next_id = 1
+
+    def _notify(self, operation, record=None):
+        for listener in self.listeners:
+            listener(operation, record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records.values())
+
+    def get(self, mod_id):
+        return self.records.get(mod_id)
+
+    def find(self, mod_name):
+        """Return the record with this name, or None."""
+        mod_id = self.name_index.get(normalize_mod_name(mod_name))
+        return None if mod_id is None else self.records[mod_id]
+
+    def exists(self, mod_name):
+        return normalize_mod_name(mod_name) in self.name_index
+
+    def find_path(self, path):
+        """Return the record for a file path, or None."""
+        mod_id = self.path_index.get(path_key(path))
+        return None if mod_id is None else self.records[mod_id]
+
+    @profiled("library.search")
+    def search(self, text):
+        """Return the ids matching a search, or None when it is empty.
+
+        Plain text is a substring search; text using the query language
+        (see ``parse_query``) is evaluated with set operations over the tag,
+        category and search indexes. Raises ValueError for a malformed query.
+        """
+        if not text.strip():
+            return None
+        if not is_structured_query(text):
+            return self.search_index.search(text)
+        return self.evaluate_query(parse_query(text))
+
+    def evaluate_query(self, node):
+        kind = node[0]
+        if kind == "tag":
+            return set(self.tag_index.lookup(self.tag_index.tags, node[1]))
+        if kind == "category":
+            return set(self.tag_index.lookup(self.tag_index.categories, node[1]))
+        if kind == "text":
+            matches = self.search_index.search(node[1])
+            return set(self.records) if matches is None else set(matches)
+        if kind == "not":
+            return self.records.keys() - self.evaluate_query(node[1])
+        if kind == "or":
+            return set().union(*(self.evaluate_query(child) for child in node[1]))
+        # AND: intersect the positive terms smallest first, then subtract negations
+        positives = sorted((self.evaluate_query(child) for child in node[1] if child[0] != "not"),
+                           key=len)
+        result = positives[0] if positives else set(self.records)
+        for ids in positives[1:]:
+            if not result:
+                break
+            result &= ids
+        for child in node[1]:
+            if child[0] == "not" and result:
+                result -= self.evaluate_query(child[1])
+        return result
+
+    def find_under(self, directory):
+        """Return the records whose file lives somewhere below a directory."""
+        prefix = os.path.join(path_key(directory), "")
+        return [self.records[mod_id] for key, mod_id in self.path_index.items()
+                if key.startswith(prefix)]
+
+    def add(self, name, category="", tags=None, source="", path=None, mod_id=None):
+        """Add a new record; raise ValueError if the name is already taken."""
+        key = normalize_mod_name(name)
+        if key in self.name_index:
+            raise ValueError(f"A mod named {name!r} already exists.")
+        if mod_id is None:
+            mod_id = self._next_id
+        elif mod_id in self.records:
+            raise ValueError(f"A mod with id {mod_id} already exists.")
+        record = ModRecord(mod_id, name, category, tags, source, path)
+        self._next_id = max(self._next_id, mod_id + 1)
+        self.records[record.id] = record
+        self.name_index[key] = record.id
+        if path:
+            self.path_index[path_key(path)] = record.id
+        self.search_index.add(record)
+        self.tag_index.add(record)
+        self._notify("add", record)
+        return record
+
+    def update(self, mod_id, **changes):
+        """Change fields of a record, keeping the name index in sync."""
+        record = self.records[mod_id]
+        if "name" in changes:
+            old_key = normalize_mod_name(record.name)
+            new_key = normalize_mod_name(changes["name"])
+            if new_key != old_key:
+                if new_key in self.name_index:
+                    raise ValueError(
+                        f"A mod named {changes['name']!r} already exists.")
+                del self.name_index[old_key]
+                self.name_index[new_key] = mod_id
+        return self._apply_changes(record, changes)
+
+    def update_many(self, changes):
+        """Apply ``{mod_id: {field: value}}`` in one step.
+
+        Names are checked against the final state, so records may swap or
+        rotate names; on a collision ValueError is raised before anything
+        is changed.
+        """
+        renamed = {}
+        for mod_id, fields in changes.items():
+            if "name" in fields:
+                new_key = normalize_mod_name(fields["name"])
+                if new_key != normalize_mod_name(self.records[mod_id].name):
+                    renamed[mod_id] = new_key
+        freed = {normalize_mod_name(self.records[mod_id].name) for mod_id in renamed}
+        claimed = set()
+        for mod_id, new_key in renamed.items():
+            if new_key in claimed or (new_key in self.name_index and new_key not in freed):
+                raise ValueError(
+                    f"A mod named {changes[mod_id]['name']!r} already exists.")
+            claimed.add(new_key)
+        for mod_id in renamed:
+            del self.name_index[normalize_mod_name(self.records[mod_id].name)]
+        for mod_id, new_key in renamed.items():
+            self.name_index[new_key] = mod_id
+        return [self._apply_changes(self.records[mod_id], dict(fields))
+                for mod_id, fields in changes.items()]
+
+    def _apply_changes(self, record, changes):
+        mod_id = record.id
+        if "path" in changes:
+            if record.path:
+                self.path_index.pop(path_key(record.path), None)
+            if changes["path"]:
+                self.path_index[path_key(changes["path"])] = mod_id
+        if "tags" in changes:
+            changes["tags"] = list(changes["tags"])
+        self.tag_index.remove(record)
+        for field, value in changes.items():
+            setattr(record, field, value)
+        record.sort_keys = None
+        self.tag_index.add(record)
+        self.search_index.update(record)
+        self._notify("update", record)
+        return record
+
+    def remove(self, mod_id):
+        record = self.records.pop(mod_id)
+        del self.name_index[normalize_mod_name(record.name)]
+        if record.path:
+            self.path_index.pop(path_key(record.path), None)
+        self.search_index.remove(mod_id)
+        self.tag_index.remove(record)
+        self._notify("remove", record)
+        return record
+
+    def clear(self):
+        self.records.clear()
+        self.name_index.clear()
+        self.path_index.clear()
+        self.search_index.clear()
+        self.tag_index.clear()
+        self._notify("clear")
+
+
+BULK_HISTORY_LIMIT = 50
+
+
+class BulkResult:
+    """The record ids a bulk edit, undo or redo touched, for one view refresh."""
+
+    def __init__(self, description, updated=(), removed=(), added=(), removed_paths=()):
+        self.description = description
+        self.updated = list(updated)
+        self.removed = list(removed)
+        self.added = list(added)
+        self.removed_paths = list(removed_paths)
+
+
+class BulkEditor:
+    """Undoable edits applied to many records of a ModLibrary at once.
+
+    Each operation computes the new state of every target record first and
+    applies it as one transaction: if any change is invalid (a rename
+    collision, say) nothing is modified. The before and after states are
+    kept for undo and redo. Changes made to the library by anything else
+    invalidate the history, since replaying it could then overwrite them.
+    """
+
+    def __init__(self, library, history_limit=BULK_HISTORY_LIMIT):
+        self.library = library
+        self.undo_stack = deque(maxlen=history_limit)
+        self.redo_stack = []
+        self._applying = False
+        library.listeners.append(self.on_change)
+
+    def on_change(self, operation, record):
+        if not self._applying:
+            self.undo_stack.clear()
+            self.redo_stack.clear()
+
+    @staticmethod
+    def _state(record):
+        return {"name": record.name, "category": record.category, "tags": list(record.tags),
+                "source": record.source, "path": record.path}
+
+    def set_fields(self, mod_ids, description="Edit", **fields):
+        return self._edit(description, {mod_id: fields for mod_id in mod_ids})
+
+    def set_category(self, mod_ids, category):
+        return self._edit(f"Set category to {category}",
+                          {mod_id: {"category": category} for mod_id in mod_ids})
+
+    def add_tags(self, mod_ids, tags):
+        return self.retag(mod_ids, add=tags)
+
+    def remove_tags(self, mod_ids, tags):
+        return self.retag(mod_ids, remove=tags)
+
+    def retag(self, mod_ids, add=(), remove=()):
+        """Add and remove tags on every record, leaving their other tags alone."""
+        add = parse_tags(add)
+        remove = set(parse_tags(remove))
+        changes = {}
+        for mod_id in mod_ids:
+            current = self.library.records[mod_id].tags
+            tags = [tag for tag in current if tag not in remove]
+            tags += [tag for tag in add if tag not in tags]
+            if tags != list(current):
+                changes[mod_id] = {"tags": tags}
+        parts = ([f"add {', '.join(add)}"] if add else []) + (
+            [f"remove {', '.join(sorted(remove))}"] if remove else [])
+        return self._edit(f"Tags: {'; '.join(parts)}", changes)
+
+    def apply_rules(self, results):
+        """Apply ``{mod_id: RuleResult}``: set category and source, add missing tags."""
+        records = self.library.records
+        changes = {mod_id: fields for mod_id, result in results.items()
+                   if mod_id in records and (fields := result.changes_for(records[mod_id]))}
+        return self._edit(f"Apply rules to {len(results)} mods", changes)
+
+    def rename(self, mod_ids, pattern, replacement):
+        """Rename by regular expression; raise ValueError for a bad pattern or a collision."""
+        try:
+            compiled = re.compile(pattern)
+        except re.error as error:
+            raise ValueError(f"Invalid pattern: {error}") from error
+        changes = {}
+        for mod_id in mod_ids:
+            name = self.library.records[mod_id].name
+            if (new_name := compiled.sub(replacement, name).strip()) != name:
+                if not new_name:
+                    raise ValueError(f"Renaming {name!r} would leave it without a name.")
+                changes[mod_id] = {"name": new_name}
+        return self._edit(f"Rename {pattern} to {replacement}", changes)
+
+    def delete(self, mod_ids):
+        return self._commit(f"Delete {len(mod_ids)} mods", {mod_id: None for mod_id in mod_ids})
+
+    def _edit(self, description, changes):
+        return self._commit(description, {
+            mod_id: {**self._state(self.library.records[mod_id]), **fields}
+            for mod_id, fields in changes.items()})
+
+    def _commit(self, description, after):
+        records = self.library.records
+        before = {mod_id: self._state(records[mod_id]) for mod_id in after}
+        after = {mod_id: state for mod_id, state in after.items() if state != before[mod_id]}
+        before = {mod_id: before[mod_id] for mod_id in after}
+        result = self._apply(description, after)
+        if after:
+            self.undo_stack.append((description, before, after))
+            self.redo_stack.clear()
+        return result
+
+    def undo(self):
+        if not self.undo_stack:
+            return None
+        description, before, after = self.undo_stack.pop()
+        result = self._apply(f"Undo {description}", before)
+        self.redo_stack.append((description, before, after))
+        return result
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        description, before, after = self.redo_stack.pop()
+        result = self._apply(f"Redo {description}", after)
+        self.undo_stack.append((description, before, after))
+        return result
+
+    def _apply(self, description, states):
+        records = self.library.records
+        removed = [mod_id for mod_id, state in states.items() if state is None and mod_id in records]
+        updated = {mod_id: state for mod_id, state in states.items()
+                   if state is not None and mod_id in records}
+        added = {mod_id: state for mod_id, state in states.items()
+                 if state is not None and mod_id not in records}
+        removed_paths = [path for mod_id in removed if (path := records[mod_id].path)]
+        self._applying = True
+        try:
+            self.library.update_many(updated)
+            for mod_id in removed:
+                self.library.remove(mod_id)
+            for mod_id, state in added.items():
+                self.library.add(mod_id=mod_id, **state)
+        finally:
+            self._applying = False
+        return BulkResult(description, updated, removed, added, removed_paths)
+
+
+LIBRARY_STORE_EXTENSION = '.archistack'
+LIBRARY_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mods (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL UNIQUE,
+    category TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL DEFAULT '',
+    path TEXT,
+    hash TEXT
+);
+CREATE TABLE IF NOT EXISTS mod_tags (
+    mod_id INTEGER NOT NULL REFERENCES mods(id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (mod_id, tag)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS mods_category ON mods(category);
+CREATE INDEX IF NOT EXISTS mods_hash ON mods(hash);
+CREATE INDEX IF NOT EXISTS mod_tags_tag ON mod_tags(tag);
+"""
+TAG_SEPARATOR = "\x1f"
+
+
+class LibraryStore:
+    """A ModLibrary persisted to SQLite and written incrementally.
+
+    Once attached, the store listens to the library and remembers which
+    records were added, changed or removed; ``save`` writes just those rows
+    in one transaction, so saving after a single edit touches a single row
+    however large the library is. The database runs in WAL mode, so a save
+    is atomic and a crash leaves the previous state intact. ``load`` streams
+    rows in batches rather than materializing the whole file first.
+    """
+
+    LOAD_BATCH = 5000
+
+    def __init__(self, path):
+        self.path = path
+        self.library = None
+        self.dirty = set()
+        self.deleted = set()
+        self.rewrite = True
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(LIBRARY_STORE_SCHEMA)
+
+    def attach(self, library, rewrite=True):
+        """Track changes to ``library``; the next save rewrites it fully unless told otherwise."""
+        self.detach()
+        self.library = library
+        self.rewrite = rewrite
+        self.dirty.clear()
+        self.deleted.clear()
+        library.listeners.append(self.on_change)
+
+    def detach(self):
+        if self.library is not None:
+            self.library.listeners.remove(self.on_change)
+            self.library = None
+
+    def on_change(self, operation, record):
+        if operation == "clear":
+            self.rewrite = True
+        elif operation == "remove":
+            self.dirty.discard(record.id)
+            self.deleted.add(record.id)
+        else:
+            self.dirty.add(record.id)
+
+    @property
+    def pending(self):
+        return self.rewrite or bool(self.dirty or self.deleted)
+
+    @profiled("store.load")
+    def load(self, library):
+        """Replace the contents of ``library`` with the stored records."""
+        self.detach()
+        library.clear()
+        cursor = self.connection.execute(
+            "SELECT id, name, category, source, path, "
+            "(SELECT group_concat(tag, ?) FROM mod_tags WHERE mod_id = mods.id) "
+            "FROM mods ORDER BY id", (TAG_SEPARATOR,))
+        while rows := cursor.fetchmany(self.LOAD_BATCH):
+            for mod_id, name, category, source, path, tags in rows:
+                library.add(name, category, tags.split(TAG_SEPARATOR) if tags else [],
+                            source, path, mod_id=mod_id)
+        self.attach(library, rewrite=False)
+
+    @profiled("store.save")
+    def save(self, digest_for=None):
+        """Write pending changes; ``digest_for(path)`` supplies the hash column."""
+        if self.library is None or not self.pending:
+            return 0
+        records = self.library.records
+        if self.rewrite:
+            changed = list(records.values())
+        else:
+            changed = [records[mod_id] for mod_id in self.dirty if mod_id in records]
+        with self.connection:
+            if self.rewrite:
+                self.connection.execute("DELETE FROM mod_tags")
+                self.connection.execute("DELETE FROM mods")
+            else:
+                self.connection.executemany(
+                    "DELETE FROM mods WHERE id = ?", ((mod_id,) for mod_id in self.deleted))
+                self.connection.executemany(
+                    "DELETE FROM mod_tags WHERE mod_id = ?", ((record.id,) for record in changed))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO mods (id, name, name_key, category, source, path, hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((record.id, record.name, normalize_mod_name(record.name), record.category,
+                  record.source, record.path,
+                  digest_for(record.path) if digest_for and record.path else None)
+                 for record in changed))
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO mod_tags (mod_id, tag) VALUES (?, ?)",
+                ((record.id, tag) for record in changed for tag in record.tags))
+        self.rewrite = False
+        self.dirty.clear()
+        self.deleted.clear()
+        return len(changed)
+
+    def close(self):
+        self.detach()
+        self.connection.close()
+
+
+@profiled("json.load")
+def load_json_library(file_path, library):
+    """Replace the contents of ``library`` with a list saved by the JSON export."""
+    with open(file_path, "r") as file:
+        mods_to_load = json.load(file)
+    library.clear()
+    for mod in mods_to_load:
+        if not mod.get("name") or library.exists(mod["name"]):
+            continue
+        library.add(
+            str(mod["name"]), mod.get("category", ""), parse_tags(mod.get("tags")),
+            mod.get("source", ""), mod.get("path"))
+
+
+@profiled("json.save")
+def save_json_library(file_path, records):
+    """Write records as a JSON list, replacing the file atomically."""
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump([record.to_dict() for record in records], file)
+    os.replace(temp_path, file_path)
+
+
+AUTOSAVE_SNAPSHOT_FILE = 'library_autosave.json'
+AUTOSAVE_JOURNAL_FILE = 'library_autosave.journal'
+AUTOSAVE_FSYNC_SECONDS = 0.2
+AUTOSAVE_COMPACT_ENTRIES = 5000
+AUTOSAVE_CHECK_MS = 30000
+
+
+class LibraryJournal:
+    """Crash-safe autosave of a ModLibrary as a snapshot plus a write-ahead log.
+
+    Every change is appended to the journal as a numbered JSON line by a
+    background thread, which fsyncs once per ``AUTOSAVE_FSYNC_SECONDS``
+    batch rather than per change. ``compact`` writes the whole library to a
+    temp file, fsyncs it and swaps it in with ``os.replace`` before
+    truncating the journal; the snapshot records the last sequence number
+    it covers, so a crash between the two steps never replays stale lines.
+    ``recover`` loads the snapshot and replays the journal tail, ignoring a
+    torn final line. An unreadable snapshot is an error rather than an empty
+    library, so the next compaction can't overwrite what it held.
+    """
+
+    def __init__(self, snapshot_path=AUTOSAVE_SNAPSHOT_FILE, journal_path=AUTOSAVE_JOURNAL_FILE):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.library = None
+        self.seq = 0
+        self.entries_since_snapshot = 0
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = None
+
+    @property
+    def needs_compaction(self):
+        return self.entries_since_snapshot >= AUTOSAVE_COMPACT_ENTRIES
+
+    @profiled("journal.recover")
+    def recover(self, library, read_only=False):
+        """Rebuild ``library`` from the snapshot and journal; return the number of replayed changes.
+
+        A torn journal tail is cut off so new entries can follow it, unless
+        ``read_only`` is set, in which case neither file is written; use it
+        to read an autosave another process may be appending to. Raises
+        OSError or ValueError if the snapshot can't be read.
+        """
+        library.clear()
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as file:
+                snapshot = json.load(file)
+            if not isinstance(snapshot, dict):
+                raise ValueError(f"{self.snapshot_path} is not a library snapshot")
+            snapshot_seq = snapshot.get("seq", 0)
+            for record in snapshot.get("records", ()):
+                self._apply(library, {"op": "add", "record": record})
+        self.seq = snapshot_seq
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb" if read_only else "rb+") as file:
+                good_offset = 0
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Drop a torn tail so new entries are not appended after it
+                        if not read_only:
+                            file.truncate(good_offset)
+                        break
+                    good_offset += len(line)
+                    if entry["seq"] <= snapshot_seq:
+                        continue
+                    self._apply(library, entry)
+                    self.seq = entry["seq"]
+                    replayed += 1
+        self.entries_since_snapshot = replayed
+        return replayed
+
+    @staticmethod
+    def _apply(library, entry):
+        if (operation := entry["op"]) == "clear":
+            library.clear()
+        elif operation == "remove":
+            if entry["id"] in library.records:
+                library.remove(entry["id"])
+        else:
+            fields = dict(entry["record"])
+            mod_id = fields.pop("id")
+            if mod_id in library.records:
+                library.update(mod_id, **fields)
+            else:
+                library.add(mod_id=mod_id, **fields)
+
+    def attach(self, library):
+        """Start journaling changes to ``library``."""
+        self.library = library
+        library.listeners.append(self.on_change)
+        self._thread = threading.Thread(
+            target=self._writer, name="library-journal", daemon=True)
+        self._thread.start()
+
+    def on_change(self, operation, record):
+        self.seq += 1
+        self.entries_since_snapshot += 1
+        entry = {"seq": self.seq, "op": operation}
+        if operation == "remove":
+            entry["id"] = record.id
+        elif operation != "clear":
+            entry["record"] = {"id": record.id, **record.to_dict()}
+        self._queue.put(("entry", json.dumps(entry)))
+
+    def compact(self):
+        """Queue a snapshot of the current library and truncate the journal behind it."""
+        records = [{"id": record.id, **record.to_dict()} for record in self.library]
+        self._queue.put(("snapshot", {"version": 1, "seq": self.seq, "records": records}))
+        self.entries_since_snapshot = 0
+
+    def close(self):
+        """Compact, flush everything to disk and stop the writer thread."""
+        if self._thread is None:
+            return
+        self.compact()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self.library.listeners.remove(self.on_change)
+
+    def _writer(self):
+        journal = open(self.journal_path, "a")
+        try:
+            while (item := self._queue.get()) is not None:
+                deadline = time.monotonic() + AUTOSAVE_FSYNC_SECONDS
+                pending = False
+                while item is not None:
+                    kind, payload = item
+                    try:
+                        if kind == "entry":
+                            journal.write(payload + "\n")
+                            pending = True
+                        else:
+                            journal.close()
+                            mode = "a"
+                            try:
+                                self._write_snapshot(payload)
+                                mode = "w"
+                            finally:
+                                journal = open(self.journal_path, mode)
+                            pending = True
+                    except OSError as error:
+                        self.error = error
+                    if (remaining := deadline - time.monotonic()) <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if pending:
+                    self._sync(journal)
+                if item is None:
+                    break
+        finally:
+            self._sync(journal)
+            journal.close()
+
+    def _sync(self, journal):
+        try:
+            journal.flush()
+            os.fsync(journal.fileno())
+        except (OSError, ValueError) as error:
+            self.error = error
+
+    @profiled("journal.snapshot")
+    def _write_snapshot(self, snapshot):
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(snapshot, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
@@ -0,0 +1,553 @@
+"""Benchmarks for the ArchiStack engine.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json
+
+Fixtures (archives of many small and a few large synthetic ``.package``
+members) are generated from a fixed seed into ``--fixtures`` and reused
+while their parameters are unchanged; mod libraries are generated in
+memory. Each benchmark runs in its own subprocess so the reported peak RSS
+belongs to it alone. Results are written as JSON; with ``--baseline`` the
+p50 of every benchmark is compared against a stored run and the exit code
+is 1 when any of them regressed by more than ``--threshold``.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import struct
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import archistack_engine as engine  # noqa: E402
+
+ARCHIVE_FORMATS = ("zip", "tar", "tar.gz", "tar.bz2", "tar.xz")
+LIBRARY_SIZES = (1000, 10000, 100000)
+FIXTURE_VERSION = 2
+SEED = 20240601
+NAME_WORDS = ("hair", "top", "dress", "sofa", "table", "lamp", "trait", "career", "mod",
+              "script", "tuning", "skin", "eyes", "kitchen", "chair", "pose", "buff", "cc",
+              "maxismatch", "alpha", "v2", "final", "recolor", "set", "bundle")
+TAG_WORDS = ("hair", "female", "male", "broken", "favourite", "clothes", "build", "buy",
+             "gameplay", "needs-update", "alpha", "maxismatch", "seasonal", "kids")
+CATEGORIES = ("CAS", "Build/Buy", "Gameplay", "Other")
+DBPF_TYPES = tuple(engine.DBPF_CONTENT_KINDS)
+
+
+# Fixtures
+
+def build_dbpf(rng, payload_size, resource_count=4):
+    """Return the bytes of a minimal DBPF 2.1 package with a real index."""
+    resource_type = rng.choice(DBPF_TYPES)
+    payload = rng.randbytes(payload_size)
+    chunk = max(1, payload_size // resource_count)
+    entries = []
+    for number in range(resource_count):
+        position = engine.DBPF_HEADER_SIZE + number * chunk
+        size = chunk if number < resource_count - 1 else payload_size - number * chunk
+        entries.append(struct.pack(
+            "<7IHH", resource_type, 0, rng.getrandbits(32), rng.getrandbits(32),
+            position, size | 0x80000000, size, 0, 1))
+    index = struct.pack("<I", 0) + b"".join(entries)
+    header = bytearray(engine.DBPF_HEADER_SIZE)
+    header[:4] = b"DBPF"
+    struct.pack_into("<II", header, 4, 2, 1)
+    struct.pack_into("<I", header, 36, resource_count)
+    struct.pack_into("<I", header, 44, len(index))
+    struct.pack_into("<I", header, 64, engine.DBPF_HEADER_SIZE + payload_size)
+    return bytes(header) + payload + index
+
+
+def random_mod_name(rng, number):
+    words = rng.sample(NAME_WORDS, rng.randint(1, 3))
+    return f"{'_'.join(words)}_{number:06d}"
+
+
+def fixture_members(params):
+    """Yield ``(name, data)`` for every archive member, deterministically."""
+    rng = random.Random(SEED)
+    for number in range(params["small_files"]):
+        yield (f"mods/{random_mod_name(rng, number)}.package",
+               build_dbpf(rng, rng.randint(512, 8192)))
+    for number in range(params["huge_files"]):
+        yield (f"mods/huge_{random_mod_name(rng, number)}.package",
+               build_dbpf(rng, params["huge_mb"] * 1024 * 1024))
+
+
+def write_archive(path, archive_format, params):
+    if archive_format == "zip":
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+            for name, data in fixture_members(params):
+                archive.writestr(name, data)
+        return
+    mode = {"tar": "w", "tar.gz": "w:gz", "tar.bz2": "w:bz2", "tar.xz": "w:xz"}[archive_format]
+    with tarfile.open(path, mode) as archive:
+        for name, data in fixture_members(params):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = 0
+            archive.addfile(info, io.BytesIO(data))
+
+
+def ensure_fixtures(fixture_dir, params):
+    """Generate the archive fixtures unless a matching set already exists."""
+    manifest_path = os.path.join(fixture_dir, "manifest.json")
+    wanted = {"version": FIXTURE_VERSION, "seed": SEED, **params}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            if json.load(file) == wanted:
+                return
+    shutil.rmtree(fixture_dir, ignore_errors=True)
+    os.makedirs(fixture_dir)
+    for archive_format in ARCHIVE_FORMATS:
+        log(f"generating fixture.{archive_format}")
+        write_archive(os.path.join(fixture_dir, f"fixture.{archive_format}"),
+                      archive_format, params)
+    with open(manifest_path, "w") as file:
+        json.dump(wanted, file)
+
+
+def build_library(size):
+    rng = random.Random(SEED + size)
+    library = engine.ModLibrary()
+    for number in range(size):
+        library.add(random_mod_name(rng, number), rng.choice(CATEGORIES),
+                    rng.sample(TAG_WORDS, rng.randint(0, 4)),
+                    rng.choice(("MaxisMatch", "Alpha", "Unknown")),
+                    f"/mods/{number:06d}.package")
+    return library
+
+
+# Measurement
+
+def percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * len(sorted_samples) + 0.5) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples, items_per_sample=None, bytes_per_sample=None):
+    """Turn per-sample durations in seconds into latency and throughput figures."""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    result = {
+        "samples": len(ordered),
+        "total_s": round(total, 6),
+        "mean_ms": round(total / len(ordered) * 1000, 4),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+    if items_per_sample and total:
+        result["items_per_s"] = round(items_per_sample * len(ordered) / total, 1)
+    if bytes_per_sample and total:
+        result["mb_per_s"] = round(bytes_per_sample * len(ordered) / total / 1024 / 1024, 2)
+    return result
+
+
+def timed(func, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def per_call(func, arguments):
+    samples = []
+    clock = time.perf_counter
+    for argument in arguments:
+        started = clock()
+        func(argument)
+        samples.append(clock() - started)
+    return samples
+
+
+# Benchmarks
+
+def bench_extract(context, archive_format):
+    archive_path = os.path.join(context["fixtures"], f"fixture.{archive_format}")
+    params = context["params"]
+    member_bytes = sum(len(data) for _, data in fixture_members(params))
+    member_count = params["small_files"] + params["huge_files"]
+    destination = os.path.join(context["scratch"], "extract")
+
+    def setup():
+        shutil.rmtree(destination, ignore_errors=True)
+
+    samples = timed(lambda: engine.extract_archive(archive_path, destination),
+                    context["repeat"], setup)
+    return summarize(samples, member_count, member_bytes)
+
+
+def extracted_fixture(context):
+    destination = os.path.join(context["scratch"], "extracted")
+    engine.extract_archive(os.path.join(context["fixtures"], "fixture.tar"), destination)
+    return destination
+
+
+def bench_categorize_files(context):
+    folder = extracted_fixture(context)
+    count = sum(len(files) for _, _, files in os.walk(folder))
+
+    def setup():
+        engine.PACKAGE_CONTENT_CACHE.clear()
+        engine.ARCHIVE_CLASSIFIER.clear_cache()
+
+    samples = timed(lambda: engine.categorize_files(folder), context["repeat"], setup)
+    return summarize(samples, count)
+
+
+def bench_conflicts(context):
+    folder = extracted_fixture(context)
+    paths = sorted(os.path.join(directory, name) for directory, _, files in os.walk(folder)
+                   for name in files if name.endswith(".package"))
+    detector = engine.ConflictDetector()
+
+    def cold():
+        detector.files.clear()
+        detector.owners.clear()
+        detector.shared.clear()
+
+    results = {"cold": summarize(timed(lambda: detector.analyze(paths), context["repeat"], cold),
+                                 len(paths))}
+    results["warm"] = summarize(timed(lambda: detector.analyze(paths), context["repeat"]),
+                                len(paths))
+    return results
+
+
+def bench_merge(context):
+    folder = extracted_fixture(context)
+    paths = sorted(os.path.join(directory, name) for directory, _, files in os.walk(folder)
+                   for name in files if name.endswith(".package"))
+    byte_count = sum(os.path.getsize(path) for path in paths)
+    merge_folder = os.path.join(context["scratch"], "merged")
+
+    def setup():
+        shutil.rmtree(merge_folder, ignore_errors=True)
+        os.makedirs(merge_folder)
+
+    def merge():
+        engine.PackageMerger(os.path.join(merge_folder, "bench.merge.json")).merge(
+            paths, remove_sources=False)
+
+    return summarize(timed(merge, context["repeat"], setup), len(paths), byte_count)
+
+
+BENCH_RULES = [
+    {"name": "MaxisMatch", "match": {"regex": ["maxismatch", r"\bmm\b"]}, "source": "MaxisMatch"},
+    {"name": "Scripts", "match": {"extension": ".ts4script"}, "category": "Gameplay",
+     "tags": ["script"]},
+    {"name": "CAS parts", "match": {"dbpf_type": engine.DBPF_CAS_PART_TYPE}, "category": "CAS"},
+    {"name": "Large", "match": {"min_size": 1024 * 1024}, "tags": ["large"]},
+] + [{"match": {"glob": f"*{keyword}*"}, "tags": [keyword]}
+     for keyword in ("hair", "sofa", "dress", "lamp", "tuning", "trait")]
+
+
+def bench_rules(context):
+    folder = extracted_fixture(context)
+    paths = sorted(os.path.join(directory, name)
+                   for directory, _, files in os.walk(folder) for name in files)
+    rules_path = os.path.join(context["scratch"], "rules.json")
+    with open(rules_path, "w") as file:
+        json.dump({"rules": BENCH_RULES}, file)
+    rules = engine.RuleSet(rules_path)
+    rules.load()
+
+    results = {"cold": summarize(timed(lambda: rules.evaluate_many(paths), context["repeat"],
+                                       rules.memo.clear), len(paths))}
+    results["warm"] = summarize(timed(lambda: rules.evaluate_many(paths), context["repeat"]),
+                                len(paths))
+    return results
+
+
+def name_workload(count):
+    rng = random.Random(SEED)
+    unique = [random_mod_name(rng, number) for number in range(count // 2)]
+    # Half unique names, half repeats, as when rescanning a library
+    return [f"{name}.package" for name in unique + rng.choices(unique, k=count - len(unique))]
+
+
+def bench_identify_file_category(context):
+    names = name_workload(context["params"]["names"])
+    return summarize(per_call(engine.identify_file_category, names), 1)
+
+
+def bench_detect_category(context):
+    names = name_workload(context["params"]["names"])
+    return summarize(per_call(engine.detect_category, names), 1)
+
+
+def bench_store_save(context, size):
+    library = build_library(size)
+    path = os.path.join(context["scratch"], "library.archistack")
+
+    def save():
+        store = engine.LibraryStore(path)
+        store.attach(library)
+        store.save()
+        store.close()
+
+    def setup():
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    return summarize(timed(save, context["repeat"], setup), size)
+
+
+def bench_store_incremental_save(context, size):
+    library = build_library(size)
+    store = engine.LibraryStore(os.path.join(context["scratch"], "library.archistack"))
+    store.attach(library)
+    store.save()
+    rng = random.Random(SEED)
+    mod_ids = list(library.records)
+    samples = []
+    for number in range(max(context["repeat"], 50)):
+        library.update(rng.choice(mod_ids), category=CATEGORIES[number % len(CATEGORIES)])
+        started = time.perf_counter()
+        store.save()
+        samples.append(time.perf_counter() - started)
+    store.close()
+    return summarize(samples, 1)
+
+
+def bench_store_load(context, size):
+    path = os.path.join(context["scratch"], "library.archistack")
+    store = engine.LibraryStore(path)
+    store.attach(build_library(size))
+    store.save()
+    store.close()
+
+    def load():
+        store = engine.LibraryStore(path)
+        store.load(engine.ModLibrary())
+        store.close()
+
+    return summarize(timed(load, context["repeat"]), size)
+
+
+def bench_json_save(context, size):
+    library = build_library(size)
+    path = os.path.join(context["scratch"], "library.json")
+    return summarize(timed(lambda: engine.save_json_library(path, list(library)),
+                           context["repeat"]), size)
+
+
+def bench_json_load(context, size):
+    path = os.path.join(context["scratch"], "library.json")
+    engine.save_json_library(path, list(build_library(size)))
+    return summarize(timed(lambda: engine.load_json_library(path, engine.ModLibrary()),
+                           context["repeat"]), size)
+
+
+TEXT_QUERIES = ("hair", "sofa_", "max", "kitchen_chair", "v2", "0001", "zzz", "recolor")
+TAG_QUERIES = ("tag:hair", "tag:hair AND NOT tag:broken category:CAS",
+               "(tag:alpha OR tag:maxismatch) AND NOT category:Other", "tag:needs*",
+               "sofa tag:build")
+
+
+def bench_search(context, size, queries):
+    library = build_library(size)
+    library.search_index.build()
+    workload = [query for _ in range(max(1, context["repeat"])) for query in queries]
+
+    def search(query):
+        library.search_index.last_query = library.search_index.last_matches = None
+        library.search(query)
+
+    return summarize(per_call(search, workload), 1)
+
+
+def bench_sort(context, size, sort_fields):
+    library = build_library(size)
+    record_ids = list(library.records)
+    random.Random(SEED).shuffle(record_ids)
+
+    def cold():
+        for record in library:
+            record.sort_keys = None
+
+    results = {"cold": summarize(timed(
+        lambda: engine.sort_record_ids(library.records, record_ids, sort_fields),
+        context["repeat"], cold), size)}
+    results["warm"] = summarize(timed(
+        lambda: engine.sort_record_ids(library.records, record_ids, sort_fields),
+        context["repeat"]), size)
+    return results
+
+
+def registry(sizes):
+    benchmarks = {}
+    for archive_format in ARCHIVE_FORMATS:
+        benchmarks[f"extract_archive.{archive_format}"] = (
+            lambda context, archive_format=archive_format: bench_extract(context, archive_format))
+    benchmarks["categorize_files"] = bench_categorize_files
+    benchmarks["conflicts"] = bench_conflicts
+    benchmarks["merge_packages"] = bench_merge
+    benchmarks["apply_rules"] = bench_rules
+    benchmarks["identify_file_category"] = bench_identify_file_category
+    benchmarks["detect_category"] = bench_detect_category
+    for size in sizes:
+        benchmarks[f"store_save.{size}"] = lambda context, size=size: bench_store_save(context, size)
+        benchmarks[f"store_incremental_save.{size}"] = (
+            lambda context, size=size: bench_store_incremental_save(context, size))
+        benchmarks[f"store_load.{size}"] = lambda context, size=size: bench_store_load(context, size)
+        benchmarks[f"json_save.{size}"] = lambda context, size=size: bench_json_save(context, size)
+        benchmarks[f"json_load.{size}"] = lambda context, size=size: bench_json_load(context, size)
+        benchmarks[f"search.text.{size}"] = (
+            lambda context, size=size: bench_search(context, size, TEXT_QUERIES))
+        benchmarks[f"search.query.{size}"] = (
+            lambda context, size=size: bench_search(context, size, TAG_QUERIES))
+        benchmarks[f"sort.name.{size}"] = (
+            lambda context, size=size: bench_sort(context, size, [("name", False)]))
+        benchmarks[f"sort.category_name.{size}"] = (
+            lambda context, size=size: bench_sort(
+                context, size, [("category", False), ("name", False)]))
+    return benchmarks
+
+
+# Driver
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def peak_rss_kb():
+    """Return this process's peak resident set size in KB.
+
+    Linux carries ``ru_maxrss`` over from the parent across exec, so the
+    per-process high-water mark is read from /proc where available.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_child(args):
+    """Run a single benchmark and print its result as JSON on stdout."""
+    params = json.loads(args.params)
+    with tempfile.TemporaryDirectory(prefix="archistack-bench-") as scratch:
+        context = {"fixtures": args.fixtures, "scratch": scratch, "params": params,
+                   "repeat": args.repeat}
+        result = registry(params["sizes"])[args.child](context)
+    result = result if "cold" in result else {"result": result}
+    for figures in result.values():
+        figures["peak_rss_mb"] = round(peak_rss_kb() / 1024, 1)
+    print(json.dumps(result))
+
+
+def flatten(name, result):
+    """Name each variant of a benchmark result: ``sort.name.1000.cold`` etc."""
+    return {name if variant == "result" else f"{name}.{variant}": figures
+            for variant, figures in result.items()}
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison table; return the names of regressed benchmarks."""
+    regressions = []
+    log(f"{'benchmark':48} {'baseline p50':>14} {'p50':>10} {'change':>8}")
+    for name, figures in sorted(results.items()):
+        if (previous := baseline.get(name)) is None:
+            log(f"{name:48} {'-':>14} {figures['p50_ms']:>10.3f}      new")
+            continue
+        before, after = previous["p50_ms"], figures["p50_ms"]
+        change = (after - before) / before if before else 0.0
+        # Sub-10-microsecond differences are timer noise, not regressions
+        regressed = change > threshold and after - before > 0.01
+        if regressed:
+            regressions.append(name)
+        log(f"{name:48} {before:>14.3f} {after:>10.3f} {change:>+7.1%}"
+            f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="write the results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="compare against a previous results file")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative p50 slowdown reported as a regression")
+    parser.add_argument("--filter", default="", help="only run benchmarks containing this text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true",
+                        help="smaller fixtures and libraries for a fast smoke run")
+    parser.add_argument("--fixtures", default=os.path.join(
+        tempfile.gettempdir(), "archistack-bench-fixtures"))
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--params", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args)
+        return 0
+
+    if args.quick:
+        params = {"small_files": 500, "huge_files": 1, "huge_mb": 8, "names": 20000,
+                  "sizes": [1000, 10000]}
+    else:
+        params = {"small_files": 3000, "huge_files": 3, "huge_mb": 32, "names": 100000,
+                  "sizes": list(LIBRARY_SIZES)}
+    ensure_fixtures(args.fixtures, {key: params[key]
+                                    for key in ("small_files", "huge_files", "huge_mb")})
+
+    results = {}
+    for name in registry(params["sizes"]):
+        if args.filter not in name:
+            continue
+        log(f"running {name}")
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", name,
+             "--fixtures", args.fixtures, "--params", json.dumps(params),
+             "--repeat", str(args.repeat)],
+            capture_output=True, text=True)
+        if completed.returncode:
+            log(completed.stderr)
+            results[name] = {"error": completed.stderr.strip().splitlines()[-1:]}
+            continue
+        results.update(flatten(name, json.loads(completed.stdout)))
+
+    report = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "cpu_count": os.cpu_count(), "params": params, "repeat": args.repeat},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        measured = {name: figures for name, figures in results.items() if "p50_ms" in figures}
+        if regressions := compare(measured, baseline, args.threshold):
+            log(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("tkinter")
+pytest.importorskip("ttkthemes")
+
+from ARCNE import ModOrganizerFrame  # noqa: E402
+from archistack_engine import ModLibrary, RuleSet, ScanResult  # noqa: E402
+
+
+class ViewStub:
+    def __init__(self):
+        self.removed = []
+        self.refreshed = []
+
+    def remove_rows(self, record_ids):
+        self.removed.extend(record_ids)
+
+    def refresh_rows(self, record_ids):
+        self.refreshed.extend(record_ids)
+
+
+class FrameStub:
+    """Just enough of ModOrganizerFrame to run apply_scan_result without a display."""
+
+    apply_scan_result = ModOrganizerFrame.apply_scan_result
+    add_record = ModOrganizerFrame.add_record
+
+    def __init__(self, rules):
+        self.library = ModLibrary()
+        self.rules = rules
+        self.previews = {}
+        self.conflicts = None
+        self.view = ViewStub()
+        self.inserted = []
+
+    def insert_records(self, records):
+        self.inserted.extend(records)
+
+
+@pytest.fixture
+def frame(tmp_path):
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({"rules": [
+        {"match": {"glob": "*maxismatch*"}, "source": "MaxisMatch", "tags": ["mm"]},
+        {"match": {"regex": "hair"}, "category": "CAS"},
+    ]}))
+    rules = RuleSet(str(rules_path))
+    rules.load()
+    return FrameStub(rules)
+
+
+def write(path, data=b"data"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_modified_and_added_files_in_one_batch(frame, tmp_path):
+    modified = write(tmp_path / "mods" / "maxismatch_sofa.package")
+    record = frame.library.add("maxismatch_sofa.package", "Other", path=modified)
+    added = write(tmp_path / "mods" / "long_hair.package")
+
+    result = ScanResult()
+    result.modified = [modified]
+    result.added = [added]
+    result.total_files = 2
+    summary = frame.apply_scan_result(
+        result, {modified: "Build/Buy", added: "Other"})
+
+    assert "1 added" in summary and "1 updated" in summary
+    assert (record.category, record.source, record.tags) == ("Build/Buy", "MaxisMatch", ["mm"])
+    assert frame.view.refreshed == [record.id]
+    new_record = frame.library.find_path(added)
+    assert frame.inserted == [new_record]
+    assert new_record.category == "CAS"
+
+
+def test_rule_category_wins_over_classifier_for_modified_file(frame, tmp_path):
+    path = write(tmp_path / "hair.package")
+    record = frame.library.add("hair.package", "CAS", path=path)
+    result = ScanResult()
+    result.modified = [path]
+    frame.apply_scan_result(result, {path: "Other"})
+    assert record.category == "CAS"
+
+
+def test_removed_files_and_folders(frame, tmp_path):
+    kept = write(tmp_path / "kept.package")
+    gone = write(tmp_path / "gone.package")
+    nested = write(tmp_path / "sub" / "nested.package")
+    ids = [frame.library.add(os.path.basename(path), path=path).id
+           for path in (kept, gone, nested)]
+    result = ScanResult()
+    result.removed = [gone]
+    result.removed_dirs = [str(tmp_path / "sub")]
+    frame.apply_scan_result(result, {})
+    assert sorted(frame.view.removed) == ids[1:]
+    assert [record.path for record in frame.library] == [kept]
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from archistack_cli import main
+from archistack_engine import AUTOSAVE_JOURNAL_FILE, AUTOSAVE_SNAPSHOT_FILE, LibraryJournal, ModLibrary
+
+
+@pytest.fixture
+def autosave(tmp_path, monkeypatch):
+    """An autosave in the working directory whose journal ends in a torn line."""
+    monkeypatch.chdir(tmp_path)
+    library = ModLibrary()
+    journal = LibraryJournal(AUTOSAVE_SNAPSHOT_FILE, AUTOSAVE_JOURNAL_FILE)
+    journal.attach(library)
+    library.add("Hair", "CAS", ["hair"])
+    journal.compact()
+    library.add("Sofa", "Build")
+    # Stop the writer without the compaction close() would do
+    journal._queue.put(None)
+    journal._thread.join()
+    with open(AUTOSAVE_JOURNAL_FILE, "a") as file:
+        file.write('{"seq": 9, "op": "ad')
+    return tmp_path
+
+
+def exported(capsys, *argv):
+    assert main(["export", *argv]) == 0
+    return [json.loads(line)["name"] for line in capsys.readouterr().out.splitlines()]
+
+
+def test_export_leaves_the_autosave_untouched(autosave, capsys):
+    before = {path.name: path.read_bytes() for path in autosave.iterdir()}
+    assert exported(capsys) == ["Hair", "Sofa"]
+    assert {path.name: path.read_bytes() for path in autosave.iterdir()} == before
+
+
+@pytest.mark.parametrize("query", ["", " "])
+def test_blank_query_exports_everything(autosave, capsys, query):
+    assert exported(capsys, "--query", query) == ["Hair", "Sofa"]
+
+
+def test_query_filters_the_export(autosave, capsys):
+    assert exported(capsys, "--query", "tag:hair") == ["Hair"]
+
+
+def test_unreadable_autosave_is_an_error(autosave, capsys):
+    (autosave / AUTOSAVE_SNAPSHOT_FILE).write_text("[")
+    assert main(["export"]) == 1
+    assert json.loads(capsys.readouterr().out)["event"] == "error"
@@ -0,0 +1,32 @@
+import threading
+
+import archistack_engine
+from archistack_engine import ConflictDetector, DBPFResource, write_dbpf
+
+
+def make_packages(folder, count):
+    paths = []
+    for number in range(count):
+        path = folder / f"mod{number:03}.package"
+        # Every tenth package overrides a resource of the package before it
+        instances = [number, number - 1] if number % 10 == 1 else [number]
+        with open(path, "wb") as file:
+            write_dbpf(file, [(DBPFResource(0x545AC67A, 0, instance, 0, 4, 4, 0), b"data")
+                              for instance in instances])
+        paths.append(str(path))
+    return paths
+
+
+def test_pooled_analysis_from_a_thread_matches_serial(tmp_path, monkeypatch):
+    paths = make_packages(tmp_path, archistack_engine.CONFLICT_POOL_MIN_FILES)
+    results = {}
+    worker = threading.Thread(
+        target=lambda: results.update(pooled=ConflictDetector(max_workers=2).analyze(paths)))
+    worker.start()
+    worker.join(timeout=120)
+    assert not worker.is_alive()
+
+    monkeypatch.setattr(archistack_engine, "CONFLICT_POOL_MIN_FILES", len(paths) + 1)
+    serial = ConflictDetector().analyze(paths)
+    assert results["pooled"] == serial
+    assert len(serial) == len(paths) // 10
@@ -0,0 +1,63 @@
+import struct
+import zlib
+
+import pytest
+
+from archistack_engine import (
+    DBPF_COMPRESSION_NONE, DBPF_COMPRESSION_ZLIB, DBPF_HEADER_SIZE, DBPFError, DBPFResource,
+    MappedFile, dbpf_content_kind, read_dbpf_index, read_dbpf_resource, write_dbpf)
+
+RESOURCES = [
+    (0x034AEECB, 0x80000000, 0x0123456789ABCDEF, b"cas part" * 40, DBPF_COMPRESSION_NONE),
+    (0x545AC67A, 0, 0xFFFFFFFF00000001, b"simdata " * 500, DBPF_COMPRESSION_ZLIB),
+    (0x03B33DDF, 0x1234, 1, b"", DBPF_COMPRESSION_NONE),
+]
+
+
+def blobs():
+    for resource_type, group, instance, content, compression in RESOURCES:
+        data = zlib.compress(content) if compression == DBPF_COMPRESSION_ZLIB else content
+        yield DBPFResource(resource_type, group, instance, 0, len(data), len(content),
+                           compression), data
+
+
+def test_write_then_read_round_trip(tmp_path):
+    path = str(tmp_path / "mod.package")
+    with open(path, "wb") as file:
+        written = write_dbpf(file, blobs())
+
+    resources = read_dbpf_index(path)
+    assert [(resource.key, resource.offset, resource.size, resource.mem_size,
+             resource.compression) for resource in resources] == [
+        (resource.key, resource.offset, resource.size, resource.mem_size,
+         resource.compression) for resource in written]
+    assert resources[0].offset == DBPF_HEADER_SIZE
+    with MappedFile(path) as mapped:
+        assert [read_dbpf_resource(mapped, resource) for resource in resources] == [
+            content for _, _, _, content, _ in RESOURCES]
+    assert dbpf_content_kind(resources) == "cas"
+
+
+def test_empty_package(tmp_path):
+    path = str(tmp_path / "empty.package")
+    with open(path, "wb") as file:
+        assert write_dbpf(file, []) == []
+    assert read_dbpf_index(path) == []
+
+
+@pytest.mark.parametrize("damage", ["magic", "version", "index"])
+def test_damaged_packages_raise(tmp_path, damage):
+    path = tmp_path / "mod.package"
+    with open(path, "wb") as file:
+        write_dbpf(file, blobs())
+    data = bytearray(path.read_bytes())
+    if damage == "magic":
+        data[:4] = b"DBPX"
+    elif damage == "version":
+        struct.pack_into("<I", data, 4, 3)
+    else:
+        # Claim more entries than the index holds
+        struct.pack_into("<I", data, 36, 50)
+    path.write_bytes(data)
+    with pytest.raises(DBPFError):
+        read_dbpf_index(str(path))
@@ -0,0 +1,111 @@
+import os
+import zipfile
+
+import pytest
+
+from archistack_engine import (
+    ArchiveLimitError, ArchiveReader, ExtractionCancelled, ExtractionJob, extract_archive,
+    identify_file_category)
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return path
+
+
+def folder_contents(folder):
+    contents = {}
+    for root, _, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, "rb") as file:
+                contents[os.path.relpath(path, folder)] = file.read()
+    return contents
+
+
+@pytest.fixture
+def same_name_zip(tmp_path):
+    return make_zip(tmp_path / "hair.zip", [
+        ("first/hair.package", b"first" * 100),
+        ("second/hair.package", b"second" * 100),
+    ])
+
+
+def category_path(destination, name):
+    return os.path.join(destination, identify_file_category(name), name)
+
+
+def test_same_name_members_are_renamed(tmp_path, same_name_zip):
+    destination = str(tmp_path / "out")
+    job = ExtractionJob(str(same_name_zip), destination)
+    extract_archive(str(same_name_zip), destination, job)
+
+    target = category_path(destination, "hair.package")
+    renamed = category_path(destination, "hair (hair).package")
+    with open(target, "rb") as file:
+        assert file.read() == b"first" * 100
+    with open(renamed, "rb") as file:
+        assert file.read() == b"second" * 100
+    assert job.renamed == 1 and job.files_done == 2
+
+
+def test_same_name_members_are_skipped(tmp_path, same_name_zip):
+    destination = str(tmp_path / "out")
+    job = ExtractionJob(str(same_name_zip), destination, collision_policy="skip")
+    extract_archive(str(same_name_zip), destination, job)
+
+    assert list(folder_contents(destination).values()) == [b"first" * 100]
+    assert job.skipped == 1 and job.files_done == 2
+
+
+def test_same_name_members_are_overwritten(tmp_path, same_name_zip):
+    destination = str(tmp_path / "out")
+    job = ExtractionJob(str(same_name_zip), destination, collision_policy="overwrite")
+    extract_archive(str(same_name_zip), destination, job)
+
+    assert list(folder_contents(destination).values()) == [b"second" * 100]
+    assert job.overwritten == 1
+
+
+class CancelAfterFirst(ExtractionJob):
+    def advance(self, file_count=1, byte_count=0):
+        super().advance(file_count, byte_count)
+        if file_count:
+            self.cancel()
+
+
+@pytest.mark.parametrize("policy", ["rename", "overwrite"])
+def test_cancel_removes_written_files_and_restores_overwritten(tmp_path, policy):
+    archive_path = str(make_zip(tmp_path / "mods.zip", [
+        ("a.package", b"new a" * 100),
+        ("b.package", b"new b" * 100),
+        ("c.package", b"new c" * 100),
+    ]))
+    destination = str(tmp_path / "out")
+    existing = category_path(destination, "a.package")
+    os.makedirs(os.path.dirname(existing))
+    with open(existing, "wb") as file:
+        file.write(b"old a")
+    before = folder_contents(destination)
+
+    job = CancelAfterFirst(archive_path, destination, collision_policy=policy)
+    with pytest.raises(ExtractionCancelled):
+        extract_archive(archive_path, destination, job)
+
+    assert folder_contents(destination) == before
+    assert job.written == []
+
+
+def test_7z_unpacking_stops_at_the_limits(tmp_path):
+    py7zr = pytest.importorskip("py7zr")
+    archive_path = str(tmp_path / "bomb.7z")
+    with py7zr.SevenZipFile(archive_path, "w") as archive:
+        archive.writestr(bytes(64 * 1024 * 1024), "bomb.package")
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+
+    with pytest.raises(ArchiveLimitError), ArchiveReader(archive_path, str(work_dir)) as reader:
+        list(reader)
+    assert list(work_dir.iterdir()) == []
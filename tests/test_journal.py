@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from archistack_engine import LibraryJournal, ModLibrary
+
+
+def record_names(library):
+    return sorted(record.name for record in library)
+
+
+def crash(journal):
+    """Stop the writer thread the way a crash would, without a final compaction."""
+    journal._queue.put(None)
+    journal._thread.join()
+
+
+@pytest.fixture
+def journal_paths(tmp_path):
+    return str(tmp_path / "autosave.json"), str(tmp_path / "autosave.journal")
+
+
+def journaled_library(journal_paths):
+    library = ModLibrary()
+    journal = LibraryJournal(*journal_paths)
+    journal.attach(library)
+    library.add("Hair", category="CAS", tags=["hair"])
+    library.add("Sofa", category="Build")
+    journal.compact()
+    library.add("Lamp", category="Build")
+    library.update(library.find("Sofa").id, tags=["living room"])
+    crash(journal)
+    return library
+
+
+def test_recover_replays_the_journal_after_the_snapshot(journal_paths):
+    original = journaled_library(journal_paths)
+    library = ModLibrary()
+    assert LibraryJournal(*journal_paths).recover(library) == 2
+    assert ({record.id: record.to_dict() for record in library}
+            == {record.id: record.to_dict() for record in original})
+
+
+def test_recover_drops_a_torn_tail(journal_paths):
+    journaled_library(journal_paths)
+    with open(journal_paths[1], "a") as file:
+        file.write('{"seq": 99, "op": "add", "rec')
+
+    library = ModLibrary()
+    journal = LibraryJournal(*journal_paths)
+    assert journal.recover(library) == 2
+    assert record_names(library) == ["Hair", "Lamp", "Sofa"]
+    with open(journal_paths[1]) as file:
+        assert all(json.loads(line) for line in file)
+
+    # New entries follow the last good line
+    journal.attach(library)
+    library.add("Rug")
+    crash(journal)
+    recovered = ModLibrary()
+    assert LibraryJournal(*journal_paths).recover(recovered) == 3
+    assert record_names(recovered) == ["Hair", "Lamp", "Rug", "Sofa"]
+
+
+@pytest.mark.parametrize("content", ['{"seq": 2, "records": [', "[]"])
+def test_recover_refuses_a_corrupt_snapshot(journal_paths, content):
+    journaled_library(journal_paths)
+    with open(journal_paths[0], "w") as file:
+        file.write(content)
+
+    with pytest.raises(ValueError):
+        LibraryJournal(*journal_paths).recover(ModLibrary())
+    with open(journal_paths[0]) as file:
+        assert file.read() == content
@@ -0,0 +1,70 @@
+import pytest
+
+from archistack_engine import LibraryStore, ModLibrary
+
+
+def snapshot(library):
+    # The store keeps tags as a set of rows, so their order isn't preserved
+    return {record.id: {**record.to_dict(), "tags": sorted(record.tags)} for record in library}
+
+
+def reloaded(path):
+    library = ModLibrary()
+    store = LibraryStore(path)
+    store.load(library)
+    store.close()
+    return library
+
+
+@pytest.fixture
+def saved_store(tmp_path):
+    path = str(tmp_path / "library.archistack")
+    library = ModLibrary()
+    library.add("Hair", "CAS", ["hair", "female"], "TSR", "/mods/hair.package")
+    library.add("Sofa", "Build", ["living room"], "", "/mods/sofa.package")
+    library.add("Lamp", "Build", ["lighting"])
+    library.add("Rug", "Build")
+    store = LibraryStore(path)
+    store.attach(library)
+    assert store.save() == 4
+    yield path, library, store
+    store.close()
+
+
+def test_save_writes_only_changed_records(saved_store):
+    path, library, store = saved_store
+    library.update(library.find("Lamp").id, tags=["lighting", "modern"])
+    assert store.save() == 1
+    assert store.save() == 0
+    assert snapshot(reloaded(path)) == snapshot(library)
+
+
+def test_save_after_rename(saved_store):
+    path, library, store = saved_store
+    library.update(library.find("Sofa").id, name="Couch")
+    assert store.save() == 1
+    assert snapshot(reloaded(path)) == snapshot(library)
+
+
+def test_save_after_swapping_names(saved_store):
+    path, library, store = saved_store
+    hair, sofa = library.find("Hair").id, library.find("Sofa").id
+    library.update_many({hair: {"name": "Sofa"}, sofa: {"name": "Hair"}})
+    assert store.save() == 2
+    assert snapshot(reloaded(path)) == snapshot(library)
+
+
+def test_save_after_taking_a_removed_name(saved_store):
+    path, library, store = saved_store
+    library.remove(library.find("Rug").id)
+    library.update(library.find("Lamp").id, name="Rug")
+    store.save()
+    assert snapshot(reloaded(path)) == snapshot(library)
+
+
+def test_save_after_clear_rewrites(saved_store):
+    path, library, store = saved_store
+    library.clear()
+    library.add("Bed", "Build", ["bedroom"])
+    store.save()
+    assert snapshot(reloaded(path)) == snapshot(library)
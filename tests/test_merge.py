@@ -0,0 +1,130 @@
+import json
+import os
+import random
+import struct
+
+import pytest
+
+from archistack_engine import DBPF_HEADER_SIZE, PackageMerger, read_dbpf_index
+
+
+def odd_package(path, blobs, seed):
+    """Write a valid package laid out unlike write_dbpf would: a constant-type
+    index, filler and padding around the blobs, trailing bytes and junk in the
+    spare header fields."""
+    rng = random.Random(seed)
+    index_size = 8 + 28 * len(blobs)
+    data_start = DBPF_HEADER_SIZE + index_size + rng.randrange(1, 16)
+    entries = bytearray()
+    body = bytearray()
+    position = data_start
+    for instance, (data, compression) in enumerate(blobs):
+        pad = rng.randbytes(rng.randrange(0, 9))
+        offset = position + len(pad)
+        entries += struct.pack("<6IHH", 0, 0, instance, offset, len(data) | 0x80000000,
+                               len(data) * 2, compression, 1)
+        body += pad + data
+        position = offset + len(data)
+    index = struct.pack("<II", 1, 0x034AEECB) + entries
+    header = bytearray(rng.randbytes(DBPF_HEADER_SIZE))
+    header[:4] = b"DBPF"
+    struct.pack_into("<II", header, 4, 2, 1)
+    struct.pack_into("<I", header, 36, len(blobs))
+    struct.pack_into("<I", header, 44, len(index))
+    struct.pack_into("<II", header, 60, 3, DBPF_HEADER_SIZE)
+    filler = rng.randbytes(data_start - DBPF_HEADER_SIZE - len(index))
+    with open(path, "wb") as file:
+        file.write(header + index + filler + body + rng.randbytes(5))
+    return str(path)
+
+
+@pytest.fixture
+def sources(tmp_path):
+    folder = tmp_path / "Mods"
+    folder.mkdir()
+    rng = random.Random(7)
+    paths = [odd_package(folder / f"mod_{number}.package",
+                         [(rng.randbytes(rng.randrange(1, 300)), compression)
+                          for compression in (0, 0x5A42, 0)], number)
+             for number in range(6)]
+    originals = {}
+    for number, path in enumerate(paths):
+        os.utime(path, ns=(10 ** 18 + number, 10 ** 18 + number))
+        with open(path, "rb") as file:
+            originals[path] = file.read()
+    return folder, paths, originals
+
+
+def assert_restored(originals):
+    for path, data in originals.items():
+        with open(path, "rb") as file:
+            assert file.read() == data, path
+
+
+def test_merge_keeps_sources_by_default(sources, tmp_path):
+    folder, paths, originals = sources
+    merger = PackageMerger(str(folder / "Set.merge.json"))
+    result = merger.merge(paths)
+    assert result.merged == paths and not result.removed_sources
+    assert_restored(originals)
+    resources = read_dbpf_index(result.written[0])
+    assert len(resources) == 3 * len(paths)
+
+
+def test_merge_unmerge_round_trip_is_byte_identical(sources):
+    folder, paths, originals = sources
+    merger = PackageMerger(str(folder / "Set.merge.json"), package_limit=700)
+    result = merger.merge(paths, remove_sources=True)
+    assert len(result.written) > 1
+    assert sorted(result.removed_sources) == sorted(paths)
+    assert not any(os.path.exists(path) for path in paths)
+
+    reloaded = PackageMerger(str(folder / "Set.merge.json"))
+    reloaded.load()
+    restored = reloaded.unmerge()
+    assert sorted(restored.merged) == sorted(paths)
+    assert_restored(originals)
+    for number, path in enumerate(paths):
+        assert os.stat(path).st_mtime_ns == 10 ** 18 + number
+    assert not os.path.exists(folder / "Set.merge.json")
+    assert sorted(os.listdir(folder)) == sorted(os.path.basename(path) for path in paths)
+
+
+def test_partial_unmerge_rewrites_the_rest(sources):
+    folder, paths, originals = sources
+    merger = PackageMerger(str(folder / "Set.merge.json"))
+    merger.merge(paths, remove_sources=True)
+    merger.unmerge(paths[:2])
+    assert_restored({path: originals[path] for path in paths[:2]})
+    merger.unmerge()
+    assert_restored(originals)
+
+
+def test_sources_that_do_not_rebuild_exactly_are_kept(sources):
+    folder, paths, originals = sources
+    merger = PackageMerger(str(folder / "Set.merge.json"))
+    written = merger.merge(paths).written[0]
+    # Corrupt the copy of one source's first resource in the merged package
+    entry = merger.sources[paths[0]]
+    resource = read_dbpf_index(written)[entry["first"]]
+    with open(written, "r+b") as file:
+        file.seek(resource.offset)
+        file.write(bytes([file.read(1)[0] ^ 0xFF]))
+    # Sources merged before manifests kept their layout can't be verified
+    del merger.sources[paths[1]]["gaps"]
+
+    result = merger.merge(paths, remove_sources=True)
+    assert result.unchanged == len(paths)
+    assert sorted(result.kept_sources) == sorted(paths[:2])
+    assert sorted(result.removed_sources) == sorted(paths[2:])
+    assert_restored({path: originals[path] for path in paths[:2]})
+
+
+def test_manifest_records_layout(sources):
+    folder, paths, _ = sources
+    PackageMerger(str(folder / "Set.merge.json")).merge(paths[:1])
+    with open(folder / "Set.merge.json") as file:
+        data = json.load(file)
+    entry = data["sources"][paths[0]]
+    assert data["version"] == 2
+    assert entry["gaps"][0][0] == 0 and len(entry["offsets"]) == entry["count"] == 3
@@ -0,0 +1,73 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import archistack_engine
+from archistack_engine import PreviewCache, PreviewLoader, full_file_hash, make_thumbnail
+
+
+@pytest.fixture
+def loader(tmp_path):
+    loader = PreviewLoader(PreviewCache(str(tmp_path / "previews.db")), max_workers=2)
+    yield loader
+    loader.shutdown()
+    loader.cache.close()
+
+
+@pytest.fixture
+def package(tmp_path):
+    path = tmp_path / "mod.package"
+    path.write_bytes(b"not really a package")
+    return str(path)
+
+
+def test_missing_file_reports_a_failure(loader, tmp_path):
+    path = str(tmp_path / "gone.package")
+    loader.request([path])
+    result_path, metadata, thumbnail = loader.results.get(timeout=10)
+    assert result_path == path and "failed" in metadata and thumbnail is None
+
+
+def test_unexpected_errors_report_a_failure_and_are_not_cached(loader, package, monkeypatch):
+    def broken(path):
+        raise IndexError("bad resource")
+
+    monkeypatch.setattr(archistack_engine, "extract_preview", broken)
+    loader.request([package])
+    assert loader.results.get(timeout=10) == (package, {"failed": "bad resource"}, None)
+    assert len(loader.cache) == 0
+
+
+def test_shutdown_waits_for_running_loads(loader, package, monkeypatch):
+    started = threading.Event()
+
+    def slow(path):
+        started.set()
+        threading.Event().wait(0.2)
+        return {"size": 1}, None
+
+    monkeypatch.setattr(archistack_engine, "extract_preview", slow)
+    loader.request([package])
+    assert started.wait(10)
+    loader.shutdown()
+    # The load finished and wrote to the cache before shutdown returned
+    assert loader.cache.get(full_file_hash(package)) == ({"size": 1}, None)
+
+
+def test_thumbnail_is_shrunk_to_png():
+    Image = pytest.importorskip("PIL.Image")
+    source = io.BytesIO()
+    Image.new("RGB", (512, 256), "red").save(source, "JPEG")
+    with Image.open(io.BytesIO(make_thumbnail(source.getvalue(), 64))) as thumbnail:
+        assert thumbnail.format == "PNG" and thumbnail.size == (64, 32)
+
+
+def test_engine_import_does_not_load_pillow():
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, archistack_engine; print('PIL' in sys.modules)"],
+        cwd=os.path.dirname(archistack_engine.__file__), capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,33 @@
+import pytest
+
+from archistack_engine import ModLibrary, is_structured_query
+
+
+@pytest.mark.parametrize("text", ["tag:hair", "Category:CAS", "cat:Build OR sofa",
+                                  "NOT tag:broken", "(tag:hair OR tag:wig) long"])
+def test_structured_queries(text):
+    assert is_structured_query(text)
+
+
+@pytest.mark.parametrize("text", ["sofa", "Note: WIP", "https://example.com/mod",
+                                  "v2:final", "Hair (long)", "Sofa (v2", "(sofa)",
+                                  "Sims NOT Included", "Rock AND Roll", "Hair OR"])
+def test_plain_text_with_colons_is_a_substring_search(text):
+    assert not is_structured_query(text)
+
+
+def test_search_with_an_unknown_prefix_matches_names():
+    library = ModLibrary()
+    wip = library.add("Note: WIP sofa", "Build")
+    library.add("Lamp", "Build", ["note"])
+    assert library.search("Note: WIP") == {wip.id}
+    assert library.search("tag:note") == {library.find("Lamp").id}
+
+
+def test_operator_and_parenthesis_words_in_names_match_as_text():
+    library = ModLibrary()
+    included = library.add("Sims NOT Included", "Build")
+    library.add("Sims pack", "Build")
+    sofa = library.add("Sofa (v2 beta", "Build")
+    assert library.search("Sims NOT Included") == {included.id}
+    assert library.search("Sofa (v2") == {sofa.id}
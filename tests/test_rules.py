@@ -0,0 +1,121 @@
+import json
+import os
+
+import pytest
+
+from archistack_engine import (
+    DBPFResource, CompiledRules, RuleResult, RuleSet, detect_mod_source, write_dbpf,
+)
+
+
+def test_backreference_is_local_to_its_rule():
+    rules = CompiledRules([
+        {"match": {"regex": r"(a)(b)"}, "tags": ["ab"]},
+        {"match": {"regex": r"(\w)\1"}, "tags": ["double"]},
+    ])
+    assert rules.match("abc.package").tags == ["ab"]
+    assert rules.match("hood.package").tags == ["double"]
+
+
+def test_inline_flags_and_repeated_group_names():
+    rules = CompiledRules([
+        {"match": {"regex": "(?-i:CAS)"}, "category": "CAS"},
+        {"match": {"regex": "(?P<part>hair)"}, "tags": ["hair"]},
+        {"match": {"regex": "(?P<part>sofa)"}, "tags": ["sofa"]},
+    ])
+    assert rules.match("CAS_hair.package").category == "CAS"
+    assert rules.match("cas_hair.package").category is None
+    assert rules.match("sofa.package").tags == ["sofa"]
+
+
+def test_invalid_rule_is_named():
+    with pytest.raises(ValueError, match="Rule broken: invalid regex"):
+        CompiledRules([{"match": {"regex": "ok"}}, {"name": "broken", "match": {"regex": "("}}])
+    with pytest.raises(ValueError, match="Rule #1: unknown predicate colour"):
+        CompiledRules([{"match": {"colour": "red"}}])
+
+
+def test_first_category_wins_and_tags_accumulate():
+    rules = CompiledRules([
+        {"match": {"glob": "*hair*", "extension": "package"}, "category": "CAS", "tags": "hair, cas"},
+        {"match": {"glob": "*.package"}, "category": "Other", "tags": ["package"]},
+        {"match": {"min_size": 100}, "tags": ["large"]},
+    ])
+    result = rules.match("Long_Hair.package", size=10)
+    assert (result.category, result.tags) == ("CAS", ["hair", "cas", "package"])
+    assert rules.match("hair.ts4script", size=200).tags == ["large"]
+    assert rules.match("hair.package").tags == ["hair", "cas", "package"]
+
+
+def test_dbpf_type_predicate(tmp_path):
+    path = tmp_path / "thing.package"
+    with open(path, "wb") as file:
+        write_dbpf(file, [(DBPFResource(0x034AEECB, 0, 1, 0, 4, 4, 0), b"data")])
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({"rules": [
+        {"match": {"dbpf_type": "0x034AEECB"}, "category": "CAS"},
+        {"match": {"dbpf_type": 0x319E4F1D}, "category": "Build/Buy"},
+    ]}))
+    rules = RuleSet(str(rules_path))
+    rules.load()
+    assert rules.evaluate(str(path)).category == "CAS"
+
+
+def test_memo_reevaluates_only_changed_files(tmp_path):
+    paths = []
+    for name in ("a_maxismatch.package", "b.package"):
+        (tmp_path / name).write_bytes(b"x")
+        paths.append(str(tmp_path / name))
+    cache_path = str(tmp_path / "cache.json")
+    rules = RuleSet(str(tmp_path / "missing.json"), cache_path)
+    rules.load()
+    assert [result.source for result in rules.evaluate_many(paths)] == ["MaxisMatch", None]
+    rules.save()
+
+    reloaded = RuleSet(str(tmp_path / "missing.json"), cache_path)
+    reloaded.load()
+    reloaded.evaluate_many(paths)
+    assert reloaded.files_evaluated == 0
+    with open(paths[1], "ab") as file:
+        file.write(b"more")
+    reloaded.evaluate_many(paths)
+    assert reloaded.files_evaluated == 1
+
+
+def test_reload_keeps_previous_rules_on_error(tmp_path):
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({"rules": [{"match": {"regex": "sofa"}, "category": "Buy"}]}))
+    rules = RuleSet(str(rules_path))
+    rules.load()
+    rules_path.write_text(json.dumps({"rules": [{"match": {"regex": "("}}]}))
+    os.utime(rules_path, ns=(1, 1))
+    with pytest.raises(ValueError):
+        rules.reload_if_changed()
+    assert rules.match_name("sofa.package").category == "Buy"
+    with pytest.raises(ValueError):
+        rules.add_categories(["Hair"])
+    assert "(" in rules_path.read_text()
+
+
+def test_add_categories_writes_keyword_rules(tmp_path):
+    rules = RuleSet(str(tmp_path / "rules.json"))
+    rules.load()
+    assert rules.add_categories(["Hair", "hair", "Poses"]) == ["Hair", "Poses"]
+    reloaded = RuleSet(str(tmp_path / "rules.json"))
+    reloaded.load()
+    assert reloaded.categories() == ["Hair", "Poses"]
+    assert reloaded.match_name("long hair (1).package").category == "Hair"
+
+
+def test_changes_for_only_adds_tags():
+    class Record:
+        category, source, tags = "Other", "", ["mine"]
+
+    changes = RuleResult("CAS", "Alpha", ["mine", "new"]).changes_for(Record)
+    assert changes == {"category": "CAS", "source": "Alpha", "tags": ["mine", "new"]}
+
+
+def test_default_rules_match_old_source_detection():
+    assert detect_mod_source("Cool_MaxisMatch_Alpha.package") == "MaxisMatch"
+    assert detect_mod_source("alpha_hair.package") == "Alpha"
+    assert detect_mod_source("plain.package") == "Unknown"
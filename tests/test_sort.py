@@ -0,0 +1,122 @@
+import pytest
+
+pytest.importorskip("tkinter")
+pytest.importorskip("ttkthemes")
+
+from ARCNE import ModOrganizerFrame  # noqa: E402
+from archistack_engine import ModLibrary  # noqa: E402
+
+
+class ViewStub:
+    def __init__(self):
+        self.row_ids = []
+
+    def set_rows(self, record_ids):
+        self.row_ids = list(record_ids)
+
+    def append_rows(self, record_ids):
+        self.row_ids.extend(record_ids)
+
+
+class TreeviewStub:
+    def __init__(self):
+        self.headings = {}
+
+    def __getitem__(self, option):
+        return ("Name", "Category", "Tags", "Source")
+
+    def heading(self, column, text):
+        self.headings[column] = text
+
+
+class FrameStub:
+    """Just enough of ModOrganizerFrame to sort rows without a display."""
+
+    sort_treeview = ModOrganizerFrame.sort_treeview
+    resort_rows = ModOrganizerFrame.resort_rows
+    on_library_change = ModOrganizerFrame.on_library_change
+    update_sort_headings = ModOrganizerFrame.update_sort_headings
+
+    def __init__(self):
+        self.library = ModLibrary()
+        self.library.listeners.append(self.on_library_change)
+        self.view = ViewStub()
+        self.treeview = TreeviewStub()
+        self.sort_columns = []
+        self.sort_order_valid = False
+        self.resort_id = None
+        self.idle = {}
+
+    def after_idle(self, callback):
+        self.idle[len(self.idle) + 1] = callback
+        return len(self.idle)
+
+    def after_cancel(self, after_id):
+        del self.idle[after_id]
+
+    def run_idle(self):
+        for after_id in list(self.idle):
+            self.idle.pop(after_id)()
+
+    def add(self, name, **fields):
+        record = self.library.add(name, **fields)
+        self.view.append_rows([record.id])
+        return record
+
+    def names(self):
+        return [self.library.records[row_id].name for row_id in self.view.row_ids]
+
+
+@pytest.fixture
+def frame():
+    frame = FrameStub()
+    for name in ("Lamp", "Bed", "Sofa"):
+        frame.add(name)
+    return frame
+
+
+def test_second_click_reverses(frame):
+    frame.sort_treeview("Name")
+    assert frame.names() == ["Bed", "Lamp", "Sofa"]
+    frame.sort_treeview("Name")
+    assert frame.names() == ["Sofa", "Lamp", "Bed"]
+    assert frame.treeview.headings["Name"] == "Name ▼"
+
+
+def test_click_after_append_sorts_descending(frame):
+    frame.sort_treeview("Name")
+    frame.add("Chair")
+    frame.add("Armchair")
+    # The click comes before the idle re-sort has run
+    frame.sort_treeview("Name")
+    assert frame.names() == ["Sofa", "Lamp", "Chair", "Bed", "Armchair"]
+    assert frame.idle == {}
+
+
+def test_click_after_edit_sorts_descending(frame):
+    frame.sort_treeview("Name")
+    frame.library.update(frame.library.find("Bed").id, name="Wardrobe")
+    frame.sort_treeview("Name")
+    assert frame.names() == ["Wardrobe", "Sofa", "Lamp"]
+
+
+def test_appended_rows_are_resorted_when_idle(frame):
+    frame.sort_treeview("Name")
+    frame.sort_treeview("Name")
+    frame.add("Chair")
+    frame.add("Armchair")
+    assert len(frame.idle) == 1
+    frame.run_idle()
+    assert frame.names() == ["Sofa", "Lamp", "Chair", "Bed", "Armchair"]
+    frame.sort_treeview("Name")
+    assert frame.names() == ["Armchair", "Bed", "Chair", "Lamp", "Sofa"]
+
+
+def test_replacing_the_rows_keeps_them_sorted(frame):
+    frame.sort_treeview("Name")
+    frame.library.clear()
+    for name in ("Rug", "Desk"):
+        frame.library.add(name)
+    frame.view.set_rows(frame.library.records)
+    frame.run_idle()
+    assert frame.names() == ["Desk", "Rug"]